@@ -0,0 +1,366 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from db import Database
+from query_compiler import encode_page_token, keyset_sort
+from seeder import run_generator
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+
+Case = Callable[[Database, Dict[str, Any]], Callable[[int], Any]]
+
+
+# ======================
+# Mesure
+# ======================
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def measure(fn: Callable[[int], Any], iterations: int, warmup: int) -> Dict[str, float]:
+    for i in range(warmup):
+        fn(i)
+    lat: List[float] = []
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(warmup + i)
+        lat.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "n": iterations,
+        "p50_ms": percentile(lat, 0.50) * 1000,
+        "p95_ms": percentile(lat, 0.95) * 1000,
+        "p99_ms": percentile(lat, 0.99) * 1000,
+        "mean_ms": statistics.fmean(lat) * 1000,
+        "ops_per_s": iterations / elapsed if elapsed else 0.0,
+    }
+
+
+# ======================
+# Cas mesurés (un par méthode / scénario de tests.py)
+# ======================
+def _cycle(values: List[Any]) -> Callable[[int], Any]:
+    return lambda i: values[i % len(values)]
+
+
+def _scratch_pids(db: Database, count: int) -> List[str]:
+    """Documents jetables (non mesurés) pour les cas qui suppriment."""
+    return [r["pid"] for r in db.create_items("users", [{"name": f"bench {i}", "role": "bench"} for i in range(count)], created_by="bench")]
+
+
+def case_create_item(db, ctx):
+    return lambda i: db.create_item("users", {"name": f"bench {i}", "role": "bench"}, created_by="bench")
+
+
+def case_create_items_100(db, ctx):
+    return lambda i: db.create_items("users", [{"name": f"bench {i}.{j}", "role": "bench"} for j in range(100)], created_by="bench")
+
+
+def case_get_item_by_pid(db, ctx):
+    pid = _cycle(ctx["users"])
+    return lambda i: db.get_item_by_pid("users", pid(i), fields=[])
+
+
+def case_get_item_by_attr(db, ctx):
+    email = _cycle(ctx["emails"])
+    return lambda i: db.get_item_by_attr("users", {"email": email(i)}, fields=["name"])
+
+
+def case_update_item_by_pid(db, ctx):
+    pid = _cycle(ctx["users"])
+    return lambda i: db.update_item_by_pid("users", pid(i), {"bench": i}, updated_by="bench")
+
+
+def case_update_items_by_pids(db, ctx):
+    users = ctx["users"]
+    return lambda i: db.update_items_by_pids("users", [users[(i * 10 + j) % len(users)] for j in range(10)], {"bench": i}, updated_by="bench")
+
+
+def case_update_item_by_attr(db, ctx):
+    email = _cycle(ctx["emails"])
+    return lambda i: db.update_item_by_attr("users", {"email": email(i)}, {"bench": i}, updated_by="bench")
+
+
+def case_update_items_by_attr(db, ctx):
+    return lambda i: db.update_items_by_attr("users", {"role": "bench"}, {"bench": i}, updated_by="bench")
+
+
+def case_array_push_item_by_pid(db, ctx):
+    pid = _cycle(ctx["teams"])
+    return lambda i: db.array_push_item_by_pid("teams", pid(i), "members", f"bench-{i}", updated_by="bench")
+
+
+def case_array_pull_item_by_pid(db, ctx):
+    pid = _cycle(ctx["teams"])
+    return lambda i: db.array_pull_item_by_pid("teams", pid(i), "members", f"bench-{i}", updated_by="bench")
+
+
+def case_array_push_item_by_attr(db, ctx):
+    pid = _cycle(ctx["projects"])
+    return lambda i: db.array_push_item_by_attr("projects", {"pid": pid(i)}, "tags", "bench", updated_by="bench")
+
+
+def case_array_pull_item_by_attr(db, ctx):
+    pid = _cycle(ctx["projects"])
+    return lambda i: db.array_pull_item_by_attr("projects", {"pid": pid(i)}, "tags", "bench", updated_by="bench")
+
+
+def case_delete_item_by_pid(db, ctx):
+    pids = _scratch_pids(db, ctx["iterations"] + ctx["warmup"])
+    return lambda i: db.delete_item_by_pid("users", pids[i])
+
+
+def case_delete_items_by_pids(db, ctx):
+    pids = _scratch_pids(db, (ctx["iterations"] + ctx["warmup"]) * 10)
+    return lambda i: db.delete_items_by_pids("users", pids[i * 10:(i + 1) * 10])
+
+
+def case_delete_item_by_attr(db, ctx):
+    pids = _scratch_pids(db, ctx["iterations"] + ctx["warmup"])
+    return lambda i: db.delete_item_by_attr("users", {"pid": pids[i]})
+
+
+def case_delete_items_by_attr(db, ctx):
+    return lambda i: db.delete_items_by_attr("users", {"role": "bench", "name": f"bench {i}"})
+
+
+def case_get_items_page1(db, ctx):
+    return lambda i: db.get_items("projects", {}, fields=["name", "deadline"], sort={"deadline": 1}, limit=50)
+
+
+def case_get_items_stats(db, ctx):
+    return lambda i: db.get_items("projects", {"tags": "urgent"}, fields=["name"], sort={"deadline": 1}, limit=50, return_stats=True)
+
+
+def case_projects_of_user(db, ctx):
+    """Scénario "projets d'un user" de tests.py ($lookup teams + filtre sur members)."""
+    user = _cycle(ctx["members"])
+    return lambda i: db.get_items(
+        "projects",
+        {},
+        fields=["name", "deadline", "teams", "tags", "budget"],
+        sort={"deadline": 1},
+        limit=50,
+        return_stats=True,
+        pipeline=[
+            {"$lookup": {"from": "teams", "localField": "teams", "foreignField": "pid", "as": "teams_info"}},
+            {"$match": {"teams_info.members": {"$in": [user(i)]}}},
+        ],
+    )
+
+
+def case_projects_of_user_cached(db, ctx):
+    """Même scénario avec le cache de get_items (aucune écriture entre les appels: hits après un tour)."""
+    cached = Database(query_cache_bytes=64 * 1024 * 1024)
+    return case_projects_of_user(cached, ctx)
+
+
+def case_lookup_members(db, ctx):
+    """Page de projets avec teams et members résolus par $lookup (par document, côté serveur)."""
+    return lambda i: db.get_items(
+        "projects",
+        {},
+        fields=["name", "teams_info.name", "teams_info.members_info.name"],
+        sort={"deadline": 1},
+        limit=50,
+        pipeline=[
+            {"$lookup": {
+                "from": "teams",
+                "localField": "teams",
+                "foreignField": "pid",
+                "as": "teams_info",
+                "pipeline": [
+                    {"$lookup": {"from": "users", "localField": "members", "foreignField": "pid", "as": "members_info"}},
+                ],
+            }},
+        ],
+    )
+
+
+def case_expand_members(db, ctx):
+    """Même page avec expand=: une requête $in par niveau."""
+    return lambda i: db.get_items(
+        "projects",
+        {},
+        fields=["name"],
+        sort={"deadline": 1},
+        limit=50,
+        expand=["teams.members"],
+        expand_fields={"teams": ["name"], "teams.members": ["name"]},
+    )
+
+
+TAGS_PIPELINE = [
+    {"$unwind": "$tags"},
+    {"$group": {"_id": "$tags", "count": {"$sum": 1}, "avgBudget": {"$avg": "$budget"}}},
+    {"$sort": {"count": -1}},
+]
+
+
+def case_tags_single(db, ctx):
+    """Nombre de projets et budget moyen par tag, en une agrégation."""
+    return lambda i: db.parallel_aggregate("projects", TAGS_PIPELINE, partitions=1)
+
+
+def case_tags_parallel(db, ctx):
+    """Même agrégation découpée en 4 intervalles de _id, partiels fusionnés."""
+    return lambda i: db.parallel_aggregate("projects", TAGS_PIPELINE, partitions=4)
+
+
+def case_deep_page_skip(db, ctx):
+    skip = max(0, ctx["scale"] - 50)
+    return lambda i: db.get_items("projects", {}, fields=["name", "deadline"], sort={"deadline": 1, "pid": 1}, skip=skip, limit=50)
+
+
+def case_deep_page_keyset(db, ctx):
+    sort_keys = keyset_sort({"deadline": 1})
+    skip = max(0, ctx["scale"] - 51)
+    last = db.get_items("projects", {}, fields=["deadline"], sort=dict(sort_keys), skip=skip, limit=1)
+    token = encode_page_token(sort_keys, last[0]) if last else None
+    return lambda i: db.get_items_page("projects", {}, sort={"deadline": 1}, page_size=50, after=token, fields=["name"])
+
+
+CASES: List[Tuple[str, Case]] = [
+    ("create_item", case_create_item),
+    ("create_items[100]", case_create_items_100),
+    ("get_item_by_pid", case_get_item_by_pid),
+    ("get_item_by_attr", case_get_item_by_attr),
+    ("update_item_by_pid", case_update_item_by_pid),
+    ("update_items_by_pids[10]", case_update_items_by_pids),
+    ("update_item_by_attr", case_update_item_by_attr),
+    ("update_items_by_attr", case_update_items_by_attr),
+    ("array_push_item_by_pid", case_array_push_item_by_pid),
+    ("array_pull_item_by_pid", case_array_pull_item_by_pid),
+    ("array_push_item_by_attr", case_array_push_item_by_attr),
+    ("array_pull_item_by_attr", case_array_pull_item_by_attr),
+    ("delete_item_by_pid", case_delete_item_by_pid),
+    ("delete_items_by_pids[10]", case_delete_items_by_pids),
+    ("delete_item_by_attr", case_delete_item_by_attr),
+    ("delete_items_by_attr", case_delete_items_by_attr),
+    ("get_items[page1]", case_get_items_page1),
+    ("get_items[stats]", case_get_items_stats),
+    ("get_items[projects_of_user]", case_projects_of_user),
+    ("get_items[cached_projects]", case_projects_of_user_cached),
+    ("get_items[lookup_members]", case_lookup_members),
+    ("get_items[expand_members]", case_expand_members),
+    ("parallel_aggregate[tags x1]", case_tags_single),
+    ("parallel_aggregate[tags x4]", case_tags_parallel),
+    ("get_items[deep_skip]", case_deep_page_skip),
+    ("get_items_page[deep_keyset]", case_deep_page_keyset),
+]
+
+
+# ======================
+# Exécution
+# ======================
+def _sample(db: Database, table: str, fields: Optional[List[str]], size: int) -> List[Dict[str, Any]]:
+    return db.get_items(table, {}, fields=fields, pipeline=[{"$sample": {"size": size}}])
+
+
+def build_context(db: Database, scale: int, iterations: int, warmup: int, seed: int) -> Dict[str, Any]:
+    users = _sample(db, "users", ["email"], 1000)
+    teams = _sample(db, "teams", ["members"], 1000)
+    rng = random.Random(seed)
+    members = [m for t in teams for m in t.get("members", [])]
+    return {
+        "scale": scale,
+        "iterations": iterations,
+        "warmup": warmup,
+        "users": [u["pid"] for u in users],
+        "emails": [u["email"] for u in users if "email" in u],
+        "teams": [t["pid"] for t in teams],
+        "projects": [p["pid"] for p in _sample(db, "projects", None, 1000)],
+        "members": rng.sample(members, min(len(members), 200)) or [u["pid"] for u in users],
+    }
+
+
+def run_scale(scale: int, iterations: int, warmup: int, seed: int, workers: Optional[int], only: Optional[List[str]]) -> Dict[str, Any]:
+    print(f"\n=== {scale:,} documents par collection ===")
+    load = run_generator(scale, scale, scale, seed=seed, workers=workers)
+    db = Database()
+    ctx = build_context(db, scale, iterations, warmup, seed)
+    results: Dict[str, Any] = {"load": load, "methods": {}}
+    for name, case in CASES:
+        if only and name not in only:
+            continue
+        fn = case(db, ctx)
+        stats = measure(fn, iterations, warmup)
+        results["methods"][name] = stats
+        print(f"  {name:<30} p50={stats['p50_ms']:8.2f}ms  p95={stats['p95_ms']:8.2f}ms  p99={stats['p99_ms']:8.2f}ms  {stats['ops_per_s']:>9.0f} ops/s")
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, metric: str = "p50_ms") -> List[Dict[str, Any]]:
+    """Méthodes dont metric a augmenté de plus de threshold (0.2 = +20%) par rapport à baseline."""
+    regressions = []
+    for scale, res in current["results"].items():
+        base = baseline.get("results", {}).get(scale)
+        if not base:
+            continue
+        for name, stats in res["methods"].items():
+            old = base["methods"].get(name)
+            if not old or not old[metric]:
+                continue
+            ratio = stats[metric] / old[metric]
+            if ratio > 1 + threshold:
+                regressions.append({"scale": scale, "method": name, "metric": metric, "before": old[metric], "after": stats[metric], "ratio": ratio})
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark des méthodes de Database sur un mongod local.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--only", nargs="*", help="Noms des cas à lancer (voir CASES)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON d'un run précédent à comparer")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+    for scale in args.scales:
+        report["results"][str(scale)] = run_scale(scale, args.iterations, args.warmup, args.seed, args.workers, args.only)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRésultats: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"⚠️  {r['scale']} {r['method']}: {r['metric']} {r['before']:.2f} -> {r['after']:.2f} (x{r['ratio']:.2f})")
+        if regressions:
+            return 1
+        print("Aucune régression.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
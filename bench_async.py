@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from db import Database
+from db_async import AsyncDatabase
+
+
+def summarize(label: str, latencies: List[float], elapsed: float) -> None:
+    lat = sorted(latencies)
+    p95 = lat[int(len(lat) * 0.95) - 1] if len(lat) > 1 else lat[0]
+    print(
+        f"{label:<22} {len(lat) / elapsed:>10.0f} req/s   "
+        f"p50={statistics.median(lat) * 1000:.2f}ms  p95={p95 * 1000:.2f}ms  total={elapsed:.2f}s"
+    )
+
+
+def timed(fn: Callable[[], object], latencies: List[float]) -> None:
+    t0 = time.perf_counter()
+    fn()
+    latencies.append(time.perf_counter() - t0)
+
+
+def bench_sync_sequential(db: Database, pids: List[str]) -> None:
+    latencies: List[float] = []
+    t0 = time.perf_counter()
+    for pid in pids:
+        timed(lambda: db.get_item_by_pid("users", pid, fields=[]), latencies)
+    summarize("sync séquentiel", latencies, time.perf_counter() - t0)
+
+
+def bench_sync_threads(db: Database, pids: List[str], workers: int) -> None:
+    latencies: List[float] = []
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda pid: timed(lambda: db.get_item_by_pid("users", pid, fields=[]), latencies), pids))
+    summarize(f"sync threads x{workers}", latencies, time.perf_counter() - t0)
+
+
+async def bench_async(adb: AsyncDatabase, pids: List[str], concurrency: int) -> None:
+    latencies: List[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(pid: str) -> None:
+        async with sem:
+            t = time.perf_counter()
+            await adb.get_item_by_pid("users", pid, fields=[])
+            latencies.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(pid) for pid in pids))
+    summarize(f"async gather x{concurrency}", latencies, time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="N get_item_by_pid concurrents: Database vs AsyncDatabase")
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    db = Database()
+    pids = [d["pid"] for d in db.get_items("users", {}, fields=None, limit=args.requests)]
+    if not pids:
+        raise SystemExit("Aucun user: lancer seeder.py d'abord.")
+    pids = (pids * (args.requests // len(pids) + 1))[: args.requests]
+
+    bench_sync_sequential(db, pids)
+    bench_sync_threads(db, pids, args.concurrency)
+
+    async def run_async() -> None:
+        async with AsyncDatabase() as adb:
+            await bench_async(adb, pids, args.concurrency)
+
+    asyncio.run(run_async())
+
+
+if __name__ == "__main__":
+    main()
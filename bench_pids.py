@@ -0,0 +1,61 @@
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from db import Database
+from pids import PID_STRATEGIES
+
+
+def make_items(n: int) -> List[Dict[str, Any]]:
+    return [{"name": f"item {i}", "tags": ["bench"], "budget": i % 1000} for i in range(n)]
+
+
+def run(strategy: str, count: int, batch: int) -> Dict[str, Any]:
+    """Insère count documents par lots de batch dans pidbench_<strategy>, puis mesure l'index pid."""
+    db = Database(pid_strategy=strategy)
+    table = f"pidbench_{strategy}"
+    db.drop_table(table)
+    db.declare_table(table)
+
+    items = make_items(batch)
+    t0 = time.perf_counter()
+    for _ in range(count // batch):
+        db.create_items(table, items)
+    elapsed = time.perf_counter() - t0
+
+    stats = db._db.command("collStats", table)
+    db.drop_table(table)
+    inserted = count // batch * batch
+    return {
+        "inserted": inserted,
+        "docsPerSecond": inserted / elapsed if elapsed else 0,
+        "pidIndexBytes": stats.get("indexSizes", {}).get("pid_1", 0),
+        "totalIndexBytes": stats.get("totalIndexSize", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Débit d'insertion et taille de l'index pid par stratégie de pid.")
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--strategy", nargs="*", default=list(PID_STRATEGIES), choices=PID_STRATEGIES)
+    parser.add_argument("--output", help="Écrit les résultats en JSON")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for strategy in args.strategy:
+        r = results[strategy] = run(strategy, args.count, args.batch)
+        print(
+            f"{strategy:<6} {r['docsPerSecond']:>12,.0f} docs/s   "
+            f"index pid {r['pidIndexBytes'] / 1024 / 1024:8.2f} MiB   "
+            f"index total {r['totalIndexBytes'] / 1024 / 1024:8.2f} MiB"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
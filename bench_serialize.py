@@ -0,0 +1,76 @@
+import argparse
+import io
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import bson
+
+from db import Database
+from serializer import JSON_CODEC_OPTIONS, write_ndjson
+from tests import clean_doc
+
+# Champs d'une page de projets type API
+FIELDS = ["name", "teams", "tags", "budget", "deadline", "created_at", "updated_at"]
+
+
+def measure(fn: Callable[[], object], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def report(label: str, samples: List[float], docs: int) -> Dict[str, float]:
+    p50 = statistics.median(samples)
+    print(f"{label:<34} p50={p50 * 1000:9.2f}ms   {docs / p50 if p50 else 0:>12,.0f} docs/s")
+    return {"p50Ms": p50 * 1000, "docsPerSecond": docs / p50 if p50 else 0}
+
+
+def dict_clean_doc(db: Database, limit: int) -> str:
+    """Chemin actuel: dicts décodés par pymongo, clean_doc, puis json.dumps de la page."""
+    items = db.get_items("projects", {}, fields=FIELDS, sort={"deadline": 1}, limit=limit)
+    return json.dumps(clean_doc(items))
+
+
+def raw_ndjson(db: Database, limit: int) -> str:
+    """raw=True: RawBSONDocument puis écriture NDJSON directe."""
+    items = db.get_items("projects", {}, fields=FIELDS, sort={"deadline": 1}, limit=limit, raw=True)
+    out = io.StringIO()
+    write_ndjson(items, out)
+    return out.getvalue()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Page de projets en JSON: dicts + clean_doc vs raw=True + serializer.")
+    parser.add_argument("--limit", type=int, nargs="*", default=[100, 1000, 10_000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", help="Écrit les résultats en JSON")
+    args = parser.parse_args()
+
+    db = Database()
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for limit in args.limit:
+        docs = len(db.get_items("projects", {}, limit=limit))
+        print(f"\n== page de {docs} projets ==")
+        raw_items = db.get_items("projects", {}, fields=FIELDS, sort={"deadline": 1}, limit=limit, raw=True)
+        dict_items = [bson.decode(d.raw, JSON_CODEC_OPTIONS) for d in raw_items]
+        results[str(limit)] = {
+            # Requête + sérialisation
+            "dict+clean_doc": report("requête + dict + clean_doc", measure(lambda: dict_clean_doc(db, limit), args.iterations), docs),
+            "raw+ndjson": report("requête + raw + write_ndjson", measure(lambda: raw_ndjson(db, limit), args.iterations), docs),
+            # Sérialisation seule (documents déjà reçus)
+            "clean_doc_only": report("clean_doc + json.dumps", measure(lambda: json.dumps(clean_doc(dict_items)), args.iterations), docs),
+            "ndjson_only": report("write_ndjson (raw)", measure(lambda: write_ndjson(raw_items, io.StringIO()), args.iterations), docs),
+        }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+# Chaque mesure tourne dans un interpréteur neuf (import à froid)
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import db
+print(time.perf_counter() - t0)
+"""
+
+FIRST_QUERY_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import db
+d = db.Database(warm={warm})
+t1 = time.perf_counter()
+d.get_item_by_attr("users", {{}}, fields=None)
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1, t2 - t0)
+"""
+
+MANY_INSTANCES_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import db
+for _ in range({instances}):
+    db.Database().get_item_by_attr("users", {{}}, fields=None)
+print(time.perf_counter() - t0, len(db._CLIENTS))
+"""
+
+
+def run(snippet: str) -> List[float]:
+    out = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True).stdout
+    return [float(x) for x in out.split()]
+
+
+def median_ms(samples: List[List[float]], i: int) -> float:
+    return statistics.median(s[i] for s in samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Temps d'import de db.py et du démarrage à froid jusqu'à la 1re requête.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--instances", type=int, default=10)
+    parser.add_argument("--output", help="Écrit les résultats en JSON")
+    args = parser.parse_args()
+
+    results: Dict[str, float] = {}
+
+    imports = [run(IMPORT_SNIPPET) for _ in range(args.runs)]
+    results["import_ms"] = median_ms(imports, 0)
+
+    for warm in (False, True):
+        samples = [run(FIRST_QUERY_SNIPPET.format(warm=warm)) for _ in range(args.runs)]
+        label = "warm" if warm else "lazy"
+        results[f"{label}_init_ms"] = median_ms(samples, 0)
+        results[f"{label}_first_query_ms"] = median_ms(samples, 1)
+        results[f"{label}_cold_start_to_first_query_ms"] = median_ms(samples, 2)
+
+    many = [run(MANY_INSTANCES_SNIPPET.format(instances=args.instances)) for _ in range(args.runs)]
+    results[f"{args.instances}_instances_first_query_ms"] = median_ms(many, 0)
+    results["clients_for_instances"] = many[0][1]
+
+    for k, v in results.items():
+        print(f"{k:<40} {v:10.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+from typing import Any, Tuple
+
+from bson import ObjectId
+
+# Valeur absente d'un document: triée comme null
+MISSING = object()
+
+
+def bson_order(value: Any) -> Tuple[Any, ...]:
+    """Clé de tri selon l'ordre BSON des types (null < nombres < chaînes < objets < tableaux...)."""
+    if value is None or value is MISSING:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, tuple((k, bson_order(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return (5, tuple(bson_order(v) for v in value))
+    if isinstance(value, bytes):
+        return (6, (len(value), getattr(value, "subtype", 0), bytes(value)))
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        return (9, value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value)
+    return (10, str(value))
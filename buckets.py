@@ -0,0 +1,173 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+import bson
+from pymongo import ASCENDING, DESCENDING
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+if TYPE_CHECKING:
+    from db import Database
+
+DEFAULT_BUCKET_SIZE = 1000
+
+
+def _key(value: Any) -> Any:
+    """Clé hachable d'un élément (documents et listes comparés par leur BSON)."""
+    return bson.encode({"v": value}) if isinstance(value, (dict, list)) else value
+
+
+class BucketStore:
+    """
+    Tableaux en buckets: les éléments de table.array ne sont plus dans le document
+    mais dans une collection <table>_<array>_buckets, par paquets d'au plus bucket_size:
+        {"owner": <pid>, "n": <numéro>, "count": <nb d'éléments>, "items": [...]}
+    Index: (owner, n) unique, (owner, items) pour le test d'appartenance d'un
+    ajout, (items) pour retrouver les documents qui contiennent une valeur.
+    Les éléments sont uniques par owner (comme $addToSet); l'ordre de lecture est
+    celui des buckets puis des ajouts.
+    """
+
+    def __init__(self, db: "Database"):
+        self._db = db
+        self.arrays: Dict[Tuple[str, str], int] = {}
+        self._indexed: set = set()
+
+    def declare(self, table: str, array: str, bucket_size: int = DEFAULT_BUCKET_SIZE) -> None:
+        if "." in array:
+            raise ValueError("Seuls les tableaux de premier niveau peuvent être mis en buckets.")
+        if bucket_size < 1:
+            raise ValueError("bucket_size doit être >= 1")
+        self.arrays[(table, array)] = bucket_size
+
+    def has(self, table: str, array: str) -> bool:
+        return (table, array) in self.arrays
+
+    def for_table(self, table: str, fields: Optional[List[str]] = None) -> List[str]:
+        """Tableaux en buckets de la table demandés par fields (None: aucun, []: tous)."""
+        if fields is None:
+            return []
+        roots = {f.split(".", 1)[0] for f in fields}
+        return [a for t, a in self.arrays if t == table and (not fields or a in roots)]
+
+    def col(self, table: str, array: str) -> Collection:
+        name = f"{table}_{array}_buckets"
+        col = self._db._db[name]
+        if name not in self._indexed:
+            col.create_index([("owner", ASCENDING), ("n", ASCENDING)], unique=True)
+            col.create_index([("owner", ASCENDING), ("items", ASCENDING)])
+            col.create_index([("items", ASCENDING)])
+            self._indexed.add(name)
+        return col
+
+    # -------- Écritures
+    def push(self, table: str, array: str, pid: str, new_item: Any) -> int:
+        """Ajoute new_item (valeur ou {"$each": [...]}) s'il est absent. Retourne le nombre d'éléments ajoutés."""
+        col, size = self.col(table, array), self.arrays[(table, array)]
+        owner = self._db._pids.encode(pid)
+        values = new_item["$each"] if isinstance(new_item, dict) and "$each" in new_item else [new_item]
+        values = [self._db._encode_ref(table, array, v) for v in values]
+
+        added = 0
+        fresh = self._absent(col, owner, values)
+        while fresh:
+            # Premier bucket non plein (ordre fixe: deux ajouts concurrents visent le même)
+            bucket = col.find_one({"owner": owner, "count": {"$lt": size}}, {"count": 1}, sort=[("n", ASCENDING)])
+            if bucket is not None:
+                chunk = fresh[: size - bucket["count"]]
+                # count sert de verrou optimiste: un ajout concurrent fait échouer ce remplissage
+                res = col.update_one(
+                    {"_id": bucket["_id"], "count": bucket["count"], "items": {"$nin": chunk}},
+                    {"$push": {"items": {"$each": chunk}}, "$inc": {"count": len(chunk)}},
+                )
+                written = res.modified_count > 0
+            else:
+                last = col.find_one({"owner": owner}, {"n": 1}, sort=[("n", DESCENDING)])
+                chunk = fresh[:size]
+                try:
+                    col.insert_one({"owner": owner, "n": last["n"] + 1 if last else 0, "count": len(chunk), "items": chunk})
+                    written = True
+                except DuplicateKeyError:
+                    written = False
+            if not written:
+                # L'ajout concurrent a pu insérer les mêmes valeurs: nouveau dédoublonnage
+                fresh = self._absent(col, owner, fresh)
+                continue
+            added += len(chunk)
+            fresh = fresh[len(chunk):]
+        if added:
+            self._db._bump(col.name)
+        return added
+
+    @staticmethod
+    def _absent(col: Collection, owner: Any, values: List[Any]) -> List[Any]:
+        """values sans doublons ni éléments déjà présents: une seule requête (index (owner, items))."""
+        if not values:
+            return []
+        cursor = col.find({"owner": owner, "items": {"$in": values}}, {"items": 1, "_id": 0})
+        seen = {_key(v) for b in cursor for v in b["items"]}
+        fresh: List[Any] = []
+        for v in values:
+            k = _key(v)
+            if k not in seen:
+                seen.add(k)
+                fresh.append(v)
+        return fresh
+
+    def pull(self, table: str, array: str, pid: str, item_attr: Any) -> int:
+        """Retire les éléments égaux à item_attr (ou qui vérifient la condition, comme $pull)."""
+        col = self.col(table, array)
+        owner = self._db._pids.encode(pid)
+        cond = self._db._encode_ref(table, array, item_attr)
+        if isinstance(cond, dict) and not any(k.startswith("$") for k in cond):
+            match: Any = {"$elemMatch": cond}
+        else:
+            match = cond
+        ids = [b["_id"] for b in col.find({"owner": owner, "items": match}, {"_id": 1})]
+        if not ids:
+            return 0
+        before = sum(b["count"] for b in col.find({"_id": {"$in": ids}}, {"count": 1}))
+        col.update_many({"_id": {"$in": ids}}, {"$pull": {"items": cond}})
+        col.update_many({"_id": {"$in": ids}}, [{"$set": {"count": {"$size": "$items"}}}])
+        after = sum(b["count"] for b in col.find({"_id": {"$in": ids}}, {"count": 1}))
+        col.delete_many({"_id": {"$in": ids}, "count": 0})
+        self._db._bump(col.name)
+        return before - after
+
+    def deleted(self, table: str, pids: List[str]) -> None:
+        owners = self._db._pids.encode_pids(pids)
+        for t, array in self.arrays:
+            if t == table and owners:
+                self.col(t, array).delete_many({"owner": {"$in": owners}})
+                self._db._bump(f"{t}_{array}_buckets")
+
+    def drop_table(self, table: str) -> None:
+        for t, array in self.arrays:
+            if t == table:
+                name = f"{t}_{array}_buckets"
+                self._db._db.drop_collection(name)
+                self._indexed.discard(name)
+                self._db._bump(name)
+
+    # -------- Lecture
+    def iter(self, table: str, array: str, pid: str) -> Iterator[Any]:
+        """Éléments dans l'ordre, un bucket à la fois."""
+        cursor = self.col(table, array).find({"owner": self._db._pids.encode(pid)}, {"items": 1, "_id": 0}).sort("n", ASCENDING)
+        for bucket in cursor:
+            yield from bucket["items"]
+
+    def owners(self, table: str, array: str, item: Any) -> List[str]:
+        """pids des documents dont le tableau contient item (index (items))."""
+        return self.col(table, array).distinct("owner", {"items": self._db._encode_ref(table, array, item)})
+
+    # -------- Migration
+    def migrate(self, table: str, array: str, batch_size: int = 100) -> int:
+        """Déplace les éléments encore embarqués dans les documents vers les buckets. Retourne le nombre de documents."""
+        source = self._db._store_db[table]
+        moved = 0
+        cursor = source.find({array: {"$exists": True, "$type": "array"}}, {"pid": 1, array: 1}, batch_size=batch_size)
+        for doc in cursor:
+            if doc[array]:
+                self.push(table, array, self._db._pids.to_api(doc["pid"]), {"$each": doc[array]})
+            source.update_one({"_id": doc["_id"]}, {"$unset": {array: ""}})
+            moved += 1
+        return moved
@@ -0,0 +1,247 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Union
+
+import bson
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+if TYPE_CHECKING:
+    from db import Database
+
+WriteOp = Union[InsertOne, UpdateOne, UpdateMany]
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending(NamedTuple):
+    n: int
+    table: str
+    op: WriteOp
+    pid: Optional[str]
+    size: int
+    # Filtre des UpdateMany (documents visés, pour les index dérivés)
+    many_filter: Optional[Dict[str, Any]] = None
+    # Mise à jour des UpdateOne/UpdateMany (rejouée sur l'archive d'une table archivée)
+    update: Optional[Dict[str, Any]] = None
+
+
+class BulkWriter:
+    """
+    File d'écritures regroupées en bulk_write(ordered=False), une requête par table.
+        with db.bulk(max_ops=1000) as bw:
+            op = bw.create_item("users", {"name": "Eve"}, created_by="loader")
+            bw.array_push_item_by_pid("teams", team_pid, "members", bw.pid(op))
+        bw.results[op]  # {"ok": True, "pid": "...", ...}
+    Chaque méthode retourne un numéro d'opération; le résultat (pid généré, erreur
+    éventuelle) est dans results[numéro] après le flush. Un update par pid sans
+    document correspondant, ni dans la table ni dans son archive (declare_tiering),
+    a ok=False (matched=False). Le flush a lieu quand max_ops ou max_bytes est
+    atteint, max_interval secondes après la 1re opération en file (minuterie), et à
+    la sortie du bloc with.
+    Une erreur sur une opération n'empêche pas les autres de s'appliquer. Si
+    bulk_write échoue entièrement (réseau...), les opérations non confirmées sont
+    remises en file et l'erreur est levée (journalisée si le flush vient de la minuterie).
+    Thread-safe.
+    """
+
+    def __init__(self, db: "Database", max_ops: int = 1000, max_bytes: int = 8 * 1024 * 1024, max_interval: Optional[float] = 1.0):
+        self._db = db
+        self.max_ops = max_ops
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+        self._pending: List[_Pending] = []
+        self._pending_bytes = 0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        self._next_op = 0
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self.flushes = 0
+
+    def __enter__(self) -> "BulkWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        try:
+            self.flush()
+        finally:
+            self._cancel_timer()
+
+    # -------- Opérations
+    def create_item(self, table: str, item: Dict[str, Any], created_by: Optional[str] = None) -> int:
+        for field in item:
+            self._check_not_bucketed(table, field)
+        doc = self._db._with_audit_on_create(self._db._encode_data(table, item), created_by)
+        return self._add(table, InsertOne(doc), self._db._pids.to_api(doc["pid"]), doc)
+
+    def create_items(self, table: str, items: List[Dict[str, Any]], created_by: Optional[str] = None) -> List[int]:
+        return [self.create_item(table, it, created_by) for it in items]
+
+    def update_item_by_pid(self, table: str, pid: str, item_data: Dict[str, Any], updated_by: Optional[str] = None) -> int:
+        for field in item_data:
+            self._check_not_bucketed(table, field)
+        update = self._db._with_audit_on_update(self._db._encode_data(table, item_data), updated_by)
+        return self._add(table, UpdateOne({"pid": self._db._pids.encode(pid)}, update), pid, update)
+
+    def update_items_by_attr(self, table: str, attributes: Dict[str, Any], items_data: Dict[str, Any], updated_by: Optional[str] = None) -> int:
+        for field in items_data:
+            self._check_not_bucketed(table, field)
+        update = self._db._with_audit_on_update(self._db._encode_data(table, items_data), updated_by)
+        flt = self._db._encode_filter(table, attributes)
+        return self._add(table, UpdateMany(flt, update), None, update, many_filter=flt)
+
+    def array_push_item_by_pid(self, table: str, pid: str, array: str, new_item: Any, updated_by: Optional[str] = None) -> int:
+        self._check_not_bucketed(table, array)
+        update = {"$addToSet": {array: self._db._encode_ref(table, array, new_item)}, **self._db._with_audit_on_update({}, updated_by)}
+        return self._add(table, UpdateOne({"pid": self._db._pids.encode(pid)}, update), pid, update)
+
+    def array_pull_item_by_pid(self, table: str, pid: str, array: str, item_attr: Any, updated_by: Optional[str] = None) -> int:
+        self._check_not_bucketed(table, array)
+        update = {"$pull": {array: self._db._encode_ref(table, array, item_attr)}, **self._db._with_audit_on_update({}, updated_by)}
+        return self._add(table, UpdateOne({"pid": self._db._pids.encode(pid)}, update), pid, update)
+
+    def _check_not_bucketed(self, table: str, array: str) -> None:
+        if self._db._buckets.has(table, array.split(".", 1)[0]):
+            raise ValueError(f"{table}.{array} est en buckets, non pris en charge par BulkWriter (passer par Database).")
+
+    def pid(self, op: int) -> Optional[str]:
+        """pid concerné par l'opération (généré côté client pour les créations)."""
+        if op in self.results:
+            return self.results[op]["pid"]
+        with self._lock:
+            return next((p.pid for p in self._pending if p.n == op), None)
+
+    # -------- Flush
+    def _add(
+        self, table: str, op: WriteOp, pid: Optional[str], payload: Dict[str, Any], many_filter: Optional[Dict[str, Any]] = None
+    ) -> int:
+        with self._lock:
+            n = self._next_op
+            self._next_op += 1
+            size = len(bson.encode(payload))
+            update = None if isinstance(op, InsertOne) else payload
+            self._pending.append(_Pending(n, table, op, pid, size, many_filter, update))
+            self._pending_bytes += size
+            if len(self._pending) >= self.max_ops or self._pending_bytes >= self.max_bytes:
+                self.flush()
+            elif len(self._pending) == 1:
+                self._arm_timer()
+            return n
+
+    def _arm_timer(self) -> None:
+        if self.max_interval is None or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.max_interval, self._flush_on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _flush_on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            try:
+                self.flush()
+            except Exception:
+                # Opérations remises en file par flush: nouvel essai au prochain intervalle
+                logger.exception("Flush de BulkWriter échoué (%d opérations en attente)", len(self._pending))
+
+    def flush(self) -> Dict[int, Dict[str, Any]]:
+        """Envoie les opérations en attente. Retourne les résultats de ce flush."""
+        with self._lock:
+            self._cancel_timer()
+            pending, self._pending = self._pending, []
+            self._pending_bytes = 0
+            if not pending:
+                return {}
+
+            by_table: Dict[str, List[_Pending]] = {}
+            for p in pending:
+                by_table.setdefault(p.table, []).append(p)
+
+            flushed: Dict[int, Dict[str, Any]] = {}
+            tables = list(by_table)
+            for i, table in enumerate(tables):
+                try:
+                    flushed.update(self._flush_table(table, by_table[table]))
+                except Exception:
+                    # Non confirmées: cette table et les suivantes, remises en tête de file
+                    requeue = [p for t in tables[i:] for p in by_table[t]]
+                    self._pending = requeue + self._pending
+                    self._pending_bytes = sum(p.size for p in self._pending)
+                    self.results.update(flushed)
+                    self._arm_timer()
+                    raise
+
+            self.results.update(flushed)
+            self.flushes += 1
+            return flushed
+
+    def _flush_table(self, table: str, ops: List[_Pending]) -> Dict[int, Dict[str, Any]]:
+        db = self._db
+        touched = [p.pid for p in ops if p.pid is not None]
+        many = [p.many_filter for p in ops if p.many_filter is not None]
+        # Documents visés, lus avant l'écriture comme le fait Database: pids connus
+        # et filtres des UpdateMany (les créations n'ont pas encore d'image)
+        scope: Dict[str, Any] = {"pid": {"$in": db._pids.encode_pids(touched)}}
+        if many:
+            scope = {"$or": [scope, *many]}
+        before = db._rollup_before(table, scope)
+        synced = db._membership_pids(table, scope) if many else None
+
+        failed: Dict[int, Dict[str, Any]] = {}
+        n_matched = 0
+        try:
+            result = db.col(table, write=True).bulk_write([p.op for p in ops], ordered=False)
+            n_matched = result.matched_count
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                failed[err["index"]] = {"code": err.get("code"), "errmsg": err.get("errmsg")}
+            n_matched = e.details.get("nMatched", 0)
+        finally:
+            # Aussi après un échec: une partie des opérations a pu s'appliquer
+            pids = list(dict.fromkeys(touched + ([d["pid"] for d in before[1]] if before else []) + (synced or [])))
+            db._on_write(table, None if many else touched)
+            db._rollup_after(table, before, pids)
+            if db._membership is not None and db._membership.tracks(table) and pids:
+                # Les opérations groupées ne disent pas quels tableaux changent: resynchronisation
+                db._membership.resync(table, pids)
+
+        # Updates par pid sans document: n_matched ne dit pas lesquels, relecture des pids
+        updates = [(i, p) for i, p in enumerate(ops) if isinstance(p.op, UpdateOne) and i not in failed]
+        missing: set = set()
+        if updates and (many or n_matched < len(updates)):
+            wanted = db._pids.encode_pids([p.pid for _, p in updates])
+            found = {d["pid"] for d in db.col(table).find({"pid": {"$in": wanted}}, {"pid": 1, "_id": 0})}
+            missing = {i for i, p in updates if p.pid not in found}
+        if table in db._tiers.policies:
+            # Comme Database: les updates s'appliquent aussi aux documents archivés
+            for i in sorted(missing):
+                if db._archive_write(table, "update_one", {"pid": db._pids.encode(ops[i].pid)}, ops[i].update):
+                    missing.discard(i)
+            for p in ops:
+                if isinstance(p.op, UpdateMany):
+                    db._archive_write(table, "update_many", p.many_filter, p.update)
+
+        flushed: Dict[int, Dict[str, Any]] = {}
+        for i, p in enumerate(ops):
+            error = failed.get(i)
+            if i in missing:
+                error = {"code": None, "errmsg": "Aucun document avec ce pid."}
+            res = {
+                "table": table,
+                "op": type(p.op).__name__,
+                "pid": p.pid,
+                "ok": error is None,
+                "matched": (i not in missing and i not in failed) if isinstance(p.op, UpdateOne) else None,
+                "error": error,
+            }
+            flushed[p.n] = res
+            if error is not None:
+                self.errors.append({"opIndex": p.n, **res})
+        return flushed
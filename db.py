@@ -1,17 +1,160 @@
+import copy
+import logging
 import os
-import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple, Union
+import shutil
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple, Union
 
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient, ReturnDocument, UpdateOne
 from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+from pymongo.command_cursor import CommandCursor
 from pymongo.database import Database as _MongoDatabase
-from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+import bson
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
 
-load_dotenv()
+from buckets import DEFAULT_BUCKET_SIZE, BucketStore
+from bulk_writer import BulkWriter
+from entity_cache import EntityCache
+from expand import ExpandTree, collect_refs, parse_expand, stitch, with_expand_roots
+from membership import MembershipIndex
+from memory_engine import MemoryClient, apply_update
+from parallel_agg import merge_partials, plan_parallel
+from pids import PidCodec, convert_pid
+from query_cache import QueryCache
+from rollups import Rollup, RollupStore
+from tiering import TierStore, TieringPolicy, archive_name
+from observability import COMMAND_LISTENER, CallContext, Metrics, instrumented, map_in_context, note_plan, slow_entry, submit
+from query_compiler import (
+    QueryPlan,
+    compile_query as _compile_query,
+    decode_page_token,
+    encode_page_token,
+    keyset_filter,
+    keyset_sort,
+)
+from transfer import chunks, encode_doc, id_ranges, infer_format, iter_file, open_file, range_filter, related_path
 
-print("DEBUG MONGODB_URI =", os.getenv("MONGODB_URI"))
-print("DEBUG MONGODB_DB_NAME =", os.getenv("MONGODB_DB_NAME"))
+_ENV_LOADED = False
+
+logger = logging.getLogger(__name__)
+
+
+def _load_env() -> None:
+    """Charge .env une seule fois, au premier Database() (pas à l'import)."""
+    global _ENV_LOADED
+    if not _ENV_LOADED:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _ENV_LOADED = True
+
+
+# ======================
+# Clients partagés
+# ======================
+# Un MongoClient par (uri, options) et par processus: toutes les instances de
+# Database partagent son pool de connexions et ses threads de monitoring
+# (de même pour AsyncDatabase et son AsyncMongoClient).
+_CLIENTS: Dict[Tuple[str, bool, Tuple[Tuple[str, str], ...]], Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Instances ouvertes par (uri, base): une écriture d'AsyncDatabase invalide les caches
+# des instances de Database sur la même base et vérifie leurs index dérivés
+_INSTANCES: Dict[Tuple[str, str], "weakref.WeakSet[BaseDatabase]"] = {}
+
+# Options de pool réglables par Database(...) ou par variable d'environnement
+POOL_OPTIONS_ENV: Dict[str, Tuple[str, type]] = {
+    "maxPoolSize": ("MONGODB_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGODB_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGODB_MAX_IDLE_TIME_MS", int),
+    "compressors": ("MONGODB_COMPRESSORS", str),
+}
+
+
+# Moteur choisi par le schéma de l'URI: "memory://" sert les mêmes opérations en
+# mémoire (memory_engine.py), sans serveur. Un moteur tiers s'ajoute par register_backend.
+BACKENDS: Dict[str, Callable[..., Any]] = {
+    "mongodb": MongoClient,
+    "mongodb+srv": MongoClient,
+    "memory": MemoryClient,
+}
+
+# Moteurs d'AsyncDatabase (le moteur en mémoire n'a pas de version async)
+ASYNC_BACKENDS: Dict[str, Callable[..., Any]] = {
+    "mongodb": AsyncMongoClient,
+    "mongodb+srv": AsyncMongoClient,
+}
+
+
+def register_backend(scheme: str, factory: Callable[..., Any]) -> None:
+    """factory(uri, **options) doit retourner un objet à l'interface de MongoClient."""
+    BACKENDS[scheme] = factory
+
+
+def get_client(uri: str, asynchronous: bool = False, **options: Any) -> MongoClient:
+    """
+    Client partagé pour (uri, options). Créé avec connect=False: aucune connexion
+    n'est ouverte avant la première opération. asynchronous=True: AsyncMongoClient
+    (AsyncDatabase), lié à la boucle asyncio qui l'utilise en premier.
+    """
+    scheme = uri.split("://", 1)[0] if "://" in uri else "mongodb"
+    backends = ASYNC_BACKENDS if asynchronous else BACKENDS
+    factory = backends.get(scheme)
+    if factory is None:
+        raise ValueError(f"Schéma d'URI inconnu: {scheme} (connus: {', '.join(backends)})")
+    key = (uri, asynchronous, tuple(sorted((k, repr(v)) for k, v in options.items())))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = factory(uri, connect=False, event_listeners=[COMMAND_LISTENER], **options)
+            _CLIENTS[key] = client
+        return client
+
+
+def close_clients() -> None:
+    """Ferme tous les clients synchrones partagés du processus (les async: AsyncDatabase.close)."""
+    with _CLIENTS_LOCK:
+        keys = [key for key in _CLIENTS if not key[1]]
+        clients = [_CLIENTS.pop(key) for key in keys]
+    for client in clients:
+        client.close()
+
+
+def release_client(client: Any) -> None:
+    """Retire client du registre (avant de le fermer soi-même)."""
+    with _CLIENTS_LOCK:
+        for key in [k for k, c in _CLIENTS.items() if c is client]:
+            del _CLIENTS[key]
+
+
+def _reset_clients_after_fork() -> None:
+    # Un client hérité du parent (sockets, threads de monitoring) n'est pas
+    # utilisable dans l'enfant: on repart d'un registre vide, sans fermer ceux du parent.
+    global _CLIENTS_LOCK
+    _CLIENTS.clear()
+    _CLIENTS_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def _pool_options(**given: Any) -> Dict[str, Any]:
+    opts: Dict[str, Any] = {}
+    for name, (env, cast) in POOL_OPTIONS_ENV.items():
+        value = given.get(name)
+        if value is None and os.getenv(env):
+            value = cast(os.getenv(env))
+        if value is not None:
+            opts[name] = value
+    return opts
 
 
 def utcnow() -> datetime:
@@ -24,6 +167,7 @@ def _normalize_fields(fields: Optional[List[str]]) -> Optional[Dict[str, int]]:
       - fields is None -> ne retourner que pid
       - fields == []   -> tous les champs (=> projection None)
       - fields == ["xx","yy"] -> retourner pid, xx, yy
+    La projection s'applique en dernier, à la sortie du pipeline (voir compile_query).
     """
     if fields is None:
         return {"pid": 1}
@@ -35,80 +179,818 @@ def _normalize_fields(fields: Optional[List[str]]) -> Optional[Dict[str, int]]:
     return proj
 
 
-class Database:
+IndexKeys = Union[str, Dict[str, Any], List[Any]]
+
+# Index unique sur pid, posé sur toutes les collections gérées par Database
+PID_INDEX: Dict[str, Any] = {"key": [("pid", 1)], "name": "pid_1", "unique": True}
+
+# Index secondaires déclarés par défaut (filtres / $lookup utilisés dans tests.py)
+DEFAULT_INDEXES: Dict[str, List[IndexKeys]] = {
+    "users": ["email"],
+    "teams": ["members"],
+    "projects": [[("deadline", 1), ("pid", 1)], "tags", "teams"],
+}
+
+# Champs posés par _with_audit_on_create / _with_audit_on_update
+AUDIT_FIELDS = ("created_at", "updated_at", "created_by", "updated_by")
+
+# Champs contenant des pids d'une autre table (résolus par expand=): table -> {champ: table cible}
+DEFAULT_REFERENCES: Dict[str, Dict[str, str]] = {
+    "teams": {"members": "users"},
+    "projects": {"teams": "teams"},
+}
+
+
+def _normalize_index(keys: IndexKeys, **options: Any) -> Dict[str, Any]:
     """
-    Classe centrale des opérations MongoDB (avec pymongo + agrégations).
+    Normalise une déclaration d'index au format de index_information():
+      - "email"                         -> [("email", 1)]
+      - {"deadline": 1, "pid": 1}       -> [("deadline", 1), ("pid", 1)]
+      - ["tags", ("deadline", -1)]      -> [("tags", 1), ("deadline", -1)]
+    Le nom par défaut est celui que génère MongoDB ("deadline_1_pid_1").
     """
+    if isinstance(keys, str):
+        key = [(keys, 1)]
+    elif isinstance(keys, dict):
+        key = list(keys.items())
+    else:
+        key = [(k, 1) if isinstance(k, str) else (k[0], k[1]) for k in keys]
+    if not key:
+        raise ValueError("Index sans champ.")
+    name = options.pop("name", None) or "_".join(f"{f}_{d}" for f, d in key)
+    return {"key": key, "name": name, **options}
+
+
+def _index_options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Options comparables d'un index (sans key/name/v/ns)."""
+    opts = {k: v for k, v in spec.items() if k not in ("key", "name", "v", "ns")}
+    if not opts.get("unique"):
+        opts.pop("unique", None)
+    return opts
+
 
-    def __init__(self, uri: Optional[str] = None, db_name: Optional[str] = None, server_selection_timeout_ms: int = 5000):
+class BaseDatabase:
+    """
+    Partie commune à Database (pymongo) et AsyncDatabase (pymongo async):
+    configuration, registre d'index, audit, compilation des requêtes, stats.
+    Aucune méthode de cette classe ne fait d'entrée/sortie.
+    """
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        db_name: Optional[str] = None,
+        indexes: Optional[Dict[str, List[IndexKeys]]] = None,
+        auto_indexes: bool = True,
+        count_cache_ttl: float = 30.0,
+        count_cache_size: int = 1024,
+        pid_strategy: str = "uuid4",
+    ):
+        _load_env()
         self._uri = uri or os.getenv("MONGODB_URI")
         self._db_name = db_name or os.getenv("MONGODB_DB_NAME")
 
         if not self._uri or not self._db_name:
             raise ValueError("MONGODB_URI et/ou MONGODB_DB_NAME manquants (check .env).")
 
-        self._client = MongoClient(self._uri, serverSelectionTimeoutMS=server_selection_timeout_ms)
+        # Registre des index: table -> {nom_index: spec}
+        self._indexes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._auto_indexes = auto_indexes
+        self._indexed_tables: set = set()
+        for table, specs in (DEFAULT_INDEXES if indexes is None else indexes).items():
+            self.declare_table(table)
+            for keys in specs:
+                self.declare_index(table, keys)
 
-        self._client.server_info()
+        # Cache des totaux (count_mode="cached"/"estimated"): clé -> (expiration, total)
+        self._count_cache: Dict[str, Tuple[float, int]] = {}
+        self._count_cache_ttl = count_cache_ttl
+        self._count_cache_size = count_cache_size
 
-        self._db: _MongoDatabase = self._client.get_database(self._db_name)
+        # Format des pid générés (voir pids.py) et conversion API <-> stockage
+        self._pids = PidCodec(pid_strategy)
 
-    # -------- Helpers
-    def col(self, table: str) -> Collection:
-        return self._db[table]
+        # Références entre tables (expand=)
+        self._references: Dict[str, Dict[str, str]] = {t: dict(refs) for t, refs in DEFAULT_REFERENCES.items()}
+        for refs in self._references.values():
+            self._pids.fields.update(refs)
+
+        # Caches des lectures (activés par Database), invalidés par _on_write
+        self._entity_cache: Optional[EntityCache] = None
+        self._query_cache: Optional[QueryCache] = None
+        _INSTANCES.setdefault((self._uri, self._db_name), weakref.WeakSet()).add(self)
+
+    # ======================
+    # Index / schéma
+    # ======================
+    def declare_table(self, table: str) -> None:
+        """Enregistre une table dans le registre (avec son index unique sur pid)."""
+        if table not in self._indexes:
+            self._indexes[table] = {PID_INDEX["name"]: dict(PID_INDEX)}
+
+    def declare_index(self, table: str, keys: IndexKeys, **options: Any) -> str:
+        """
+        Déclare un index secondaire ou composé, ex:
+          db.declare_index("users", "email", unique=True)
+          db.declare_index("projects", [("tags", 1), ("deadline", 1)])
+        L'index est créé au prochain ensure_indexes(). Retourne son nom.
+        """
+        spec = _normalize_index(keys, **options)
+        self.declare_table(table)
+        self._indexes[table][spec["name"]] = spec
+        self._indexed_tables.discard(table)
+        return spec["name"]
+
+    def declare_reference(self, table: str, field: str, target: str) -> None:
+        """Déclare que table.field contient des pids (ou une liste de pids) de target."""
+        self._references.setdefault(table, {})[field] = target
+        self._pids.fields.add(field)
+
+    def _reference_target(self, table: str, field: str) -> str:
+        target = self._references.get(table, {}).get(field)
+        if target is None:
+            raise ValueError(f"Référence inconnue: {table}.{field} (voir declare_reference).")
+        return target
+
+    def declared_indexes(self, table: str) -> List[Dict[str, Any]]:
+        return list(self._indexes.get(table, {}).values())
+
+    def _index_actions(
+        self, table: str, existing: Dict[str, Any], drop_extra: bool, fix: bool
+    ) -> Tuple[Dict[str, List[str]], List[Tuple[str, str, Optional[Dict[str, Any]]]]]:
+        """
+        Compare les index déclarés de table avec existing (index_information()).
+        Retourne (dérive, actions) où actions est une liste de
+        ("drop", nom, None) / ("create", nom, spec) à exécuter dans l'ordre.
+        """
+        declared = self._indexes[table]
+        drift: Dict[str, List[str]] = {"created": [], "mismatched": [], "extra": [], "errors": []}
+        actions: List[Tuple[str, str, Optional[Dict[str, Any]]]] = []
+
+        for name, spec in declared.items():
+            current = existing.get(name)
+            if current is not None:
+                same_keys = [tuple(k) for k in current["key"]] == [tuple(k) for k in spec["key"]]
+                if same_keys and _index_options(current) == _index_options(spec):
+                    continue
+                drift["mismatched"].append(name)
+                if not fix:
+                    continue
+                actions.append(("drop", name, None))
+            actions.append(("create", name, spec))
+
+        for name in existing:
+            if name == "_id_" or name in declared:
+                continue
+            drift["extra"].append(name)
+            if drop_extra:
+                actions.append(("drop", name, None))
+        return drift, actions
 
+    def _index_steps(
+        self, tables: Optional[List[str]], drop_extra: bool, fix: bool
+    ) -> Generator[Tuple[str, str, Any], Any, Dict[str, Dict[str, List[str]]]]:
+        """
+        Déroulé de ensure_indexes sans entrée/sortie: produit (opération, table, argument)
+        avec opération "index_information" / "drop_index" / "create_index", et reçoit son
+        résultat (l'OperationFailure pour un create_index refusé). Exécuté par Database
+        et par AsyncDatabase. Retourne le rapport de dérive.
+        """
+        report: Dict[str, Dict[str, List[str]]] = {}
+        for table in (tables if tables is not None else list(self._indexes)):
+            self.declare_table(table)
+            existing = yield ("index_information", table, None)
+            drift, actions = self._index_actions(table, existing, drop_extra, fix)
+            for action, name, spec in actions:
+                if action == "drop":
+                    yield ("drop_index", table, name)
+                    continue
+                result = yield ("create_index", table, spec)
+                if isinstance(result, OperationFailure):
+                    drift["errors"].append(f"{name}: {result}")
+                elif name not in existing:
+                    drift["created"].append(name)
+            report[table] = drift
+            self._indexed_tables.add(table)
+        return report
+
+    # -------- Écritures
+    def _on_write(self, table: str, pids: Optional[List[str]] = None) -> None:
+        """Appelé après chaque écriture: pids touchés, ou None si inconnus (écriture par attributs)."""
+        if self._entity_cache is not None:
+            self._entity_cache.invalidate(table, pids)
+        self._bump(table)
+
+    def _bump(self, table: str) -> None:
+        """Nouvelle version de la collection (aussi appelé par les index dérivés après leurs écritures)."""
+        if self._query_cache is not None:
+            self._query_cache.bump(table)
+
+    def _derived_features(self, table: str, fields: Optional[List[str]] = None) -> List[str]:
+        """Structures dérivées (tenues par Database) qu'une écriture sur table (ces champs, ou tous) doit suivre."""
+        return []
+
+    def _siblings(self) -> List["BaseDatabase"]:
+        """Instances ouvertes sur la même base dans ce processus (self compris)."""
+        return list(_INSTANCES.get((self._uri, self._db_name), ()))
+
+    # -------- Audit
     def _with_audit_on_create(self, doc: Dict[str, Any], created_by: Optional[str]) -> Dict[str, Any]:
         now = utcnow()
         return {
             **doc,
-            "pid": uuid.uuid4().hex,
+            "pid": self._pids.new(),
             "created_at": now,
             "updated_at": now,
             **({"created_by": created_by} if created_by else {}),
         }
 
+    # -------- Pids
+    def _pid_fields(self, table: str) -> set:
+        """Champs contenant des pids: pid et les références déclarées de la table."""
+        return {"pid", *self._references.get(table, {})}
+
+    def _encode_filter(self, table: str, attributes: Dict[str, Any]) -> Dict[str, Any]:
+        return self._pids.encode_filter(attributes, self._pid_fields(table))
+
+    def _encode_data(self, table: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return self._pids.encode_data(data, self._pid_fields(table))
+
+    def _encode_pipeline(self, table: str, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Pipeline dont les $match sur pid/références utilisent la représentation stockée."""
+        if not self._pids.binary:
+            return pipeline
+        return [{"$match": self._encode_filter(table, s["$match"])} if "$match" in s else s for s in pipeline]
+
+    def _encode_ref(self, table: str, field: str, value: Any) -> Any:
+        """Élément ajouté/retiré d'un tableau de références ($each / $in compris)."""
+        return self._pids.encode(value) if field.split(".", 1)[0] in self._pid_fields(table) else value
+
     def _with_audit_on_update(self, updates: Dict[str, Any], updated_by: Optional[str]) -> Dict[str, Any]:
         set_part = {"updated_at": utcnow(), **updates}
         if updated_by is not None:
             set_part["updated_by"] = updated_by
         return {"$set": set_part}
 
+    # ======================
+    # Compilation des requêtes
+    # ======================
+    def compile_query(
+        self,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        sort: Optional[Dict[str, int]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+    ) -> QueryPlan:
+        """Plan (find ou aggregate) qu'exécuterait get_items avec ces paramètres."""
+        plan = _compile_query(attributes, _normalize_fields(fields), sort, skip, limit, pipeline)
+        note_plan(plan)
+        return plan
+
+    @staticmethod
+    def _find_options(
+        plan: QueryPlan,
+        batch_size: Optional[int] = None,
+        allow_disk_use: Optional[bool] = None,
+        no_cursor_timeout: bool = False,
+    ) -> Dict[str, Any]:
+        """Arguments de find() pour un plan "find"."""
+        opts: Dict[str, Any] = {
+            "sort": plan.sort,
+            "skip": plan.skip,
+            "limit": plan.limit or 0,
+            "no_cursor_timeout": no_cursor_timeout,
+        }
+        if batch_size:
+            opts["batch_size"] = batch_size
+        if allow_disk_use is not None:
+            opts["allow_disk_use"] = allow_disk_use
+        return opts
+
+    @staticmethod
+    def _aggregate_options(batch_size: Optional[int] = None, allow_disk_use: Optional[bool] = None) -> Dict[str, Any]:
+        opts: Dict[str, Any] = {}
+        if batch_size:
+            opts["batchSize"] = batch_size
+        if allow_disk_use is not None:
+            opts["allowDiskUse"] = allow_disk_use
+        return opts
+
+    # -------- Stats / totaux
+    @staticmethod
+    def _check_count_mode(count_mode: str) -> None:
+        if count_mode not in ("exact", "estimated", "cached"):
+            raise ValueError(f"count_mode inconnu: {count_mode}")
+
+    def _count_key(self, table: str, plan: QueryPlan) -> str:
+        return table + ":" + json_util.dumps(plan.count_stages or plan.filter, sort_keys=True)
+
+    def _count_cache_get(self, key: str) -> Optional[int]:
+        hit = self._count_cache.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
+        return None
+
+    def _count_cache_put(self, key: str, total: int) -> None:
+        now = time.monotonic()
+        if len(self._count_cache) >= self._count_cache_size:
+            self._count_cache = {k: v for k, v in self._count_cache.items() if v[0] > now}
+            if len(self._count_cache) >= self._count_cache_size:
+                self._count_cache.pop(next(iter(self._count_cache)))
+        self._count_cache[key] = (now + self._count_cache_ttl, total)
+
+    @staticmethod
+    def _page_stats(total: int, skip: int, limit: Optional[int], strategy: str, exact: bool) -> Dict[str, Any]:
+        return {
+            "itemsCount": total,
+            "pageSize": limit if limit is not None else total,
+            "firstIndexReturned": skip if total > 0 else None,
+            "pagesCount": ((total + limit - 1) // limit) if limit else 1,
+            "countStrategy": strategy,
+            "countExact": exact,
+        }
+
+    def _stats_steps(
+        self, table: str, plan: QueryPlan, skip: int, limit: Optional[int], count_mode: str
+    ) -> Generator[str, Any, Tuple[List[Any], Dict[str, Any]]]:
+        """
+        Déroulé de get_items(return_stats=True) sans entrée/sortie: produit l'opération
+        "list" / "page_and_count" / "count" / "estimated_count" et reçoit son résultat
+        (items, (items, total) ou total). Exécuté par Database et par AsyncDatabase:
+        le choix de la stratégie de comptage est commun. Retourne (items, stats).
+        """
+        if count_mode == "exact" and limit is not None:
+            items, total = yield "page_and_count"
+            return items, self._page_stats(total, skip, limit, "facet", True)
+
+        items = yield "list"
+        if count_mode == "exact":
+            # Pas de fenêtre: le total est la taille du résultat. skip sans limit: $facet
+            # mettrait tout le reste du résultat dans un seul document (limite de 16 Mo);
+            # la page va jusqu'à la fin, total = skip + len, sauf page vide (skip au-delà
+            # de la fin) où le total est compté à part.
+            if items or not skip:
+                total, strategy = skip + len(items), "len"
+            else:
+                total, strategy = (yield "count"), "count"
+            exact = True
+        elif count_mode == "estimated" and not plan.filter and plan.count_stages is None:
+            total, strategy, exact = (yield "estimated_count"), "estimated", False
+        else:
+            # Total mis en cache (TTL court) par table + filtre
+            key = self._count_key(table, plan)
+            cached = self._count_cache_get(key)
+            if cached is None:
+                total = yield "count"
+                self._count_cache_put(key, total)
+            else:
+                total = cached
+            strategy, exact = "cached", cached is None
+        return items, self._page_stats(total, skip, limit, strategy, exact)
+
+    # -------- Pagination par curseur
+    def _keyset_plan(
+        self,
+        attributes: Dict[str, Any],
+        sort: Optional[Dict[str, int]],
+        page_size: int,
+        after: Optional[str],
+        fields: Optional[List[str]],
+        pipeline: Optional[List[Dict[str, Any]]],
+    ) -> Tuple[QueryPlan, List[Tuple[str, int]]]:
+        if page_size <= 0:
+            raise ValueError("page_size doit être > 0.")
+        sort_keys = keyset_sort(sort)
+        pipeline = list(pipeline or [])
+        if after:
+            # Reprise en fin de pipeline: les clés de tri peuvent être produites par le
+            # pipeline; compile_query la remonte dans le filtre quand c'est sans effet
+            resume = self._pids.encode_filter(keyset_filter(sort_keys, decode_page_token(sort_keys, after)), {"pid"})
+            pipeline.append({"$match": resume})
+        if fields is not None and len(fields) > 0:
+            fields = list(dict.fromkeys([*fields, *(k for k, _ in sort_keys)]))
+        elif fields is None:
+            fields = [k for k, _ in sort_keys]
+        plan = self.compile_query(attributes, fields=fields, sort=dict(sort_keys), limit=page_size + 1, pipeline=pipeline)
+        return plan, sort_keys
+
+    @staticmethod
+    def _keyset_page(
+        items: List[Dict[str, Any]], page_size: int, sort_keys: List[Tuple[str, int]]
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if len(items) <= page_size:
+            return items, None
+        items = items[:page_size]
+        return items, encode_page_token(sort_keys, items[-1])
+
+
+class Database(BaseDatabase):
+    """
+    Classe centrale des opérations MongoDB (avec pymongo + agrégations).
+    """
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        db_name: Optional[str] = None,
+        server_selection_timeout_ms: int = 5000,
+        indexes: Optional[Dict[str, List[IndexKeys]]] = None,
+        auto_indexes: bool = True,
+        count_cache_ttl: float = 30.0,
+        count_cache_size: int = 1024,
+        entity_cache_size: int = 0,
+        entity_cache_ttl: float = 60.0,
+        metrics: bool = False,
+        slow_query_ms: Optional[float] = None,
+        slow_log_size: int = 100,
+        explain_slow: bool = True,
+        metrics_bytes: bool = False,
+        max_pool_size: Optional[int] = None,
+        min_pool_size: Optional[int] = None,
+        max_idle_time_ms: Optional[int] = None,
+        compressors: Optional[str] = None,
+        warm: Union[bool, int] = False,
+        membership_index: bool = False,
+        pid_strategy: str = "uuid4",
+        query_cache_bytes: int = 0,
+    ):
+        """
+        La connexion est différée: rien n'est ouvert avant la première opération
+        (les index déclarés sont alors vérifiés si auto_indexes). Le MongoClient
+        est partagé entre instances de même uri/options (voir get_client).
+        Pool: max_pool_size, min_pool_size, max_idle_time_ms, compressors
+        (ou MONGODB_MAX_POOL_SIZE, MONGODB_MIN_POOL_SIZE, MONGODB_MAX_IDLE_TIME_MS,
+        MONGODB_COMPRESSORS). warm=True (ou un nombre) ouvre les connexions tout de suite.
+        membership_index=True maintient l'index user -> projects (voir membership.py).
+        pid_strategy: "uuid4" (défaut), "ulid" ou "uuid7" (binaire), voir pids.py et migrate_pids.
+        uri="memory://" (ou MONGODB_URI) utilise le moteur en mémoire, memory:///chemin
+        avec snapshot sur disque (voir memory_engine.py et snapshot).
+        query_cache_bytes > 0 met en cache les résultats de get_items dans cette limite
+        mémoire, invalidés par les écritures de ce processus (voir query_cache.py).
+        """
+        super().__init__(uri, db_name, indexes, auto_indexes, count_cache_ttl, count_cache_size, pid_strategy=pid_strategy)
+
+        # Instrumentation (activée par metrics=True ou un seuil slow_query_ms)
+        self._metrics: Optional[Metrics] = (
+            Metrics(slow_query_ms, slow_log_size, explain_slow, metrics_bytes)
+            if metrics or slow_query_ms is not None else None
+        )
+
+        # Cache des lectures par pid (désactivé si entity_cache_size == 0)
+        self._entity_cache = (
+            EntityCache(entity_cache_size, entity_cache_ttl) if entity_cache_size > 0 else None
+        )
+        self._cache_watcher: Optional[threading.Thread] = None
+        # Cache des résultats de get_items (désactivé si query_cache_bytes == 0)
+        self._query_cache = QueryCache(query_cache_bytes) if query_cache_bytes > 0 else None
+        self._cache_watch_stop = threading.Event()
+
+        # Index dénormalisé user -> projects, tenu à jour par les écritures
+        self._membership: Optional[MembershipIndex] = MembershipIndex(self) if membership_index else None
+
+        # Compteurs agrégés déclarés par declare_rollup (aucun coût tant qu'il n'y en a pas)
+        self._rollups = RollupStore(self)
+
+        # Tableaux stockés hors du document, par paquets (declare_bucketed_array)
+        self._buckets = BucketStore(self)
+
+        # Archivage des documents anciens vers <table>_archive (declare_tiering)
+        self._tiers = TierStore(self)
+        self._tier_thread: Optional[threading.Thread] = None
+        self._tier_stop = threading.Event()
+
+        self._pool_options = _pool_options(
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            maxIdleTimeMS=max_idle_time_ms,
+            compressors=compressors,
+        )
+        self._client = get_client(self._uri, serverSelectionTimeoutMS=server_selection_timeout_ms, **self._pool_options)
+        # Pids binaires: pid et références relus en hexadécimal par toutes les lectures (find, aggregate, $lookup...)
+        self._db: _MongoDatabase = self._client.get_database(self._db_name, codec_options=self._pids.codec_options)
+        # Valeurs telles que stockées (index d'appartenance, migration)
+        self._store_db: _MongoDatabase = self._client.get_database(self._db_name)
+        self._started = False
+
+        if warm:
+            self.warm(None if warm is True else int(warm))
+
+    # -------- Helpers
+    def col(self, table: str, write: bool = False) -> Collection:
+        """
+        Collection d'une table. Les index d'une table non déclarée ne sont créés
+        qu'à la première écriture (write=True): une lecture sur un nom de table
+        erroné ne crée ni collection ni index.
+        """
+        if self._auto_indexes and table not in self._indexed_tables:
+            if not self._started:
+                # Premier usage: index de toutes les tables déclarées
+                self._started = True
+                self.ensure_indexes()
+            if table not in self._indexed_tables and (write or table in self._indexes):
+                self.declare_table(table)
+                self.ensure_indexes([table])
+        return self._db[table]
+
+    def warm(self, connections: Optional[int] = None) -> int:
+        """
+        Vérifie le serveur et pré-ouvre `connections` connexions du pool
+        (par défaut minPoolSize, ou 1) par des ping concurrents. Retourne ce nombre.
+        """
+        n = connections or self._pool_options.get("minPoolSize") or 1
+        self._client.server_info()
+        if n > 1:
+            with ThreadPoolExecutor(max_workers=n) as pool:
+                list(pool.map(lambda _: self._client.admin.command("ping"), range(n)))
+        if self._auto_indexes and not self._started:
+            self._started = True
+            self.ensure_indexes()
+        return n
+
+    def drop_table(self, table: str) -> None:
+        """Supprime la collection et ses index (bien plus rapide que delete_many({}))."""
+        self._db.drop_collection(table)
+        self._indexed_tables.discard(table)
+        self._on_write(table)
+        if self._membership is not None and self._membership.tracks(table):
+            self._membership.clear()
+        self._rollups.reset_table(table)
+        self._buckets.drop_table(table)
+
+    def ensure_indexes(self, tables: Optional[List[str]] = None, drop_extra: bool = False, fix: bool = False) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Réconcilie les index déclarés avec ceux présents en base.
+        Retourne, par table, la dérive constatée:
+          - created:    index déclarés absents, créés
+          - mismatched: même nom mais clés/options différentes (recréés si fix=True)
+          - extra:      index présents non déclarés (supprimés si drop_extra=True)
+          - errors:     création impossible (ex: doublons de pid existants)
+        """
+        steps = self._index_steps(tables, drop_extra, fix)
+        result: Any = None
+        while True:
+            try:
+                op, table, arg = steps.send(result)
+            except StopIteration as done:
+                return done.value
+            col = self._db[table]
+            if op != "create_index":
+                result = getattr(col, op)(*([] if arg is None else [arg]))
+                continue
+            try:
+                result = col.create_index(arg["key"], **{k: v for k, v in arg.items() if k != "key"})
+            except OperationFailure as e:
+                result = e
+
+    def _membership_pids(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        many: bool = True,
+    ) -> Optional[List[str]]:
+        """
+        Avant une écriture par attributs: pids des documents visés si l'index
+        d'appartenance doit la suivre (champs suivis, ou table suivie si fields=None), sinon None.
+        """
+        m = self._membership
+        if m is None or not (m.tracks(table) if fields is None else any(m.tracks(table, f) for f in fields)):
+            return None
+        cursor = self._db[table].find(attributes, {"pid": 1, "_id": 0})
+        return [d["pid"] for d in (cursor.limit(1) if not many else cursor)]
+
+    def _membership_tracks(self, table: str, fields: List[str]) -> bool:
+        return self._membership is not None and any(self._membership.tracks(table, f) for f in fields)
+
+    def _derived_features(self, table: str, fields: Optional[List[str]] = None) -> List[str]:
+        features: List[str] = []
+        if self._membership is not None and (self._membership.tracks(table) if fields is None else self._membership_tracks(table, fields)):
+            features.append("index d'appartenance")
+        if self._rollups.for_table(table, fields):
+            features.append("rollups")
+        if self._buckets.for_table(table, [] if fields is None else fields):
+            features.append("tableaux en buckets")
+        if table in self._tiers.policies:
+            features.append("archivage")
+        return features
+
+    def _rollup_before(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+    ) -> Optional[Tuple[List[Rollup], List[Dict[str, Any]]]]:
+        """
+        Avant une écriture multi-documents: rollups concernés et image des documents visés
+        (None si aucun rollup). Images avant/après lues hors de l'écriture: voir rollups.py
+        pour les écritures concurrentes (les écritures unitaires passent par _write_one).
+        """
+        rollups = self._rollups.for_table(table, fields)
+        if not rollups:
+            return None
+        return rollups, list(self._db[table].find(attributes, RollupStore.projection(rollups)))
+
+    def _rollup_after(
+        self,
+        table: str,
+        before: Optional[Tuple[List[Rollup], List[Dict[str, Any]]]],
+        pids: Optional[List[str]] = None,
+    ) -> None:
+        """Après l'écriture: relit les mêmes pids (ou `pids`) et applique les écarts ($inc)."""
+        if before is None:
+            return
+        rollups, docs = before
+        if pids is None:
+            pids = [d["pid"] for d in docs]
+        after = list(self._db[table].find({"pid": {"$in": self._pids.encode_pids(pids)}}, RollupStore.projection(rollups))) if pids else []
+        self._rollups.apply(rollups, docs, after)
+
+    def _write_one(self, table: str, flt: Dict[str, Any], update: Optional[Dict[str, Any]], fields: Optional[List[str]] = None) -> Tuple[int, int]:
+        """
+        update_one (delete_one si update est None) et rollups concernés. Retourne (trouvés, modifiés).
+        Avec des rollups, l'image avant vient de la même opération atomique
+        (find_one_and_update / find_one_and_delete) et l'image après en est déduite:
+        une écriture concurrente sur le même document ne fausse pas les écarts.
+        """
+        col = self.col(table, write=True)
+        rollups = self._rollups.for_table(table, fields)
+        if not rollups:
+            if update is None:
+                n = col.delete_one(flt).deleted_count
+                return n, n
+            res = col.update_one(flt, update)
+            return res.matched_count, res.modified_count
+        proj = RollupStore.projection(rollups)
+        if update is None:
+            before = self._store_db[table].find_one_and_delete(flt, proj)
+            after = []
+        else:
+            before = self._store_db[table].find_one_and_update(flt, update, proj, return_document=ReturnDocument.BEFORE)
+            after = [] if before is None else [apply_update(copy.deepcopy(before), update)]
+        if before is None:
+            return 0, 0
+        self._rollups.apply(rollups, [before], after)
+        # updated_at change à chaque écriture: un document trouvé est toujours modifié
+        return 1, 1
+
+    def _split_bucketed(self, table: str, item: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+        """Document à insérer sans ses tableaux en buckets, et ces tableaux (à écrire dans les buckets)."""
+        arrays = [a for a in self._buckets.for_table(table, []) if a in item]
+        if not arrays:
+            return item, {}
+        return {k: v for k, v in item.items() if k not in arrays}, {a: list(item[a]) for a in arrays if item[a]}
+
+    def _check_not_bucketed(self, table: str, fields: List[str]) -> None:
+        """Un $set sur un tableau en buckets écrirait une copie embarquée que les lectures ignorent: refusé."""
+        arrays = self._buckets.for_table(table, fields) if fields else []
+        if arrays:
+            raise ValueError(f"{table}.{arrays[0]} est en buckets: passer par array_push_item_by_pid / array_pull_item_by_pid.")
+
+    def _bucket_owners(self, table: str, attributes: Dict[str, Any], many: bool = True) -> Optional[List[str]]:
+        """Avant une suppression par attributs: pids visés si la table a des tableaux en buckets, sinon None."""
+        if not any(t == table for t, _ in self._buckets.arrays):
+            return None
+        cursor = self._db[table].find(attributes, {"pid": 1, "_id": 0})
+        return [d["pid"] for d in (cursor.limit(1) if not many else cursor)]
+
+    def _bucket_write(self, table: str, pids: List[str], array: str, op: str, value: Any, updated_by: Optional[str]) -> int:
+        """push/pull sur un tableau en buckets: audit des documents puis écriture des buckets."""
+        by_pid = {"pid": {"$in": self._pids.encode_pids(pids)}}
+        audit = self._with_audit_on_update({}, updated_by)
+        res = self.col(table, write=True).update_many(by_pid, audit)
+        archived = self._archive_write(table, "update_many", by_pid, audit)
+        if res.matched_count or archived:
+            for pid in pids:
+                if op == "push":
+                    self._buckets.push(table, array, pid, value)
+                else:
+                    self._buckets.pull(table, array, pid, value)
+        self._on_write(table, pids)
+        return res.modified_count + archived
+
+    def _archive_write(self, table: str, op: str, flt: Dict[str, Any], update: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Même écriture sur <table>_archive si la table est archivée (declare_tiering).
+        op: "update_one", "update_many", "delete_one" ou "delete_many". Retourne le nombre
+        de documents modifiés/supprimés. Les index dérivés ignorent les archives: seuls les
+        buckets des documents archivés supprimés sont retirés.
+        """
+        if table not in self._tiers.policies:
+            return 0
+        col = self._tiers.col(table)
+        if update is not None:
+            n = getattr(col, op)(flt, update).modified_count
+        else:
+            owners = None
+            if any(t == table for t, _ in self._buckets.arrays):
+                cursor = col.find(flt, {"pid": 1, "_id": 0})
+                owners = [self._pids.to_api(d["pid"]) for d in (cursor.limit(1) if op == "delete_one" else cursor)]
+            n = getattr(col, op)(flt).deleted_count
+            if owners and n:
+                self._buckets.deleted(table, owners)
+        if n:
+            self._on_write(archive_name(table), None)
+        return n
+
     # ======================
     # Partie 2 - CREATE
     # ======================
+    @instrumented
     def create_item(self, table: str, item: Dict[str, Any], created_by: Optional[str] = None) -> Dict[str, Any]:
-        doc = self._with_audit_on_create(item, created_by)
-        self.col(table).insert_one(doc)
-        return {"pid": doc["pid"]}
+        item, bucketed = self._split_bucketed(table, item)
+        doc = self._with_audit_on_create(self._encode_data(table, item), created_by)
+        self.col(table, write=True).insert_one(doc)
+        pid = self._pids.to_api(doc["pid"])
+        for array, values in bucketed.items():
+            self._buckets.push(table, array, pid, {"$each": values})
+        self._on_write(table, [pid])
+        if self._membership is not None:
+            self._membership.created(table, [doc])
+        self._rollups.apply(self._rollups.for_table(table), [], [doc])
+        return {"pid": pid}
 
+    @instrumented
     def create_items(self, table: str, items: List[Dict[str, Any]], created_by: Optional[str] = None) -> List[Dict[str, Any]]:
-        docs = [self._with_audit_on_create(it, created_by) for it in items]
+        split = [self._split_bucketed(table, it) for it in items]
+        docs = [self._with_audit_on_create(self._encode_data(table, it), created_by) for it, _ in split]
+        pids = [self._pids.to_api(d["pid"]) for d in docs]
         if docs:
-            self.col(table).insert_many(docs)
-        return [{"pid": d["pid"]} for d in docs]
+            self.col(table, write=True).insert_many(docs)
+            for pid, (_, bucketed) in zip(pids, split):
+                for array, values in bucketed.items():
+                    self._buckets.push(table, array, pid, {"$each": values})
+            self._on_write(table, pids)
+            if self._membership is not None:
+                self._membership.created(table, docs)
+            self._rollups.apply(self._rollups.for_table(table), [], docs)
+        return [{"pid": pid} for pid in pids]
 
     # ======================
     # Partie 4 - UPDATE
     # ======================
+    @instrumented
     def update_items_by_attr(self, table: str, attributes: Dict[str, Any], items_data: Dict[str, Any], updated_by: Optional[str] = None) -> int:
-        res = self.col(table).update_many(attributes, self._with_audit_on_update(items_data, updated_by))
-        return res.modified_count
+        self._check_not_bucketed(table, list(items_data))
+        attributes = self._encode_filter(table, attributes)
+        synced = self._membership_pids(table, attributes, list(items_data))
+        before = self._rollup_before(table, attributes, list(items_data))
+        update = self._with_audit_on_update(self._encode_data(table, items_data), updated_by)
+        res = self.col(table, write=True).update_many(attributes, update)
+        self._on_write(table, None)
+        self._rollup_after(table, before)
+        if synced:
+            self._membership.resync(table, synced)
+        return res.modified_count + self._archive_write(table, "update_many", attributes, update)
 
+    @instrumented
     def update_items_by_pids(self, table: str, pids: List[str], items_data: Dict[str, Any], updated_by: Optional[str] = None) -> int:
-        res = self.col(table).update_many({"pid": {"$in": pids}}, self._with_audit_on_update(items_data, updated_by))
-        return res.modified_count
+        self._check_not_bucketed(table, list(items_data))
+        by_pid = {"pid": {"$in": self._pids.encode_pids(pids)}}
+        before = self._rollup_before(table, by_pid, list(items_data))
+        update = self._with_audit_on_update(self._encode_data(table, items_data), updated_by)
+        res = self.col(table, write=True).update_many(by_pid, update)
+        self._on_write(table, pids)
+        self._rollup_after(table, before)
+        if self._membership_tracks(table, list(items_data)):
+            self._membership.resync(table, pids)
+        return res.modified_count + self._archive_write(table, "update_many", by_pid, update)
 
+    @instrumented
     def update_item_by_attr(self, table: str, attributes: Dict[str, Any], item_data: Dict[str, Any], updated_by: Optional[str] = None) -> bool:
-        res = self.col(table).update_one(attributes, self._with_audit_on_update(item_data, updated_by))
-        return res.modified_count > 0
+        self._check_not_bucketed(table, list(item_data))
+        attributes = flt = self._encode_filter(table, attributes)
+        synced = self._membership_pids(table, attributes, list(item_data), many=False)
+        if synced:
+            # Le document suivi est celui qui sera modifié
+            attributes = {**attributes, "pid": self._pids.encode(synced[0])}
+        update = self._with_audit_on_update(self._encode_data(table, item_data), updated_by)
+        matched, modified = self._write_one(table, attributes, update, list(item_data))
+        self._on_write(table, None)
+        if synced:
+            self._membership.resync(table, synced)
+        if not matched:
+            return self._archive_write(table, "update_one", flt, update) > 0
+        return modified > 0
 
+    @instrumented
     def update_item_by_pid(self, table: str, pid: str, item_data: Dict[str, Any], updated_by: Optional[str] = None) -> bool:
-        res = self.col(table).update_one({"pid": pid}, self._with_audit_on_update(item_data, updated_by))
-        return res.modified_count > 0
+        self._check_not_bucketed(table, list(item_data))
+        by_pid = {"pid": self._pids.encode(pid)}
+        update = self._with_audit_on_update(self._encode_data(table, item_data), updated_by)
+        matched, modified = self._write_one(table, by_pid, update, list(item_data))
+        self._on_write(table, [pid])
+        if self._membership_tracks(table, list(item_data)):
+            self._membership.resync(table, [pid])
+        if not matched:
+            return self._archive_write(table, "update_one", by_pid, update) > 0
+        return modified > 0
 
     # ======================
     # Partie 5 - GET simples
     # ======================
+    @instrumented
     def get_item_by_attr(
         self,
         table: str,
@@ -116,78 +998,291 @@ class Database:
         fields: Optional[List[str]] = None,
         pipeline: Optional[List[Dict[str, Any]]] = None,
     ) -> Optional[Dict[str, Any]]:
-        proj = _normalize_fields(fields)
-        stages: List[Dict[str, Any]] = [{"$match": attributes}]
-        if proj is not None:
-            stages.append({"$project": proj})
-        if pipeline:
-            stages.extend(pipeline)
-        stages.append({"$limit": 1})
-        cursor = self.col(table).aggregate(stages)
-        return next(cursor, None)
+        attributes = self._encode_filter(table, attributes)
+        plan = self.compile_query(attributes, fields=fields, limit=1, pipeline=pipeline)
+        if plan.kind == "find":
+            return self.col(table).find_one(plan.filter, plan.projection)
+        return next(self._plan_cursor(table, plan), None)
 
+    @instrumented
     def get_item_by_pid(
         self,
         table: str,
         pid: str,
         fields: Optional[List[str]] = None,
         pipeline: Optional[List[Dict[str, Any]]] = None,
+        expand: Optional[List[str]] = None,
+        expand_fields: Optional[Dict[str, List[str]]] = None,
+        stream_arrays: bool = False,
+        include_archived: bool = False,
     ) -> Optional[Dict[str, Any]]:
-        return self.get_item_by_attr(table, {"pid": pid}, fields=fields, pipeline=pipeline)
+        """
+        expand / expand_fields: voir get_items.
+        Les tableaux en buckets demandés par fields sont réassemblés en listes, ou
+        avec stream_arrays=True remplacés par des itérateurs (un bucket lu à la fois).
+        include_archived=True: cherche aussi dans <table>_archive (voir declare_tiering).
+        """
+        if expand:
+            tree = parse_expand(expand)
+            doc = self.get_item_by_pid(
+                table, pid, fields=with_expand_roots(fields, tree), pipeline=pipeline, include_archived=include_archived
+            )
+            if doc is not None:
+                self._expand(table, [doc], tree, expand_fields)
+            return doc
+        if self._entity_cache is None or pipeline:
+            doc = self.get_item_by_attr(table, {"pid": pid}, fields=fields, pipeline=pipeline)
+        else:
+            proj = _normalize_fields(fields)
+            doc = self._entity_cache.get(table, pid, proj)
+            if doc is None:
+                generation = self._entity_cache.generation(table)
+                doc = self.get_item_by_attr(table, {"pid": pid}, fields=fields)
+                if doc is not None:
+                    self._entity_cache.put(table, pid, proj, doc, generation=generation)
+        if doc is None and include_archived:
+            doc = self.get_item_by_attr(archive_name(table), {"pid": pid}, fields=fields, pipeline=pipeline)
+        if doc is not None:
+            for array in self._buckets.for_table(table, fields):
+                items = self._buckets.iter(table, array, pid)
+                doc[array] = items if stream_arrays else list(items)
+        return doc
 
     # ======================
     # Partie 6 - DELETE
     # ======================
+    @instrumented
     def delete_items_by_attr(self, table: str, attributes: Dict[str, Any]) -> int:
-        res = self.col(table).delete_many(attributes)
-        return res.deleted_count
+        attributes = self._encode_filter(table, attributes)
+        synced = self._membership_pids(table, attributes)
+        owners = self._bucket_owners(table, attributes)
+        before = self._rollup_before(table, attributes)
+        res = self.col(table, write=True).delete_many(attributes)
+        self._on_write(table, None)
+        self._rollup_after(table, before)
+        if synced:
+            self._membership.deleted(table, synced)
+        if owners:
+            self._buckets.deleted(table, owners)
+        return res.deleted_count + self._archive_write(table, "delete_many", attributes)
 
+    @instrumented
     def delete_items_by_pids(self, table: str, pids: List[str]) -> int:
-        res = self.col(table).delete_many({"pid": {"$in": pids}})
-        return res.deleted_count
+        by_pid = {"pid": {"$in": self._pids.encode_pids(pids)}}
+        before = self._rollup_before(table, by_pid)
+        res = self.col(table, write=True).delete_many(by_pid)
+        self._on_write(table, pids)
+        self._rollup_after(table, before)
+        if self._membership is not None:
+            self._membership.deleted(table, pids)
+        self._buckets.deleted(table, pids)
+        return res.deleted_count + self._archive_write(table, "delete_many", by_pid)
 
+    @instrumented
     def delete_item_by_attr(self, table: str, attributes: Dict[str, Any]) -> bool:
-        res = self.col(table).delete_one(attributes)
-        return res.deleted_count > 0
+        attributes = flt = self._encode_filter(table, attributes)
+        synced = self._membership_pids(table, attributes, many=False)
+        if synced:
+            attributes = {**attributes, "pid": self._pids.encode(synced[0])}
+        owners = self._bucket_owners(table, attributes, many=False)
+        if owners:
+            attributes = {**attributes, "pid": self._pids.encode(owners[0])}
+        deleted, _ = self._write_one(table, attributes, None)
+        self._on_write(table, None)
+        if synced:
+            self._membership.deleted(table, synced)
+        if owners and deleted:
+            self._buckets.deleted(table, owners)
+        if not deleted:
+            return self._archive_write(table, "delete_one", flt) > 0
+        return True
 
+    @instrumented
     def delete_item_by_pid(self, table: str, pid: str) -> bool:
-        res = self.col(table).delete_one({"pid": pid})
-        return res.deleted_count > 0
+        by_pid = {"pid": self._pids.encode(pid)}
+        deleted, _ = self._write_one(table, by_pid, None)
+        self._on_write(table, [pid])
+        if self._membership is not None:
+            self._membership.deleted(table, [pid])
+        if not deleted:
+            return self._archive_write(table, "delete_one", by_pid) > 0
+        self._buckets.deleted(table, [pid])
+        return True
 
     # ======================
     # Partie 7 - ARRAYS
     # ======================
+    @instrumented
     def array_push_item_by_attr(self, table: str, attributes: Dict[str, Any], array: str, new_item: Any, updated_by: Optional[str] = None) -> int:
-        res = self.col(table).update_many(
-            attributes,
-            {"$addToSet": {array: new_item}, **self._with_audit_on_update({}, updated_by)}
-        )
-        return res.modified_count
+        attributes = self._encode_filter(table, attributes)
+        if self._buckets.has(table, array):
+            pids = [d["pid"] for d in self._db[table].find(attributes, {"pid": 1, "_id": 0})]
+            return self._bucket_write(table, pids, array, "push", new_item, updated_by)
+        synced = self._membership_pids(table, attributes, [array])
+        before = self._rollup_before(table, attributes, [array])
+        update = {"$addToSet": {array: self._encode_ref(table, array, new_item)}, **self._with_audit_on_update({}, updated_by)}
+        res = self.col(table, write=True).update_many(attributes, update)
+        self._on_write(table, None)
+        self._rollup_after(table, before)
+        if synced:
+            self._membership.pushed(table, synced, new_item)
+        return res.modified_count + self._archive_write(table, "update_many", attributes, update)
 
+    @instrumented
     def array_push_item_by_pid(self, table: str, pid: str, array: str, new_item: Any, updated_by: Optional[str] = None) -> bool:
-        res = self.col(table).update_one(
-            {"pid": pid},
-            {"$addToSet": {array: new_item}, **self._with_audit_on_update({}, updated_by)}
-        )
-        return res.modified_count > 0
+        if self._buckets.has(table, array):
+            return self._bucket_write(table, [pid], array, "push", new_item, updated_by) > 0
+        by_pid = {"pid": self._pids.encode(pid)}
+        update = {"$addToSet": {array: self._encode_ref(table, array, new_item)}, **self._with_audit_on_update({}, updated_by)}
+        matched, modified = self._write_one(table, by_pid, update, [array])
+        self._on_write(table, [pid])
+        if modified and self._membership_tracks(table, [array]):
+            self._membership.pushed(table, [pid], new_item)
+        if not matched:
+            return self._archive_write(table, "update_one", by_pid, update) > 0
+        return modified > 0
 
+    @instrumented
     def array_pull_item_by_attr(self, table: str, attributes: Dict[str, Any], array: str, item_attr: Union[Any, Dict[str, Any]], updated_by: Optional[str] = None) -> int:
-        res = self.col(table).update_many(
-            attributes,
-            {"$pull": {array: item_attr}, **self._with_audit_on_update({}, updated_by)}
-        )
-        return res.modified_count
+        attributes = self._encode_filter(table, attributes)
+        if self._buckets.has(table, array):
+            pids = [d["pid"] for d in self._db[table].find(attributes, {"pid": 1, "_id": 0})]
+            return self._bucket_write(table, pids, array, "pull", item_attr, updated_by)
+        synced = self._membership_pids(table, attributes, [array])
+        before = self._rollup_before(table, attributes, [array])
+        update = {"$pull": {array: self._encode_ref(table, array, item_attr)}, **self._with_audit_on_update({}, updated_by)}
+        res = self.col(table, write=True).update_many(attributes, update)
+        self._on_write(table, None)
+        self._rollup_after(table, before)
+        if synced:
+            self._membership.pulled(table, synced, item_attr)
+        return res.modified_count + self._archive_write(table, "update_many", attributes, update)
 
+    @instrumented
     def array_pull_item_by_pid(self, table: str, pid: str, array: str, item_attr: Union[Any, Dict[str, Any]], updated_by: Optional[str] = None) -> bool:
-        res = self.col(table).update_one(
-            {"pid": pid},
-            {"$pull": {array: item_attr}, **self._with_audit_on_update({}, updated_by)}
-        )
-        return res.modified_count > 0
+        if self._buckets.has(table, array):
+            return self._bucket_write(table, [pid], array, "pull", item_attr, updated_by) > 0
+        by_pid = {"pid": self._pids.encode(pid)}
+        update = {"$pull": {array: self._encode_ref(table, array, item_attr)}, **self._with_audit_on_update({}, updated_by)}
+        matched, modified = self._write_one(table, by_pid, update, [array])
+        self._on_write(table, [pid])
+        if modified and self._membership_tracks(table, [array]):
+            self._membership.pulled(table, [pid], item_attr)
+        if not matched:
+            return self._archive_write(table, "update_one", by_pid, update) > 0
+        return modified > 0
+
+    # ======================
+    # Écritures groupées
+    # ======================
+    def bulk(self, max_ops: int = 1000, max_bytes: int = 8 * 1024 * 1024, max_interval: Optional[float] = 1.0) -> BulkWriter:
+        """
+        Regroupe create_item / update_item_by_pid / array_push_item_by_pid... en
+        bulk_write non ordonnés (voir BulkWriter). S'utilise avec `with`.
+        """
+        return BulkWriter(self, max_ops=max_ops, max_bytes=max_bytes, max_interval=max_interval)
+
+    # ======================
+    # Exécution des plans
+    # ======================
+    def _plan_cursor(
+        self,
+        table: str,
+        plan: QueryPlan,
+        batch_size: Optional[int] = None,
+        allow_disk_use: Optional[bool] = None,
+        no_cursor_timeout: bool = False,
+        raw: bool = False,
+    ) -> Union[Cursor, CommandCursor]:
+        col = self._raw_col(table) if raw else self.col(table)
+        if plan.kind == "find":
+            opts = self._find_options(plan, batch_size, allow_disk_use, no_cursor_timeout)
+            return col.find(plan.filter, plan.projection, **opts)
+        return col.aggregate(plan.stages, **self._aggregate_options(batch_size, allow_disk_use))
+
+    def _raw_col(self, table: str) -> Collection:
+        """Collection dont les résultats sont des RawBSONDocument (décodés à l'accès d'un champ)."""
+        return self.col(table).with_options(codec_options=self._pids.raw_codec_options)
+
+    def _plan_count(self, table: str, plan: QueryPlan) -> int:
+        if plan.count_stages is None:
+            return self.col(table).count_documents(plan.filter)
+        total_doc = next(self.col(table).aggregate(plan.count_stages), {"count": 0})
+        return int(total_doc.get("count", 0))
+
+    def _plan_page_and_count(self, table: str, plan: QueryPlan, raw: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """Page + total exact en un seul aller-retour ($facet)."""
+        col = self._raw_col(table) if raw else self.col(table)
+        res = next(col.aggregate(plan.facet_stages()), {"items": [], "total": []})
+        total = res["total"][0]["count"] if res["total"] else 0
+        return res["items"], int(total)
+
+    # ======================
+    # Expansion des références
+    # ======================
+    def _fetch_by_pids(self, table: str, pids: List[str], fields: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Documents par pid: cache des entités d'abord, puis une seule requête $in pour le reste."""
+        proj = _normalize_fields(fields)
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = pids
+        if self._entity_cache is not None:
+            generation = self._entity_cache.generation(table)
+            missing = []
+            for pid in pids:
+                doc = self._entity_cache.get(table, pid, proj)
+                if doc is None:
+                    missing.append(pid)
+                else:
+                    found[pid] = doc
+        if missing:
+            for doc in self.col(table).find({"pid": {"$in": self._pids.encode_pids(missing)}}, proj):
+                found[doc["pid"]] = doc
+                if self._entity_cache is not None:
+                    self._entity_cache.put(table, doc["pid"], proj, doc, generation=generation)
+        return found
+
+    def _expand(
+        self,
+        table: str,
+        docs: List[Dict[str, Any]],
+        tree: ExpandTree,
+        expand_fields: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        """
+        Résout les références de docs en place, niveau par niveau. À chaque niveau,
+        les pids de toutes les branches visant la même table (et les mêmes champs)
+        sont dédupliqués et lus ensemble: le coût suit le nombre de références distinctes.
+        """
+        expand_fields = expand_fields or {}
+        # (table, documents, sous-arbre, préfixe du chemin)
+        level = [(table, docs, tree, "")]
+        while level:
+            # (table cible, champs) -> pids à lire et branches à recoudre
+            groups: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+            for source, source_docs, node, prefix in level:
+                for field, sub in node.items():
+                    target = self._reference_target(source, field)
+                    path = prefix + field
+                    fields = expand_fields.get(path, [])
+                    if fields:
+                        fields = with_expand_roots(fields, sub)
+                    group = groups.setdefault((target, tuple(fields)), {"pids": {}, "branches": []})
+                    collect_refs(source_docs, field, group["pids"])
+                    group["branches"].append((source_docs, field, sub, path))
+
+            level = []
+            for (target, fields), group in groups.items():
+                by_pid = self._fetch_by_pids(target, list(group["pids"]), list(fields))
+                for source_docs, field, sub, path in group["branches"]:
+                    stitch(source_docs, field, by_pid)
+                    if sub:
+                        # Documents distincts: chacun n'est expansé qu'une fois, même référencé plusieurs fois
+                        level.append((target, list(by_pid.values()), sub, path + "."))
 
     # ======================
     # Partie 8 - GET avancée
     # ======================
+    @instrumented
     def get_items(
         self,
         table: str,
@@ -198,40 +1293,723 @@ class Database:
         limit: Optional[int] = None,
         return_stats: bool = False,
         pipeline: Optional[List[Dict[str, Any]]] = None,
+        count_mode: str = "exact",
+        expand: Optional[List[str]] = None,
+        expand_fields: Optional[Dict[str, List[str]]] = None,
+        raw: bool = False,
+        include_archived: bool = False,
     ) -> Union[List[Dict[str, Any]], Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
-        proj = _normalize_fields(fields)
-        stages: List[Dict[str, Any]] = [{"$match": attributes}]
-        if proj is not None:
-            stages.append({"$project": proj})
-        if pipeline:
-            stages.extend(pipeline)
-        if sort:
-            stages.append({"$sort": sort})
-        if skip:
-            stages.append({"$skip": int(skip)})
-        if limit is not None:
-            stages.append({"$limit": int(limit)})
-
-        items = list(self.col(table).aggregate(stages))
+        """
+        count_mode (utilisé si return_stats=True):
+          - "exact":     page + total dans une seule agrégation ($facet), ou taille du
+                         résultat quand il n'y a pas de limit
+          - "estimated": estimated_document_count() si aucun filtre, sinon comme "cached"
+          - "cached":    total mis en cache par filtre (TTL count_cache_ttl), peut être en retard
+        stats["countStrategy"] / stats["countExact"] indiquent comment itemsCount a été obtenu.
+
+        expand=["teams", "teams.members"]: remplace les pids référencés (voir declare_reference)
+        par les documents, niveau par niveau: une requête $in par niveau et par table pour toute
+        la page. expand_fields={"teams.members": ["name"]} restreint les champs d'un niveau
+        (par défaut tous).
+
+        raw=True: documents RawBSONDocument, décodés champ par champ à l'accès
+        (à sérialiser avec serializer.write_ndjson / write_json). Incompatible avec expand.
 
+        include_archived=True: lit aussi <table>_archive (voir declare_tiering). Les deux
+        tiers sont filtrés chacun par ses index, puis réunis ($unionWith) avant
+        pipeline, tri, fenêtre et projection.
+        """
+        if expand and raw:
+            raise ValueError("expand n'est pas disponible avec raw=True.")
+        attributes = self._encode_filter(table, attributes)
+        if expand:
+            tree = parse_expand(expand)
+            res = self.get_items(
+                table, attributes, fields=with_expand_roots(fields, tree), sort=sort, skip=skip, limit=limit,
+                return_stats=return_stats, pipeline=pipeline, count_mode=count_mode, include_archived=include_archived,
+            )
+            self._expand(table, res[0] if return_stats else res, tree, expand_fields)
+            return res
+        self._check_count_mode(count_mode)
+        if include_archived:
+            # Projection commune en fin de pipeline (voir compile_query): le tri voit les champs des deux tiers
+            archive = [{"$match": attributes}]
+            pipeline = [{"$unionWith": {"coll": archive_name(table), "pipeline": archive}}, *(pipeline or [])]
+        plan = self.compile_query(attributes, fields=fields, sort=sort, skip=skip, limit=limit, pipeline=pipeline)
+
+        cache = self._query_cache
+        if cache is None or raw:
+            return self._run_get_items(table, plan, skip, limit, return_stats, count_mode, raw)
+        key = cache.key(table, plan, return_stats=return_stats, count_mode=count_mode)
+        hit = cache.get(key)
+        if hit is not None:
+            return (hit["items"], hit["stats"]) if return_stats else hit["items"]
+        # Versions lues avant la requête: une écriture concurrente empêche la mise en cache
+        tables = cache.tables(table, plan)
+        versions = cache.versions(tables)
+        res = self._run_get_items(table, plan, skip, limit, return_stats, count_mode, raw)
+        cache.put(key, tables, versions, {"items": res[0], "stats": res[1]} if return_stats else {"items": res})
+        return res
+
+    def _run_get_items(
+        self,
+        table: str,
+        plan: QueryPlan,
+        skip: int,
+        limit: Optional[int],
+        return_stats: bool,
+        count_mode: str,
+        raw: bool,
+    ) -> Union[List[Dict[str, Any]], Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
         if not return_stats:
-            return items
+            return list(self._plan_cursor(table, plan, raw=raw))
 
-        count_stages = [{"$match": attributes}]
-        if proj is not None:
-            count_stages.append({"$project": proj})
-        if pipeline:
-            count_stages.extend(pipeline)
-        count_stages.append({"$count": "count"})
+        steps = self._stats_steps(table, plan, skip, limit, count_mode)
+        result: Any = None
+        while True:
+            try:
+                op = steps.send(result)
+            except StopIteration as done:
+                return done.value
+            if op == "list":
+                result = list(self._plan_cursor(table, plan, raw=raw))
+            elif op == "page_and_count":
+                result = self._plan_page_and_count(table, plan, raw=raw)
+            elif op == "count":
+                result = self._plan_count(table, plan)
+            else:
+                result = self.col(table).estimated_document_count()
 
-        total_cursor = self.col(table).aggregate(count_stages)
-        total_doc = next(total_cursor, {"count": 0})
-        total = int(total_doc.get("count", 0))
+    # ======================
+    # Partie 9 - Pagination par curseur
+    # ======================
+    @instrumented
+    def get_items_page(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        sort: Optional[Dict[str, int]] = None,
+        page_size: int = 50,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Pagination keyset: retourne (items, jeton_suivant). jeton_suivant vaut None
+        sur la dernière page; le passer en after= pour lire la page suivante.
+        Le tri est complété par pid (départage des égalités), et la reprise se fait
+        par un prédicat d'intervalle sur les clés de tri: une page profonde coûte
+        autant que la première si un index (clés de tri..., pid) est déclaré, ex:
+          db.declare_index("projects", [("deadline", 1), ("pid", 1)])
+        Les clés de tri sont ajoutées aux champs retournés. Avec un pipeline, chaque
+        ligne en sortie doit garder un pid unique (pas de $unwind / $group).
+        """
+        plan, sort_keys = self._keyset_plan(self._encode_filter(table, attributes), sort, page_size, after, fields, pipeline)
+        items = list(self._plan_cursor(table, plan))
+        return self._keyset_page(items, page_size, sort_keys)
 
-        stats = {
-            "itemsCount": total,
-            "pageSize": limit if limit is not None else total,
-            "firstIndexReturned": skip if total > 0 else None,
-            "pagesCount": ((total + limit - 1) // limit) if limit else 1,
+    # ======================
+    # Partie 10 - Lecture en flux
+    # ======================
+    def iter_items(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        sort: Optional[Dict[str, int]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+        batch_size: Optional[int] = 1000,
+        chunk_size: Optional[int] = None,
+        allow_disk_use: Optional[bool] = None,
+        no_cursor_timeout: bool = False,
+        raw: bool = False,
+    ) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Comme get_items, mais génère les documents au fil du curseur (mémoire constante).
+          - batch_size:        documents par aller-retour serveur
+          - chunk_size:        si défini, génère des listes de chunk_size documents
+          - allow_disk_use:    autorise les gros $sort à passer par le disque
+          - no_cursor_timeout: curseur sans expiration côté serveur (plans find() uniquement)
+          - raw:               RawBSONDocument au lieu de dicts (voir get_items)
+        Le curseur serveur est fermé même si le consommateur s'arrête avant la fin.
+        """
+        plan = self.compile_query(self._encode_filter(table, attributes), fields=fields, sort=sort, skip=skip, limit=limit, pipeline=pipeline)
+        cursor = self._plan_cursor(
+            table, plan, batch_size=batch_size, allow_disk_use=allow_disk_use, no_cursor_timeout=no_cursor_timeout, raw=raw
+        )
+        try:
+            if not chunk_size:
+                yield from cursor
+                return
+            chunk: List[Dict[str, Any]] = []
+            for doc in cursor:
+                chunk.append(doc)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            cursor.close()
+
+    def iter_items_by_attr(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+        **cursor_options: Any,
+    ) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Tous les documents correspondant à attributes, en flux (options: voir iter_items)."""
+        return self.iter_items(table, attributes, fields=fields, pipeline=pipeline, **cursor_options)
+
+    # ======================
+    # Partie 11 - Projets d'un user
+    # ======================
+    @instrumented
+    def get_projects_for_user(
+        self,
+        user_pid: str,
+        fields: Optional[List[str]] = None,
+        sort: Optional[Dict[str, int]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        return_stats: bool = False,
+    ) -> Union[List[Dict[str, Any]], Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+        """
+        Projets dont une team contient user_pid. Avec membership_index: une requête
+        indexée sur l'index d'appartenance puis un $in sur projects.pid; sinon deux
+        requêtes indexées (teams.members puis projects.teams), sans $lookup.
+        """
+        if self._membership is not None:
+            pids = self._membership.projects_for_user(user_pid)
+            attributes: Dict[str, Any] = {"pid": {"$in": pids}}
+        else:
+            teams = [t["pid"] for t in self.col("teams").find({"members": self._pids.encode(user_pid)}, {"pid": 1, "_id": 0})]
+            attributes = {"teams": {"$in": teams}}
+        return self.get_items("projects", attributes, fields=fields, sort=sort, skip=skip, limit=limit, return_stats=return_stats)
+
+    def rebuild_membership(self) -> int:
+        """Recalcule l'index d'appartenance depuis teams et projects. Retourne le nombre de lignes."""
+        if self._membership is None:
+            raise ValueError("Index d'appartenance désactivé (membership_index=False).")
+        return self._membership.rebuild()
+
+    def verify_membership(self, sample_size: int = 20) -> Dict[str, Any]:
+        """Compare l'index d'appartenance aux collections sources (missing / extra / mismatched)."""
+        if self._membership is None:
+            raise ValueError("Index d'appartenance désactivé (membership_index=False).")
+        return self._membership.verify(sample_size)
+
+    # ======================
+    # Partie 12 - Export / import
+    # ======================
+    def _id_ranges(self, table: str, partitions: int) -> List[Tuple[Any, Any]]:
+        """Intervalles [lo, hi) de _id de tailles voisines (quantiles d'un $sample)."""
+        if partitions <= 1:
+            return [(None, None)]
+        sample = [d["_id"] for d in self.col(table).aggregate([{"$sample": {"size": partitions * 32}}, {"$project": {"_id": 1}}])]
+        if len({type(i) for i in sample}) > 1:
+            # _id de types mélangés: les intervalles ne couvriraient pas tous les documents
+            return [(None, None)]
+        return id_ranges(sample, partitions)
+
+    def _related_collections(self, table: str) -> Dict[str, Collection]:
+        """Collections rattachées à table, exportées et réimportées avec elle: buckets des tableaux, archive."""
+        related = {f"{table}_{array}_buckets": self._buckets.col(table, array) for array in self._buckets.for_table(table, [])}
+        if table in self._tiers.policies:
+            related[archive_name(table)] = self._tiers.col(table)
+        return related
+
+    def _export_collection(self, name: str, path: str, format: str, compression: Optional[str], partitions: int, batch_size: int) -> Dict[str, Any]:
+        """Exporte la collection name dans path (voir export). Retourne partitions, documents et octets."""
+        ranges = self._id_ranges(name, partitions)
+        parts = [path] if len(ranges) == 1 else [f"{path}.part{i}" for i in range(len(ranges))]
+
+        def scan(i: int) -> Tuple[int, int]:
+            n = size = 0
+            cursor = self._raw_col(name).find(range_filter(*ranges[i]), batch_size=batch_size)
+            with open_file(parts[i], "wb", compression) as fp:
+                for doc in cursor:
+                    data = encode_doc(doc, format)
+                    fp.write(data)
+                    n += 1
+                    size += len(data)
+            return n, size
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                counts = map_in_context(pool, scan, range(len(ranges)))
+            if len(parts) > 1:
+                with open(path, "wb") as out:
+                    for part in parts:
+                        with open(part, "rb") as fp:
+                            shutil.copyfileobj(fp, out)
+        finally:
+            for part in parts:
+                if part != path and os.path.exists(part):
+                    os.remove(part)
+        return {
+            "path": path,
+            "partitions": len(ranges),
+            "documents": sum(n for n, _ in counts),
+            "bytes": sum(size for _, size in counts),
+            "fileBytes": os.path.getsize(path),
+        }
+
+    def export(
+        self,
+        table: str,
+        path: str,
+        format: Optional[str] = None,
+        partitions: int = 4,
+        compression: Optional[str] = None,
+        batch_size: int = 1000,
+    ) -> Dict[str, Any]:
+        """
+        Exporte toute la table dans path, en "ndjson" (Extended JSON relaxed, types conservés)
+        ou "bson" (documents bruts, comme mongodump). Format et compression ("gzip", "bz2",
+        "xz") sont déduits du nom si absents: projects.ndjson.gz, users.bson...
+        La table est découpée en `partitions` intervalles de _id (quantiles d'un $sample),
+        lus en parallèle (curseurs RawBSONDocument) dans des fichiers temporaires mis bout à bout.
+        Les collections rattachées (<table>_<tableau>_buckets, <table>_archive) sont exportées
+        à côté, avec les mêmes suffixes: projects_archive.ndjson.gz... (voir "related").
+        Retourne documents, octets et débit.
+        """
+        format, compression = infer_format(path, format, compression)
+        t0 = time.perf_counter()
+        main = self._export_collection(table, path, format, compression, partitions, batch_size)
+        related = {
+            name: self._export_collection(name, related_path(path, name), format, compression, partitions, batch_size)
+            for name in self._related_collections(table)
+        }
+        seconds = time.perf_counter() - t0
+        docs = main["documents"]
+        return {
+            "table": table,
+            "path": path,
+            "format": format,
+            "compression": compression,
+            "partitions": main["partitions"],
+            "documents": docs,
+            "bytes": main["bytes"],
+            "fileBytes": main["fileBytes"],
+            "related": {name: {"path": r["path"], "documents": r["documents"]} for name, r in related.items()},
+            "seconds": seconds,
+            "docsPerSecond": docs / seconds if seconds else 0.0,
+        }
+
+    @staticmethod
+    def _import_collection(
+        col: Collection,
+        path: str,
+        format: str,
+        compression: Optional[str],
+        prepare: Callable[[Any], Any],
+        chunk_size: int,
+        workers: int,
+    ) -> Tuple[int, int, int]:
+        """Insère le fichier path dans col par lots non ordonnés. Retourne (lus, insérés, erreurs)."""
+
+        def insert(chunk: List[Any]) -> Tuple[int, int]:
+            try:
+                col.insert_many(chunk, ordered=False)
+                return len(chunk), 0
+            except BulkWriteError as e:
+                return e.details.get("nInserted", 0), len(e.details.get("writeErrors", []))
+
+        docs = inserted = errors = 0
+        pending: set = set()
+
+        def collect(done: set) -> None:
+            nonlocal inserted, errors
+            for f in done:
+                ok, failed = f.result()
+                inserted += ok
+                errors += failed
+
+        with open_file(path, "rb", compression) as fp, ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk in chunks(map(prepare, iter_file(fp, format)), chunk_size):
+                docs += len(chunk)
+                pending.add(submit(pool, insert, chunk))
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(wait(pending)[0])
+        return docs, inserted, errors
+
+    def import_(
+        self,
+        table: str,
+        path: str,
+        format: Optional[str] = None,
+        compression: Optional[str] = None,
+        chunk_size: int = 1000,
+        workers: int = 4,
+        keep_pids: bool = True,
+        keep_audit: bool = True,
+        created_by: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Réimporte un fichier produit par export(), lu en flux et inséré par lots
+        non ordonnés de chunk_size documents (au plus 2 x workers lots en vol).
+          - keep_pids=False:  nouveaux pid et _id (clone; les références entrantes ne suivent pas)
+          - keep_audit=False: created_at/updated_at remis à maintenant, created_by=created_by
+        Avec pids et audit conservés, les documents BSON sont insérés sans décodage.
+        Les doublons (pid/_id déjà présents) sont comptés dans errors, le reste est inséré.
+        Les fichiers des collections rattachées présents à côté de path (voir export) sont
+        réimportés tels quels; ils référencent les pid d'origine, d'où une ValueError
+        avec keep_pids=False.
+        """
+        format, compression = infer_format(path, format, compression)
+        related = {
+            name: (col, related_path(path, name))
+            for name, col in self._related_collections(table).items()
+            if os.path.exists(related_path(path, name))
         }
-        return items, stats
+        if related and not keep_pids:
+            raise ValueError(f"keep_pids=False impossible: {sorted(related)} référencent les pid d'origine")
+        col = self.col(table, write=True)
+
+        def prepare(doc: Union[RawBSONDocument, Dict[str, Any]]) -> Union[RawBSONDocument, Dict[str, Any]]:
+            if keep_pids and keep_audit:
+                return doc
+            d = bson.decode(doc.raw) if isinstance(doc, RawBSONDocument) else doc
+            if not keep_audit:
+                pid = d.get("pid")
+                d = self._with_audit_on_create({k: v for k, v in d.items() if k not in AUDIT_FIELDS}, created_by)
+                if keep_pids and pid is not None:
+                    d["pid"] = pid
+            elif not keep_pids:
+                d["pid"] = self._pids.new()
+            if not keep_pids:
+                d.pop("_id", None)
+            return d
+
+        t0 = time.perf_counter()
+        docs, inserted, errors = self._import_collection(col, path, format, compression, prepare, chunk_size, workers)
+        related_stats: Dict[str, Dict[str, Any]] = {}
+        for name, (related_col, related_file) in related.items():
+            n, ok, failed = self._import_collection(related_col, related_file, format, compression, lambda d: d, chunk_size, workers)
+            related_stats[name] = {"path": related_file, "documents": n, "inserted": ok, "errors": failed}
+            self._on_write(name, None)
+
+        self._on_write(table, None)
+        if self._membership is not None and self._membership.tracks(table):
+            self._membership.rebuild()
+        for rollup in self._rollups.for_table(table):
+            self._rollups.rebuild(rollup.name)
+        seconds = time.perf_counter() - t0
+        return {
+            "table": table,
+            "path": path,
+            "format": format,
+            "compression": compression,
+            "documents": docs,
+            "inserted": inserted,
+            "errors": errors,
+            "related": related_stats,
+            "seconds": seconds,
+            "docsPerSecond": inserted / seconds if seconds else 0.0,
+        }
+
+    # ======================
+    # Partie 13 - Agrégation parallèle
+    # ======================
+    @instrumented
+    def parallel_aggregate(
+        self,
+        table: str,
+        pipeline: List[Dict[str, Any]],
+        partitions: int = 4,
+        allow_disk_use: Optional[bool] = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Exécute pipeline en parallèle sur `partitions` intervalles de _id quand il est décomposable:
+        étapes par document ($match, $project, $unwind, $lookup...), un $group aux accumulateurs
+        fusionnables ($sum, $count, $avg via somme/nombre, $min, $max, $push, $addToSet), puis
+        seulement $sort/$skip/$limit. Les partiels sont fusionnés en Python.
+        Sinon (ou partitions <= 1): une seule agrégation classique.
+        """
+        pipeline = self._encode_pipeline(table, pipeline)
+        plan = plan_parallel(pipeline) if partitions > 1 else None
+        note_plan({"parallel": plan is not None, "partitions": partitions if plan else 1})
+        options = self._aggregate_options(allow_disk_use=allow_disk_use)
+        if plan is None:
+            return list(self.col(table).aggregate(pipeline, **options))
+        ranges = self._id_ranges(table, partitions)
+        if len(ranges) == 1:
+            return list(self.col(table).aggregate(pipeline, **options))
+
+        def run(bounds: Tuple[Any, Any]) -> List[Dict[str, Any]]:
+            stages = [{"$match": range_filter(*bounds)}, *plan.prefix]
+            return list(self.col(table).aggregate(stages, **options))
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            partials = map_in_context(pool, run, ranges)
+        return merge_partials(plan, partials)
+
+    # ======================
+    # Partie 14 - Rollups
+    # ======================
+    def declare_rollup(self, name: str, table: str, by: str, op: str = "count", field: Optional[str] = None) -> None:
+        """
+        Déclare un compteur tenu à jour à chaque écriture sur table, par valeur de `by`:
+            declare_rollup("projects_by_tag", "projects", by="tags")
+            declare_rollup("budget_by_tag", "projects", by="tags", op="sum", field="budget")
+            declare_rollup("users_by_role", "users", by="role")
+        Les valeurs existantes ne sont pas comptées: appeler rebuild_rollups() après la déclaration.
+        """
+        if self._buckets.has(table, by.split(".", 1)[0]) or (field and self._buckets.has(table, field.split(".", 1)[0])):
+            raise ValueError(f"Rollup impossible sur un tableau en buckets ({table}).")
+        self._rollups.declare(Rollup(name, table, by, op, field))
+
+    def get_rollup(self, name: str, *key: Any) -> Any:
+        """get_rollup(name, key): valeur d'une clé (une lecture indexée); get_rollup(name): {clé: valeur}."""
+        return self._rollups.get(name, *key)
+
+    def rebuild_rollups(self, names: Optional[List[str]] = None, sample_size: int = 20) -> Dict[str, Dict[str, Any]]:
+        """Recalcule les rollups depuis les tables sources; retourne par rollup la dérive corrigée."""
+        return {name: self._rollups.rebuild(name, sample_size) for name in (names or list(self._rollups.rollups))}
+
+    # ======================
+    # Partie 15 - Pids
+    # ======================
+    def migrate_pids(self, tables: Optional[List[str]] = None, batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Réécrit pid et les références déclarées dans la stratégie de cette instance
+        (ex: Database(pid_strategy="uuid7").migrate_pids()). Les valeurs sont converties
+        sans perte (même valeur 128 bits), les liens entre tables restent donc valides.
+        À lancer écritures arrêtées; retourne par table le nombre de documents réécrits.
+        """
+        strategy = self._pids.strategy
+        report: Dict[str, int] = {}
+        for table in (tables if tables is not None else list(self._indexes)):
+            fields = sorted(self._pid_fields(table))
+            col = self._store_db[table]
+            ops: List[UpdateOne] = []
+            changed = 0
+            for doc in col.find({}, {f: 1 for f in fields}):
+                updates: Dict[str, Any] = {}
+                for f in fields:
+                    if f not in doc:
+                        continue
+                    value = doc[f]
+                    new = [convert_pid(strategy, v) for v in value] if isinstance(value, list) else convert_pid(strategy, value)
+                    if new != value:
+                        updates[f] = new
+                if updates:
+                    ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": updates}))
+                if len(ops) >= batch_size:
+                    changed += col.bulk_write(ops, ordered=False).modified_count
+                    ops = []
+            if ops:
+                changed += col.bulk_write(ops, ordered=False).modified_count
+            report[table] = changed
+            self._on_write(table)
+
+        if self._membership is not None:
+            self._membership.rebuild()
+        if self._rollups.rollups:
+            self.rebuild_rollups()
+        return report
+
+    # ======================
+    # Partie 16 - Tableaux en buckets
+    # ======================
+    def declare_bucketed_array(self, table: str, array: str, bucket_size: int = DEFAULT_BUCKET_SIZE, migrate: bool = True) -> int:
+        """
+        Stocke table.array hors du document, par buckets de bucket_size éléments
+        (voir buckets.py): un ajout ne réécrit plus le document et le test de doublon
+        passe par un index. array_push/pull_item_* gardent leur signature; get_item_by_pid
+        réassemble le tableau. get_items, les filtres et les $lookup ne voient plus ses
+        éléments: get_pids_by_array_item remplace le filtre d'appartenance.
+        Les update_* sur le tableau sont refusés (la copie embarquée serait ignorée à la lecture).
+        migrate=True déplace les éléments déjà embarqués. Retourne le nombre de documents migrés.
+        """
+        if self._membership is not None and self._membership.tracks(table, array):
+            raise ValueError(f"{table}.{array} est suivi par l'index d'appartenance.")
+        if any(array in r.roots() for r in self._rollups.for_table(table)):
+            raise ValueError(f"{table}.{array} est utilisé par un rollup.")
+        self._buckets.declare(table, array, bucket_size)
+        moved = self._buckets.migrate(table, array) if migrate else 0
+        self._on_write(table)
+        return moved
+
+    def get_pids_by_array_item(self, table: str, array: str, item: Any) -> List[str]:
+        """pids des documents dont le tableau en buckets contient item."""
+        if not self._buckets.has(table, array):
+            raise ValueError(f"{table}.{array} n'est pas en buckets (voir declare_bucketed_array).")
+        return self._buckets.owners(table, array, item)
+
+    # ======================
+    # Partie 18 - Archivage (tiers chaud / froid)
+    # ======================
+    def declare_tiering(
+        self,
+        table: str,
+        field: str = "updated_at",
+        older_than: timedelta = timedelta(days=365),
+        filter: Optional[Dict[str, Any]] = None,
+        expire_after: Optional[timedelta] = None,
+        batch_size: int = 1000,
+    ) -> TieringPolicy:
+        """
+        Archive les documents de table dont field est plus ancien que older_than
+        (et qui vérifient filter), ex. projets terminés:
+          db.declare_tiering("projects", "deadline", timedelta(days=90))
+        Les documents passent dans <table>_archive (mêmes index, plus un TTL sur
+        archived_at si expire_after) par archive_stale() ou le thread de start_tiering().
+        Un document archivé reste lisible avec include_archived=True; les update_*, delete_*
+        et array_* s'appliquent aussi à l'archive (sans effet sur les index dérivés, qui l'ignorent).
+        """
+        policy = TieringPolicy(table, field, older_than, self._encode_filter(table, filter or {}), expire_after, batch_size)
+        self._tiers.declare(policy)
+        return policy
+
+    def archive_stale(self, table: Optional[str] = None, max_batches: Optional[int] = None) -> Dict[str, int]:
+        """Déplace maintenant les documents éligibles (table ou toutes les politiques). Retourne le nombre par table."""
+        tables = [table] if table is not None else list(self._tiers.policies)
+        for t in tables:
+            if t not in self._tiers.policies:
+                raise ValueError(f"Aucune politique d'archivage pour {t} (voir declare_tiering).")
+        return {t: self._tiers.run(t, max_batches) for t in tables}
+
+    def start_tiering(self, interval: float = 3600.0) -> threading.Thread:
+        """Démarre le thread qui archive toutes les politiques, puis toutes les interval secondes."""
+        if self._tier_thread is not None and self._tier_thread.is_alive():
+            return self._tier_thread
+        self._tier_stop.clear()
+        self._tier_thread = threading.Thread(target=self._tiering_loop, args=(interval,), name="tiering-mover", daemon=True)
+        self._tier_thread.start()
+        return self._tier_thread
+
+    def stop_tiering(self, timeout: Optional[float] = None) -> None:
+        self._tier_stop.set()
+        if self._tier_thread is not None:
+            self._tier_thread.join(timeout)
+            self._tier_thread = None
+
+    def _tiering_loop(self, interval: float) -> None:
+        while not self._tier_stop.is_set():
+            for table in list(self._tiers.policies):
+                try:
+                    self._tiers.run(table, stop=self._tier_stop)
+                    self._tiers.stats[table]["lastError"] = None
+                except Exception as e:
+                    # Le thread continue (erreur réseau, document inattendu...): nouvel essai au prochain passage
+                    logger.exception("Archivage de %s en échec", table)
+                    self._tiers.stats[table]["lastError"] = str(e)
+            self._tier_stop.wait(interval)
+
+    def tiering_stats(self, table: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Par table: documents déplacés, lots, débit (docsPerSecond), dernier passage,
+        et taille des tiers {"hot", "archive"} (documents, octets de données et d'index).
+        """
+        tables = [table] if table is not None else list(self._tiers.policies)
+        return {t: self._tiers.report(t) for t in tables}
+
+    # ======================
+    # Partie 17 - Moteur en mémoire
+    # ======================
+    def snapshot(self, path: Optional[str] = None) -> str:
+        """
+        Écrit les données du moteur memory:// sur disque (par défaut le chemin de
+        l'URI memory:///chemin, aussi réécrit à la sortie du processus). Retourne le chemin.
+        """
+        save = getattr(self._client, "save", None)
+        if save is None:
+            raise ValueError("snapshot() n'est disponible qu'avec le moteur memory://.")
+        return save(path)
+
+    # ======================
+    # Cache des entités
+    # ======================
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Compteurs du cache par pid (hits, misses, evictions...), None si désactivé."""
+        return self._entity_cache.stats() if self._entity_cache is not None else None
+
+    def query_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Compteurs du cache de get_items (hits, misses, bytes, evictions...), None si désactivé."""
+        return self._query_cache.stats() if self._query_cache is not None else None
+
+    def watch_cache_invalidation(self, tables: Optional[List[str]] = None) -> threading.Thread:
+        """
+        Démarre un thread qui écoute le change stream de la base et invalide le cache
+        pour les écritures faites par d'autres processus (nécessite un replica set).
+        Les documents sont retrouvés par _id; sans _id en cache, toute la table est invalidée.
+        Le thread se reconnecte après une erreur (journalisée), en vidant le cache.
+        """
+        if self._entity_cache is None:
+            raise ValueError("Cache des entités désactivé (entity_cache_size=0).")
+        if self._cache_watcher is not None and self._cache_watcher.is_alive():
+            return self._cache_watcher
+        pipeline: List[Dict[str, Any]] = [{"$match": {"operationType": {"$ne": "insert"}}}]
+        if tables:
+            pipeline.append({"$match": {"ns.coll": {"$in": tables}}})
+        self._cache_watch_stop.clear()
+        self._cache_watcher = threading.Thread(
+            target=self._watch_cache_loop, args=(pipeline,), name="entity-cache-watch", daemon=True
+        )
+        self._cache_watcher.start()
+        return self._cache_watcher
+
+    def stop_cache_watch(self, timeout: Optional[float] = None) -> None:
+        self._cache_watch_stop.set()
+        if self._cache_watcher is not None:
+            self._cache_watcher.join(timeout)
+            self._cache_watcher = None
+
+    def _watch_cache_loop(self, pipeline: List[Dict[str, Any]]) -> None:
+        cache = self._entity_cache
+        retry = 1.0
+        while not self._cache_watch_stop.is_set():
+            try:
+                with self._db.watch(pipeline, max_await_time_ms=500) as stream:
+                    retry = 1.0
+                    while not self._cache_watch_stop.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        table = change.get("ns", {}).get("coll")
+                        if table is None:
+                            # dropDatabase / invalidate: on repart de zéro
+                            cache.clear()
+                            continue
+                        key = change.get("documentKey")
+                        if key and "_id" in key:
+                            cache.invalidate_ids(table, [key["_id"]])
+                        else:
+                            cache.invalidate(table)
+            except Exception:
+                logger.exception("Change stream du cache des entités interrompu, reconnexion dans %.0fs", retry)
+                # Des écritures ont pu échapper au flux pendant la coupure
+                cache.clear()
+                self._cache_watch_stop.wait(retry)
+                retry = min(retry * 2, 60.0)
+
+    # ======================
+    # Observabilité
+    # ======================
+    def metrics(self) -> Optional[Dict[str, Any]]:
+        """Latences par méthode et commandes par (méthode, table), None si désactivé."""
+        return self._metrics.as_dict() if self._metrics is not None else None
+
+    def metrics_prometheus(self, prefix: str = "db") -> str:
+        return self._metrics.prometheus(prefix) if self._metrics is not None else ""
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """Appels plus lents que slow_query_ms: plan compilé, commandes, explain("executionStats")."""
+        return list(self._metrics.slow_log) if self._metrics is not None else []
+
+    def _record_slow_call(self, ctx: CallContext, seconds: float) -> None:
+        entry, command = slow_entry(ctx, seconds)
+        if command is not None and self._metrics.explain_slow:
+            try:
+                entry["explain"] = self._db.command({"explain": command, "verbosity": "executionStats"})
+            except PyMongoError as e:
+                entry["explain"] = {"error": str(e)}
+        self._metrics.slow_log.append(entry)
@@ -0,0 +1,380 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.command_cursor import AsyncCommandCursor
+from pymongo.asynchronous.cursor import AsyncCursor
+from pymongo.asynchronous.database import AsyncDatabase as _AsyncMongoDatabase
+from pymongo.errors import OperationFailure
+
+from db import BaseDatabase, IndexKeys, get_client, release_client
+from query_compiler import QueryPlan
+
+
+class AsyncDatabase(BaseDatabase):
+    """
+    Version asyncio de Database (pymongo async), même API en coroutines:
+        db = AsyncDatabase()
+        await db.connect()
+        user = await db.get_item_by_pid("users", pid)
+    Audit, _normalize_fields, compilation des requêtes et stats viennent de
+    BaseDatabase: seules les entrées/sorties diffèrent de Database (pid_strategy et
+    conversion des pids compris, voir pids.py).
+    Les écritures invalident les caches des instances de Database ouvertes sur la
+    même base; elles sont refusées sur les tables à index dérivés (index
+    d'appartenance, rollups, tableaux en buckets, archivage), maintenus par Database.
+    """
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        db_name: Optional[str] = None,
+        server_selection_timeout_ms: int = 5000,
+        indexes: Optional[Dict[str, List[IndexKeys]]] = None,
+        auto_indexes: bool = True,
+        count_cache_ttl: float = 30.0,
+        count_cache_size: int = 1024,
+        pid_strategy: str = "uuid4",
+    ):
+        super().__init__(uri, db_name, indexes, auto_indexes, count_cache_ttl, count_cache_size, pid_strategy=pid_strategy)
+
+        # Client async partagé (voir get_client), ne se connecte qu'au premier appel
+        self._client = get_client(self._uri, asynchronous=True, serverSelectionTimeoutMS=server_selection_timeout_ms)
+        self._db: _AsyncMongoDatabase = self._client.get_database(self._db_name, codec_options=self._pids.codec_options)
+
+    async def connect(self) -> "AsyncDatabase":
+        """Vérifie la connexion et crée les index déclarés (équivalent du __init__ de Database)."""
+        await self._client.server_info()
+        if self._auto_indexes:
+            await self.ensure_indexes()
+        return self
+
+    async def close(self) -> None:
+        """Ferme le client partagé (une prochaine AsyncDatabase en ouvrira un nouveau)."""
+        release_client(self._client)
+        await self._client.close()
+
+    async def __aenter__(self) -> "AsyncDatabase":
+        return await self.connect()
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+    # -------- Helpers
+    async def col(self, table: str, write: bool = False) -> AsyncCollection:
+        """Voir Database.col: index d'une table non déclarée créés à la première écriture."""
+        if self._auto_indexes and table not in self._indexed_tables and (write or table in self._indexes):
+            self.declare_table(table)
+            await self.ensure_indexes([table])
+        return self._db[table]
+
+    async def ensure_indexes(self, tables: Optional[List[str]] = None, drop_extra: bool = False, fix: bool = False) -> Dict[str, Dict[str, List[str]]]:
+        """Voir Database.ensure_indexes (même déroulé: BaseDatabase._index_steps)."""
+        steps = self._index_steps(tables, drop_extra, fix)
+        result: Any = None
+        while True:
+            try:
+                op, table, arg = steps.send(result)
+            except StopIteration as done:
+                return done.value
+            col = self._db[table]
+            if op != "create_index":
+                result = await getattr(col, op)(*([] if arg is None else [arg]))
+                continue
+            try:
+                result = await col.create_index(arg["key"], **{k: v for k, v in arg.items() if k != "key"})
+            except OperationFailure as e:
+                result = e
+
+    def _check_write(self, table: str, fields: Optional[List[str]] = None) -> None:
+        """Avant une écriture: refusée si une instance de Database y maintient un index dérivé."""
+        for db in self._siblings():
+            features = db._derived_features(table, fields)
+            if features:
+                raise ValueError(f"Écriture async sur {table} refusée: {', '.join(features)} (à faire par Database).")
+
+    def _written(self, table: str, pids: Optional[List[str]] = None) -> None:
+        """Après une écriture: invalide les caches des instances ouvertes sur la même base."""
+        for db in self._siblings():
+            db._on_write(table, pids)
+
+    # ======================
+    # Partie 2 - CREATE
+    # ======================
+    async def create_item(self, table: str, item: Dict[str, Any], created_by: Optional[str] = None) -> Dict[str, Any]:
+        self._check_write(table)
+        doc = self._with_audit_on_create(self._encode_data(table, item), created_by)
+        await (await self.col(table, write=True)).insert_one(doc)
+        pid = self._pids.to_api(doc["pid"])
+        self._written(table, [pid])
+        return {"pid": pid}
+
+    async def create_items(self, table: str, items: List[Dict[str, Any]], created_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        self._check_write(table)
+        docs = [self._with_audit_on_create(self._encode_data(table, it), created_by) for it in items]
+        pids = [self._pids.to_api(d["pid"]) for d in docs]
+        if docs:
+            await (await self.col(table, write=True)).insert_many(docs)
+            self._written(table, pids)
+        return [{"pid": pid} for pid in pids]
+
+    # ======================
+    # Partie 4 - UPDATE
+    # ======================
+    async def update_items_by_attr(self, table: str, attributes: Dict[str, Any], items_data: Dict[str, Any], updated_by: Optional[str] = None) -> int:
+        self._check_write(table, list(items_data))
+        res = await (await self.col(table, write=True)).update_many(
+            self._encode_filter(table, attributes), self._with_audit_on_update(self._encode_data(table, items_data), updated_by)
+        )
+        self._written(table)
+        return res.modified_count
+
+    async def update_items_by_pids(self, table: str, pids: List[str], items_data: Dict[str, Any], updated_by: Optional[str] = None) -> int:
+        self._check_write(table, list(items_data))
+        res = await (await self.col(table, write=True)).update_many(
+            {"pid": {"$in": self._pids.encode_pids(pids)}}, self._with_audit_on_update(self._encode_data(table, items_data), updated_by)
+        )
+        self._written(table, pids)
+        return res.modified_count
+
+    async def update_item_by_attr(self, table: str, attributes: Dict[str, Any], item_data: Dict[str, Any], updated_by: Optional[str] = None) -> bool:
+        self._check_write(table, list(item_data))
+        res = await (await self.col(table, write=True)).update_one(
+            self._encode_filter(table, attributes), self._with_audit_on_update(self._encode_data(table, item_data), updated_by)
+        )
+        self._written(table)
+        return res.modified_count > 0
+
+    async def update_item_by_pid(self, table: str, pid: str, item_data: Dict[str, Any], updated_by: Optional[str] = None) -> bool:
+        self._check_write(table, list(item_data))
+        res = await (await self.col(table, write=True)).update_one(
+            {"pid": self._pids.encode(pid)}, self._with_audit_on_update(self._encode_data(table, item_data), updated_by)
+        )
+        self._written(table, [pid])
+        return res.modified_count > 0
+
+    # ======================
+    # Partie 5 - GET simples
+    # ======================
+    async def get_item_by_attr(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        plan = self.compile_query(self._encode_filter(table, attributes), fields=fields, limit=1, pipeline=pipeline)
+        if plan.kind == "find":
+            return await (await self.col(table)).find_one(plan.filter, plan.projection)
+        docs = await (await self._plan_cursor(table, plan)).to_list(1)
+        return docs[0] if docs else None
+
+    async def get_item_by_pid(
+        self,
+        table: str,
+        pid: str,
+        fields: Optional[List[str]] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        return await self.get_item_by_attr(table, {"pid": pid}, fields=fields, pipeline=pipeline)
+
+    # ======================
+    # Partie 6 - DELETE
+    # ======================
+    async def delete_items_by_attr(self, table: str, attributes: Dict[str, Any]) -> int:
+        self._check_write(table)
+        res = await (await self.col(table, write=True)).delete_many(self._encode_filter(table, attributes))
+        self._written(table)
+        return res.deleted_count
+
+    async def delete_items_by_pids(self, table: str, pids: List[str]) -> int:
+        self._check_write(table)
+        res = await (await self.col(table, write=True)).delete_many({"pid": {"$in": self._pids.encode_pids(pids)}})
+        self._written(table, pids)
+        return res.deleted_count
+
+    async def delete_item_by_attr(self, table: str, attributes: Dict[str, Any]) -> bool:
+        self._check_write(table)
+        res = await (await self.col(table, write=True)).delete_one(self._encode_filter(table, attributes))
+        self._written(table)
+        return res.deleted_count > 0
+
+    async def delete_item_by_pid(self, table: str, pid: str) -> bool:
+        self._check_write(table)
+        res = await (await self.col(table, write=True)).delete_one({"pid": self._pids.encode(pid)})
+        self._written(table, [pid])
+        return res.deleted_count > 0
+
+    # ======================
+    # Partie 7 - ARRAYS
+    # ======================
+    async def array_push_item_by_attr(self, table: str, attributes: Dict[str, Any], array: str, new_item: Any, updated_by: Optional[str] = None) -> int:
+        self._check_write(table, [array])
+        res = await (await self.col(table, write=True)).update_many(
+            self._encode_filter(table, attributes),
+            {"$addToSet": {array: self._encode_ref(table, array, new_item)}, **self._with_audit_on_update({}, updated_by)}
+        )
+        self._written(table)
+        return res.modified_count
+
+    async def array_push_item_by_pid(self, table: str, pid: str, array: str, new_item: Any, updated_by: Optional[str] = None) -> bool:
+        self._check_write(table, [array])
+        res = await (await self.col(table, write=True)).update_one(
+            {"pid": self._pids.encode(pid)},
+            {"$addToSet": {array: self._encode_ref(table, array, new_item)}, **self._with_audit_on_update({}, updated_by)}
+        )
+        self._written(table, [pid])
+        return res.modified_count > 0
+
+    async def array_pull_item_by_attr(self, table: str, attributes: Dict[str, Any], array: str, item_attr: Union[Any, Dict[str, Any]], updated_by: Optional[str] = None) -> int:
+        self._check_write(table, [array])
+        res = await (await self.col(table, write=True)).update_many(
+            self._encode_filter(table, attributes),
+            {"$pull": {array: self._encode_ref(table, array, item_attr)}, **self._with_audit_on_update({}, updated_by)}
+        )
+        self._written(table)
+        return res.modified_count
+
+    async def array_pull_item_by_pid(self, table: str, pid: str, array: str, item_attr: Union[Any, Dict[str, Any]], updated_by: Optional[str] = None) -> bool:
+        self._check_write(table, [array])
+        res = await (await self.col(table, write=True)).update_one(
+            {"pid": self._pids.encode(pid)},
+            {"$pull": {array: self._encode_ref(table, array, item_attr)}, **self._with_audit_on_update({}, updated_by)}
+        )
+        self._written(table, [pid])
+        return res.modified_count > 0
+
+    # ======================
+    # Exécution des plans
+    # ======================
+    async def _plan_cursor(
+        self,
+        table: str,
+        plan: QueryPlan,
+        batch_size: Optional[int] = None,
+        allow_disk_use: Optional[bool] = None,
+        no_cursor_timeout: bool = False,
+    ) -> Union[AsyncCursor, AsyncCommandCursor]:
+        col = await self.col(table)
+        if plan.kind == "find":
+            opts = self._find_options(plan, batch_size, allow_disk_use, no_cursor_timeout)
+            return col.find(plan.filter, plan.projection, **opts)
+        return await col.aggregate(plan.stages, **self._aggregate_options(batch_size, allow_disk_use))
+
+    async def _plan_list(self, table: str, plan: QueryPlan) -> List[Dict[str, Any]]:
+        return await (await self._plan_cursor(table, plan)).to_list()
+
+    async def _plan_count(self, table: str, plan: QueryPlan) -> int:
+        col = await self.col(table)
+        if plan.count_stages is None:
+            return await col.count_documents(plan.filter)
+        docs = await (await col.aggregate(plan.count_stages)).to_list()
+        return int(docs[0].get("count", 0)) if docs else 0
+
+    async def _plan_page_and_count(self, table: str, plan: QueryPlan) -> Tuple[List[Dict[str, Any]], int]:
+        docs = await (await (await self.col(table)).aggregate(plan.facet_stages())).to_list()
+        res = docs[0] if docs else {"items": [], "total": []}
+        total = res["total"][0]["count"] if res["total"] else 0
+        return res["items"], int(total)
+
+    # ======================
+    # Partie 8 - GET avancée
+    # ======================
+    async def get_items(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        sort: Optional[Dict[str, int]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        return_stats: bool = False,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+        count_mode: str = "exact",
+    ) -> Union[List[Dict[str, Any]], Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+        """Voir Database.get_items."""
+        self._check_count_mode(count_mode)
+        plan = self.compile_query(self._encode_filter(table, attributes), fields=fields, sort=sort, skip=skip, limit=limit, pipeline=pipeline)
+
+        if not return_stats:
+            return await self._plan_list(table, plan)
+
+        steps = self._stats_steps(table, plan, skip, limit, count_mode)
+        result: Any = None
+        while True:
+            try:
+                op = steps.send(result)
+            except StopIteration as done:
+                return done.value
+            if op == "list":
+                result = await self._plan_list(table, plan)
+            elif op == "page_and_count":
+                result = await self._plan_page_and_count(table, plan)
+            elif op == "count":
+                result = await self._plan_count(table, plan)
+            else:
+                result = await (await self.col(table)).estimated_document_count()
+
+    # ======================
+    # Partie 9 - Pagination par curseur
+    # ======================
+    async def get_items_page(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        sort: Optional[Dict[str, int]] = None,
+        page_size: int = 50,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Voir Database.get_items_page."""
+        plan, sort_keys = self._keyset_plan(self._encode_filter(table, attributes), sort, page_size, after, fields, pipeline)
+        items = await self._plan_list(table, plan)
+        return self._keyset_page(items, page_size, sort_keys)
+
+    # ======================
+    # Partie 10 - Lecture en flux
+    # ======================
+    async def iter_items(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        sort: Optional[Dict[str, int]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+        batch_size: Optional[int] = 1000,
+        chunk_size: Optional[int] = None,
+        allow_disk_use: Optional[bool] = None,
+        no_cursor_timeout: bool = False,
+    ) -> AsyncIterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Voir Database.iter_items (async for doc in db.iter_items(...))."""
+        plan = self.compile_query(self._encode_filter(table, attributes), fields=fields, sort=sort, skip=skip, limit=limit, pipeline=pipeline)
+        cursor = await self._plan_cursor(
+            table, plan, batch_size=batch_size, allow_disk_use=allow_disk_use, no_cursor_timeout=no_cursor_timeout
+        )
+        try:
+            chunk: List[Dict[str, Any]] = []
+            async for doc in cursor:
+                if not chunk_size:
+                    yield doc
+                    continue
+                chunk.append(doc)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            await cursor.close()
+
+    def iter_items_by_attr(
+        self,
+        table: str,
+        attributes: Dict[str, Any],
+        fields: Optional[List[str]] = None,
+        pipeline: Optional[List[Dict[str, Any]]] = None,
+        **cursor_options: Any,
+    ) -> AsyncIterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        return self.iter_items(table, attributes, fields=fields, pipeline=pipeline, **cursor_options)
@@ -0,0 +1,139 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+CacheKey = Tuple[str, str, Hashable]
+
+
+def projection_key(proj: Optional[Dict[str, int]]) -> Hashable:
+    """Clé hashable d'une projection (None = tous les champs)."""
+    return None if proj is None else tuple(sorted(proj.items()))
+
+
+class EntityCache:
+    """
+    Cache LRU + TTL des documents lus par pid, clé (table, pid, projection).
+    Index secondaires pour invalider:
+      - toutes les projections d'un pid      -> invalidate(table, [pid])
+      - toute une table                      -> invalidate(table)
+      - un document par son _id (change stream) -> invalidate_ids(table, [_id])
+    Les documents sont copiés à l'entrée et à la sortie (l'appelant peut les modifier).
+    Thread-safe: le listener de change stream tourne dans un autre thread.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._by_pid: Dict[Tuple[str, str], Set[CacheKey]] = {}
+        self._pid_by_id: Dict[Tuple[str, Any], str] = {}
+        # Incrémenté à chaque invalidation d'une table (évite de remettre en cache
+        # un document lu avant une écriture concurrente)
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, table: str, pid: str, proj: Optional[Dict[str, int]]) -> Optional[Dict[str, Any]]:
+        key = (table, pid, projection_key(proj))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def generation(self, table: str) -> int:
+        return self._generations.get(table, 0)
+
+    def put(
+        self,
+        table: str,
+        pid: str,
+        proj: Optional[Dict[str, int]],
+        doc: Dict[str, Any],
+        generation: Optional[int] = None,
+    ) -> None:
+        key = (table, pid, projection_key(proj))
+        with self._lock:
+            if generation is not None and generation != self.generation(table):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(doc))
+            self._entries.move_to_end(key)
+            self._by_pid.setdefault((table, pid), set()).add(key)
+            if "_id" in doc:
+                self._pid_by_id[(table, doc["_id"])] = pid
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, table: str, pids: Optional[Iterable[str]] = None) -> None:
+        """Invalide les pids donnés, ou toute la table si pids est None."""
+        with self._lock:
+            self._generations[table] = self.generation(table) + 1
+            if pids is None:
+                keys = [k for k in self._entries if k[0] == table]
+            else:
+                keys = [k for pid in pids for k in self._by_pid.get((table, pid), ())]
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+
+    def invalidate_ids(self, table: str, ids: Iterable[Any]) -> None:
+        """
+        Invalide les documents par _id. Un _id inconnu peut être en cache sous une
+        projection sans _id (ou déjà évincé): toute la table est alors invalidée.
+        """
+        with self._lock:
+            pids = []
+            for _id in ids:
+                pid = self._pid_by_id.pop((table, _id), None)
+                if pid is None:
+                    self.invalidate(table)
+                    return
+                pids.append(pid)
+            self.invalidate(table, pids)
+
+    def clear(self) -> None:
+        with self._lock:
+            # Les lectures en cours ne doivent pas remettre en cache un état antérieur
+            for table in {k[0] for k in self._entries} | set(self._generations):
+                self._generations[table] = self.generation(table) + 1
+            self._entries.clear()
+            self._by_pid.clear()
+            self._pid_by_id.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxSize": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": (self.hits / lookups) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        table, pid, _ = key
+        keys = self._by_pid.get((table, pid))
+        if keys is not None:
+            keys.discard(key)
+            if keys:
+                return
+            del self._by_pid[(table, pid)]
+        if entry is not None and "_id" in entry[1]:
+            self._pid_by_id.pop((table, entry[1]["_id"]), None)
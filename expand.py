@@ -0,0 +1,50 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+# "teams.members" -> {"teams": {"members": {}}}
+ExpandTree = Dict[str, "ExpandTree"]
+
+
+def parse_expand(paths: Iterable[str]) -> ExpandTree:
+    """Arbre des références à résoudre, à partir des chemins pointés."""
+    tree: ExpandTree = {}
+    for path in paths:
+        node = tree
+        for part in path.split("."):
+            if not part:
+                raise ValueError(f"Chemin d'expansion invalide: {path!r}")
+            node = node.setdefault(part, {})
+    return tree
+
+
+def with_expand_roots(fields: Optional[List[str]], tree: ExpandTree) -> Optional[List[str]]:
+    """Ajoute aux champs demandés les champs de référence à expanser (fields == [] : déjà tous)."""
+    if fields is not None and len(fields) == 0:
+        return fields
+    return list(dict.fromkeys([*(fields or []), *tree]))
+
+
+def collect_refs(docs: Iterable[Dict[str, Any]], field: str, into: Dict[str, None]) -> None:
+    """Ajoute à `into` (dict ordonné, sans doublon) les pids référencés par field."""
+    for doc in docs:
+        value = doc.get(field)
+        for ref in value if isinstance(value, list) else [value]:
+            if isinstance(ref, str):
+                into[ref] = None
+
+
+def stitch(docs: Iterable[Dict[str, Any]], field: str, by_pid: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Remplace les pids de field par les documents trouvés. Une référence absente
+    est retirée d'une liste, ou devient None pour une valeur simple.
+    Un même document référencé plusieurs fois est partagé (même objet).
+    """
+    for doc in docs:
+        value = doc.get(field)
+        if isinstance(value, list):
+            doc[field] = [
+                by_pid[ref] if isinstance(ref, str) else ref
+                for ref in value
+                if not isinstance(ref, str) or ref in by_pid
+            ]
+        elif isinstance(value, str):
+            doc[field] = by_pid.get(value)
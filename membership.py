@@ -0,0 +1,277 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.collection import Collection
+
+if TYPE_CHECKING:
+    from db import Database
+
+MEMBERSHIP_TABLE = "user_projects"
+TEAMS_TABLE, MEMBERS_FIELD = "teams", "members"
+PROJECTS_TABLE, PROJECT_TEAMS_FIELD = "projects", "teams"
+
+Edge = Tuple[str, str, str]  # (user, project, team)
+
+
+class MembershipIndex:
+    """
+    Index dénormalisé user -> projects, maintenu à chaque écriture sur
+    teams.members et projects.teams. Une ligne par couple (user, project):
+        {"user": <pid>, "project": <pid>, "teams": [<pid des teams qui les relient>]}
+    Une ligne disparaît quand sa liste teams devient vide. L'index reflète
+    exactement teams.members x projects.teams (comme le $lookup qu'il remplace):
+    supprimer un user ne le retire pas des teams, donc pas de l'index.
+    Index: (user, project) unique, (project), (teams).
+    Les pids y sont dans leur représentation stockée (voir pids.py): les pids
+    reçus de l'API sont convertis à l'entrée des méthodes de dispatch.
+    """
+
+    def __init__(self, db: "Database", table: str = MEMBERSHIP_TABLE, batch_size: int = 1000):
+        self._db = db
+        self.table = table
+        self.batch_size = batch_size
+        self._indexed = False
+
+    @property
+    def col(self) -> Collection:
+        col = self._db._store_db[self.table]
+        if not self._indexed:
+            col.create_index([("user", ASCENDING), ("project", ASCENDING)], unique=True)
+            col.create_index([("project", ASCENDING)])
+            col.create_index([("teams", ASCENDING)])
+            self._indexed = True
+        return col
+
+    def _source(self, table: str) -> Collection:
+        return self._db._store_db[table]
+
+    # -------- Dispatch depuis Database
+    def tracks(self, table: str, field: Optional[str] = None) -> bool:
+        """field=None: la table est-elle suivie (créations, suppressions) ? Sinon: ce champ l'est-il ?"""
+        if field is None:
+            return table in (TEAMS_TABLE, PROJECTS_TABLE)
+        root = field.split(".", 1)[0]
+        return (table, root) in ((TEAMS_TABLE, MEMBERS_FIELD), (PROJECTS_TABLE, PROJECT_TEAMS_FIELD))
+
+    def created(self, table: str, docs: List[Dict[str, Any]]) -> None:
+        if table == TEAMS_TABLE:
+            self.teams_created(docs)
+        elif table == PROJECTS_TABLE:
+            self.projects_created(docs)
+
+    def deleted(self, table: str, pids: List[str]) -> None:
+        pids = self._db._pids.encode_pids(pids)
+        if table == TEAMS_TABLE:
+            self.teams_deleted(pids)
+        elif table == PROJECTS_TABLE:
+            self.projects_deleted(pids)
+
+    def resync(self, table: str, pids: List[str]) -> None:
+        pids = self._db._pids.encode_pids(pids)
+        if table == TEAMS_TABLE:
+            self.resync_teams(pids)
+        elif table == PROJECTS_TABLE:
+            self.resync_projects(pids)
+
+    def pushed(self, table: str, pids: List[str], new_item: Any) -> None:
+        """$addToSet de new_item (valeur ou {"$each": [...]}) sur le tableau suivi de pids."""
+        values = new_item["$each"] if isinstance(new_item, dict) and "$each" in new_item else [new_item]
+        pids, values = self._db._pids.encode_pids(pids), self._db._pids.encode_pids(values)
+        for pid in pids:
+            if table == TEAMS_TABLE:
+                self.members_added(pid, values)
+            else:
+                self.teams_added(pid, values)
+
+    def pulled(self, table: str, pids: List[str], item_attr: Any) -> None:
+        """$pull de item_attr (valeur, {"$in": [...]} ou condition quelconque -> resync)."""
+        if isinstance(item_attr, dict):
+            if set(item_attr) != {"$in"}:
+                self.resync(table, pids)
+                return
+            values = list(item_attr["$in"])
+        else:
+            values = [item_attr]
+        pids, values = self._db._pids.encode_pids(pids), self._db._pids.encode_pids(values)
+        for pid in pids:
+            if table == TEAMS_TABLE:
+                self.members_removed(pid, values)
+            else:
+                self.teams_removed(pid, values)
+
+    # -------- Écritures élémentaires
+    def _add_edges(self, edges: Iterable[Edge]) -> None:
+        ops: List[UpdateOne] = []
+        for user, project, team in edges:
+            ops.append(UpdateOne({"user": user, "project": project}, {"$addToSet": {"teams": team}}, upsert=True))
+            if len(ops) >= self.batch_size:
+                self.col.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            self.col.bulk_write(ops, ordered=False)
+        self._db._bump(self.table)
+
+    def _remove_teams(self, flt: Dict[str, Any], teams: List[str]) -> None:
+        if not teams:
+            return
+        self.col.update_many({**flt, "teams": {"$in": teams}}, {"$pullAll": {"teams": teams}})
+        self.col.delete_many({**flt, "teams": {"$size": 0}})
+        self._db._bump(self.table)
+
+    def _projects_of_team(self, team: str) -> List[str]:
+        cursor = self._source(PROJECTS_TABLE).find({PROJECT_TEAMS_FIELD: team}, {"pid": 1, "_id": 0})
+        return [p["pid"] for p in cursor]
+
+    def _members_of_teams(self, teams: List[str]) -> Dict[str, List[str]]:
+        cursor = self._source(TEAMS_TABLE).find({"pid": {"$in": teams}}, {"pid": 1, MEMBERS_FIELD: 1, "_id": 0})
+        return {t["pid"]: list(t.get(MEMBERS_FIELD) or []) for t in cursor}
+
+    # -------- Événements (appelés par Database après l'écriture source)
+    def members_added(self, team: str, users: List[str]) -> None:
+        projects = self._projects_of_team(team)
+        self._add_edges((u, p, team) for u in users for p in projects)
+
+    def members_removed(self, team: str, users: List[str]) -> None:
+        self._remove_teams({"user": {"$in": users}}, [team])
+
+    def teams_added(self, project: str, teams: List[str]) -> None:
+        members = self._members_of_teams(teams)
+        self._add_edges((u, project, t) for t, users in members.items() for u in users)
+
+    def teams_removed(self, project: str, teams: List[str]) -> None:
+        self._remove_teams({"project": project}, teams)
+
+    def teams_created(self, docs: List[Dict[str, Any]]) -> None:
+        members = {d["pid"]: list(d[MEMBERS_FIELD]) for d in docs if d.get(MEMBERS_FIELD)}
+        if not members:
+            return
+        # Une seule requête pour toutes les nouvelles teams (en général aucun projet ne les référence encore)
+        cursor = self._source(PROJECTS_TABLE).find(
+            {PROJECT_TEAMS_FIELD: {"$in": list(members)}}, {"pid": 1, PROJECT_TEAMS_FIELD: 1, "_id": 0}
+        )
+        self._add_edges(
+            (u, p["pid"], t)
+            for p in cursor
+            for t in p.get(PROJECT_TEAMS_FIELD) or []
+            if t in members
+            for u in members[t]
+        )
+
+    def projects_created(self, docs: List[Dict[str, Any]]) -> None:
+        teams_by_project = {d["pid"]: list(d[PROJECT_TEAMS_FIELD]) for d in docs if d.get(PROJECT_TEAMS_FIELD)}
+        if not teams_by_project:
+            return
+        members = self._members_of_teams(list({t for teams in teams_by_project.values() for t in teams}))
+        self._add_edges(
+            (u, p, t) for p, teams in teams_by_project.items() for t in teams for u in members.get(t, [])
+        )
+
+    def teams_deleted(self, teams: List[str]) -> None:
+        self._remove_teams({}, teams)
+
+    def projects_deleted(self, projects: List[str]) -> None:
+        if projects:
+            self.col.delete_many({"project": {"$in": projects}})
+            self._db._bump(self.table)
+
+    def resync_teams(self, teams: List[str]) -> None:
+        """Recalcule les lignes d'une team (après un $set/$pull par condition sur members)."""
+        members = self._members_of_teams(teams)
+        for team in teams:
+            users = members.get(team, [])
+            self._remove_teams({"user": {"$nin": users}}, [team])
+            self.members_added(team, users)
+
+    def resync_projects(self, projects: List[str]) -> None:
+        cursor = self._source(PROJECTS_TABLE).find({"pid": {"$in": projects}}, {"pid": 1, PROJECT_TEAMS_FIELD: 1, "_id": 0})
+        current = {p["pid"]: list(p.get(PROJECT_TEAMS_FIELD) or []) for p in cursor}
+        for project in projects:
+            teams = current.get(project, [])
+            self.col.update_many({"project": project}, {"$pull": {"teams": {"$nin": teams}}})
+            self.col.delete_many({"project": project, "teams": {"$size": 0}})
+            self._db._bump(self.table)
+            if teams:
+                self.teams_added(project, teams)
+
+    def clear(self) -> None:
+        """Vide l'index (table source supprimée)."""
+        self._db._store_db.drop_collection(self.table)
+        self._indexed = False
+        self._db._bump(self.table)
+
+    # -------- Lecture
+    def projects_for_user(self, user: str) -> List[Any]:
+        user = self._db._pids.encode(user)
+        return [r["project"] for r in self.col.find({"user": user}, {"project": 1, "_id": 0})]
+
+    # -------- Reconstruction / vérification
+    def _expected_pipeline(self) -> List[Dict[str, Any]]:
+        """Lignes attendues, calculées côté serveur depuis projects et teams."""
+        return [
+            {"$project": {"_id": 0, "pid": 1, PROJECT_TEAMS_FIELD: 1}},
+            {"$unwind": f"${PROJECT_TEAMS_FIELD}"},
+            {"$lookup": {"from": TEAMS_TABLE, "localField": PROJECT_TEAMS_FIELD, "foreignField": "pid", "as": "t"}},
+            {"$unwind": "$t"},
+            {"$unwind": f"$t.{MEMBERS_FIELD}"},
+            {"$group": {"_id": {"user": f"$t.{MEMBERS_FIELD}", "project": "$pid"}, "teams": {"$addToSet": f"${PROJECT_TEAMS_FIELD}"}}},
+            {"$project": {"_id": 0, "user": "$_id.user", "project": "$_id.project", "teams": 1}},
+        ]
+
+    def rebuild(self) -> int:
+        """Recalcule tout l'index ($out dans une collection temporaire puis renommage)."""
+        tmp = f"{self.table}_rebuild"
+        self._source(PROJECTS_TABLE).aggregate(self._expected_pipeline() + [{"$out": tmp}], allowDiskUse=True)
+        tmp_col = self._db._store_db[tmp]
+        if tmp_col.estimated_document_count() == 0:
+            self._db._store_db.drop_collection(self.table)
+            self._db._store_db.drop_collection(tmp)
+        else:
+            tmp_col.rename(self.table, dropTarget=True)
+        self._indexed = False
+        self._db._bump(self.table)
+        return self.col.count_documents({})
+
+    def verify(self, sample_size: int = 20) -> Dict[str, Any]:
+        """
+        Compare l'index aux collections sources (parcours fusionné trié par (user, project)).
+        Retourne les compteurs missing / extra / mismatched et quelques exemples.
+        """
+        expected = self._source(PROJECTS_TABLE).aggregate(
+            self._expected_pipeline() + [{"$sort": {"user": 1, "project": 1}}], allowDiskUse=True
+        )
+        actual = self.col.find({}, {"_id": 0, "user": 1, "project": 1, "teams": 1}).sort([("user", 1), ("project", 1)])
+        report: Dict[str, Any] = {"checked": 0, "missing": 0, "extra": 0, "mismatched": 0, "samples": []}
+
+        def sample(kind: str, row: Dict[str, Any]) -> None:
+            report[kind] += 1
+            if len(report["samples"]) < sample_size:
+                report["samples"].append({"kind": kind, **row})
+
+        for exp, act in _merge_sorted(expected, actual):
+            report["checked"] += 1
+            if act is None:
+                sample("missing", exp)
+            elif exp is None:
+                sample("extra", act)
+            elif set(exp["teams"]) != set(act.get("teams") or []):
+                sample("mismatched", {"user": exp["user"], "project": exp["project"], "expected": sorted(exp["teams"]), "actual": sorted(act.get("teams") or [])})
+        report["ok"] = not (report["missing"] or report["extra"] or report["mismatched"])
+        return report
+
+
+def _merge_sorted(left: Iterable[Dict[str, Any]], right: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """Parcours fusionné de deux flux triés par (user, project)."""
+    li, ri = iter(left), iter(right)
+    lv, rv = next(li, None), next(ri, None)
+    while lv is not None or rv is not None:
+        lk = (lv["user"], lv["project"]) if lv is not None else None
+        rk = (rv["user"], rv["project"]) if rv is not None else None
+        if rk is None or (lk is not None and lk < rk):
+            yield lv, None
+            lv = next(li, None)
+        elif lk is None or rk < lk:
+            yield None, rv
+            rv = next(ri, None)
+        else:
+            yield lv, rv
+            lv, rv = next(li, None), next(ri, None)
@@ -0,0 +1,1782 @@
+import atexit
+import bisect
+import mmap
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
+
+import bson
+from bson import ObjectId
+from bson.codec_options import DEFAULT_CODEC_OPTIONS, CodecOptions
+from bson.raw_bson import RawBSONDocument
+from bson.regex import Regex
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+from bson_order import MISSING, bson_order as _key
+
+# Moteur en mémoire compatible avec le sous-ensemble de l'API pymongo utilisé par
+# Database (find/aggregate/écritures/index/bulk_write). URI:
+#   memory://            base du processus, perdue à la sortie
+#   memory://nom         autre base indépendante
+#   memory:///chemin.db  chargée depuis ce snapshot au démarrage et réécrite à la sortie
+# Les documents sont stockés encodés en BSON (un bytes par document); les index
+# sont des tables de hachage (égalité, $in, $lookup) doublées à la demande d'une
+# liste triée (intervalles, tri + limit).
+
+SNAPSHOT_MAGIC = b"MEMDB\x01"
+
+_MISSING = MISSING
+_TTL_INTERVAL = 1.0
+
+_SERVERS: Dict[str, "_Server"] = {}
+_SERVERS_LOCK = threading.Lock()
+
+
+# ======================
+# Valeurs: chemins, égalité, ordre BSON
+# ======================
+def _hashable(value: Any) -> Hashable:
+    if isinstance(value, (dict, list)):
+        return bson.encode({"v": value})
+    return value
+
+
+def _values(doc: Any, path: str) -> List[Any]:
+    """Valeurs atteintes par un chemin pointé, en traversant les tableaux de documents (vide si absent)."""
+    return _resolve(doc, path.split("."))
+
+
+def _resolve(value: Any, parts: List[str]) -> List[Any]:
+    if not parts:
+        return [value]
+    head, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        return _resolve(value[head], rest) if head in value else []
+    if isinstance(value, list):
+        out: List[Any] = []
+        if head.isdigit() and int(head) < len(value):
+            out += _resolve(value[int(head)], rest)
+        for item in value:
+            if isinstance(item, dict):
+                out += _resolve(item, parts)
+        return out
+    return []
+
+
+def _flat(values: List[Any]) -> List[Any]:
+    out: List[Any] = []
+    for v in values:
+        out.extend(v if isinstance(v, list) else [v])
+    return out
+
+
+def _eq(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    try:
+        return a == b
+    except TypeError:
+        return False
+
+
+def _sort_key(doc: Dict[str, Any], field: str, direction: int) -> Tuple[Any, ...]:
+    """Tableau: plus petit élément en tri croissant, plus grand en décroissant (comme MongoDB)."""
+    values = _flat(_values(doc, field))
+    if not values:
+        return (1, 0)
+    keys = [_key(v) for v in values]
+    return min(keys) if direction > 0 else max(keys)
+
+
+def _sort_docs(docs: List[Dict[str, Any]], sort: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda d, f=field, s=direction: _sort_key(d, f, s), reverse=direction < 0)
+    return docs
+
+
+def _normalize_sort(sort: Any, direction: Optional[int] = None) -> Optional[List[Tuple[str, int]]]:
+    if not sort:
+        return None
+    if isinstance(sort, str):
+        return [(sort, direction or 1)]
+    if isinstance(sort, dict):
+        return [(k, int(v)) for k, v in sort.items()]
+    return [(k, int(v)) for k, v in sort]
+
+
+def _get_path(doc: Any, path: str) -> Any:
+    """Valeur d'un chemin pour une expression d'agrégation ("$a.b"): les tableaux donnent des tableaux."""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            value = [v[part] for v in value if isinstance(v, dict) and part in v]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    cur: Any = doc
+    for part in parts[:-1]:
+        if isinstance(cur, list) and part.isdigit():
+            cur = cur[int(part)]
+            continue
+        nxt = cur.get(part)
+        if not isinstance(nxt, (dict, list)):
+            nxt = cur[part] = {}
+        cur = nxt
+    last = parts[-1]
+    if isinstance(cur, list) and last.isdigit():
+        i = int(last)
+        cur.extend([None] * (i + 1 - len(cur)))
+        cur[i] = value
+    else:
+        cur[last] = value
+
+
+def _parent(doc: Dict[str, Any], path: str) -> Tuple[Any, str]:
+    """(conteneur, dernière clé) d'un chemin, sans rien créer (conteneur None si absent)."""
+    parts = path.split(".")
+    cur: Any = doc
+    for part in parts[:-1]:
+        if isinstance(cur, list) and part.isdigit() and int(part) < len(cur):
+            cur = cur[int(part)]
+        elif isinstance(cur, dict) and isinstance(cur.get(part), (dict, list)):
+            cur = cur[part]
+        else:
+            return None, parts[-1]
+    return cur, parts[-1]
+
+
+def _read(doc: Dict[str, Any], path: str) -> Any:
+    cur, last = _parent(doc, path)
+    if isinstance(cur, dict):
+        return cur.get(last, _MISSING)
+    if isinstance(cur, list) and last.isdigit() and int(last) < len(cur):
+        return cur[int(last)]
+    return _MISSING
+
+
+def _unset_path(doc: Dict[str, Any], path: str) -> None:
+    cur, last = _parent(doc, path)
+    if isinstance(cur, dict):
+        cur.pop(last, None)
+    elif isinstance(cur, list) and last.isdigit() and int(last) < len(cur):
+        cur[int(last)] = None
+
+
+# ======================
+# Filtres
+# ======================
+_TYPES: Dict[str, Any] = {
+    "double": float, "string": str, "object": dict, "array": list, "binData": bytes, "objectId": ObjectId,
+    "bool": bool, "date": datetime, "null": type(None), "int": int, "long": int, "number": (int, float),
+}
+
+
+def _is_ops(cond: Any) -> bool:
+    return isinstance(cond, dict) and bool(cond) and all(k.startswith("$") for k in cond)
+
+
+def match(doc: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    for key, cond in (query or {}).items():
+        if key == "$and":
+            if not all(match(doc, q) for q in cond):
+                return False
+        elif key == "$or":
+            if not any(match(doc, q) for q in cond):
+                return False
+        elif key == "$nor":
+            if any(match(doc, q) for q in cond):
+                return False
+        elif key == "$expr":
+            if not _truthy(_eval(cond, doc)):
+                return False
+        elif key == "$comment":
+            continue
+        elif key.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {key}", code=2)
+        elif not _match_field(_values(doc, key), cond):
+            return False
+    return True
+
+
+def _regex(pattern: Any, options: str = "") -> "re.Pattern[str]":
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    if isinstance(pattern, Regex):
+        return pattern.try_compile()
+    flags = (re.I if "i" in options else 0) | (re.M if "m" in options else 0) | (re.S if "s" in options else 0) | (re.X if "x" in options else 0)
+    return re.compile(pattern, flags)
+
+
+def _match_regex(values: List[Any], pattern: Any, options: str = "") -> bool:
+    rx = _regex(pattern, options)
+    return any(isinstance(v, str) and rx.search(v) for v in _flat(values))
+
+
+def _eq_any(values: List[Any], x: Any) -> bool:
+    if isinstance(x, (re.Pattern, Regex)):
+        return _match_regex(values, x)
+    if x is None:
+        return not values or any(v is None for v in _flat(values))
+    return any(_eq(v, x) or (isinstance(v, list) and any(_eq(e, x) for e in v)) for v in values)
+
+
+class _InSet(list):
+    """Arguments d'un $in/$nin de scalaires, avec leur ensemble précalculé (voir compile_query)."""
+
+    keys: Set[Hashable]
+
+
+def _scalar_key(value: Any) -> Optional[Hashable]:
+    """Clé d'égalité d'un scalaire (booléens distincts des nombres, Binary avec son sous-type)."""
+    if isinstance(value, bool):
+        return ("b", value)
+    if isinstance(value, (int, float)):
+        return ("n", value)
+    if isinstance(value, str):
+        return ("s", value)
+    if isinstance(value, bytes):
+        return ("y", bytes(value), getattr(value, "subtype", 0))
+    if isinstance(value, ObjectId):
+        return ("o", value)
+    return None
+
+
+def compile_query(query: Any) -> Any:
+    """Prépare un filtre pour de nombreux documents: les $in/$nin de scalaires deviennent des ensembles."""
+    if not isinstance(query, dict):
+        return query
+    out: Dict[str, Any] = {}
+    for key, cond in query.items():
+        if key in ("$and", "$or", "$nor"):
+            out[key] = [compile_query(q) for q in cond]
+        elif not key.startswith("$") and _is_ops(cond) and ("$in" in cond or "$nin" in cond):
+            cond = dict(cond)
+            for op in ("$in", "$nin"):
+                arg = cond.get(op)
+                if isinstance(arg, list) and not isinstance(arg, _InSet):
+                    keys = [_scalar_key(v) for v in arg]
+                    if None not in keys:
+                        cond[op] = _InSet(arg)
+                        cond[op].keys = set(keys)
+            out[key] = cond
+        else:
+            out[key] = cond
+    return out
+
+
+def _in(values: List[Any], arg: List[Any]) -> bool:
+    if isinstance(arg, _InSet):
+        return any(_scalar_key(v) in arg.keys for v in _flat(values))
+    return any(_eq_any(values, x) for x in arg)
+
+
+def _compare(values: List[Any], x: Any, op: Callable[[Any, Any], bool]) -> bool:
+    kx = _key(x)
+    for v in _flat(values) + [v for v in values if isinstance(v, list)]:
+        kv = _key(v)
+        if kv[0] == kx[0]:
+            try:
+                if op(kv, kx):
+                    return True
+            except TypeError:
+                continue
+    return False
+
+
+def _elem_match(element: Any, spec: Dict[str, Any]) -> bool:
+    if _is_ops(spec):
+        return _match_field([element], spec)
+    return isinstance(element, dict) and match(element, spec)
+
+
+def _match_type(values: List[Any], arg: Any) -> bool:
+    names = arg if isinstance(arg, list) else [arg]
+    for name in names:
+        if name == "array":
+            if any(isinstance(v, list) for v in values):
+                return True
+            continue
+        t = _TYPES.get(name)
+        if t is not None and any(isinstance(v, t) and not (t is int and isinstance(v, bool)) for v in _flat(values)):
+            return True
+    return False
+
+
+def _match_field(values: List[Any], cond: Any) -> bool:
+    if not _is_ops(cond):
+        return _eq_any(values, cond)
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = _eq_any(values, arg)
+        elif op == "$ne":
+            ok = not _eq_any(values, arg)
+        elif op == "$gt":
+            ok = _compare(values, arg, lambda a, b: a > b)
+        elif op == "$gte":
+            ok = _compare(values, arg, lambda a, b: a >= b)
+        elif op == "$lt":
+            ok = _compare(values, arg, lambda a, b: a < b)
+        elif op == "$lte":
+            ok = _compare(values, arg, lambda a, b: a <= b)
+        elif op == "$in":
+            ok = _in(values, arg)
+        elif op == "$nin":
+            ok = not _in(values, arg)
+        elif op == "$exists":
+            ok = bool(values) == bool(arg)
+        elif op == "$all":
+            ok = bool(arg) and all(_elem_match_all(values, x) for x in arg)
+        elif op == "$size":
+            ok = any(isinstance(v, list) and len(v) == arg for v in values)
+        elif op == "$type":
+            ok = _match_type(values, arg)
+        elif op == "$elemMatch":
+            ok = any(isinstance(v, list) and any(_elem_match(e, arg) for e in v) for v in values)
+        elif op == "$regex":
+            ok = _match_regex(values, arg, cond.get("$options", ""))
+        elif op == "$options":
+            ok = True
+        elif op == "$not":
+            ok = not _match_field(values, arg if _is_ops(arg) else {"$regex": arg} if isinstance(arg, (re.Pattern, Regex)) else {"$eq": arg})
+        elif op == "$mod":
+            ok = any(isinstance(v, (int, float)) and not isinstance(v, bool) and v % arg[0] == arg[1] for v in _flat(values))
+        else:
+            raise OperationFailure(f"unknown operator: {op}", code=2)
+        if not ok:
+            return False
+    return True
+
+
+def _elem_match_all(values: List[Any], x: Any) -> bool:
+    if isinstance(x, dict) and "$elemMatch" in x:
+        return _match_field(values, x)
+    return _eq_any(values, x)
+
+
+# ======================
+# Expressions d'agrégation
+# ======================
+def _truthy(value: Any) -> bool:
+    return value not in (None, False, 0, _MISSING)
+
+
+def _num(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _eval(expr: Any, doc: Dict[str, Any]) -> Any:
+    if isinstance(expr, str) and expr.startswith("$"):
+        if expr == "$$ROOT" or expr == "$$CURRENT":
+            return doc
+        if expr.startswith("$$"):
+            raise OperationFailure(f"variable non supportée par le moteur mémoire: {expr}", code=17276)
+        return _get_path(doc, expr[1:])
+    if isinstance(expr, list):
+        return [_value(_eval(e, doc)) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        out = {}
+        for k, v in expr.items():
+            value = _eval(v, doc)
+            if value is not _MISSING:
+                out[k] = value
+        return out
+
+    op, arg = next(iter(expr.items()))
+    if op == "$literal":
+        return arg
+    args = arg if isinstance(arg, list) else [arg]
+    if op == "$cond":
+        if isinstance(arg, dict):
+            args = [arg["if"], arg["then"], arg["else"]]
+        return _eval(args[1] if _truthy(_eval(args[0], doc)) else args[2], doc)
+    if op == "$ifNull":
+        for a in args:
+            value = _eval(a, doc)
+            if value is not None and value is not _MISSING:
+                return value
+        return None
+    values = [_value(_eval(a, doc)) for a in args]
+    if op == "$size":
+        if not isinstance(values[0], list):
+            raise OperationFailure("The argument to $size must be an array", code=17124)
+        return len(values[0])
+    if op == "$isNumber":
+        return _num(values[0])
+    if op == "$isArray":
+        return isinstance(values[0], list)
+    if op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$cmp"):
+        a, b = _key(values[0]), _key(values[1])
+        c = (a > b) - (a < b)
+        return {"$eq": c == 0, "$ne": c != 0, "$gt": c > 0, "$gte": c >= 0, "$lt": c < 0, "$lte": c <= 0, "$cmp": c}[op]
+    if op == "$and":
+        return all(_truthy(v) for v in values)
+    if op == "$or":
+        return any(_truthy(v) for v in values)
+    if op == "$not":
+        return not _truthy(values[0])
+    if op == "$in":
+        return any(_eq(values[0], v) for v in values[1])
+    if op in ("$add", "$sum"):
+        nums = _flat(values) if op == "$sum" else values
+        return sum(v for v in nums if _num(v))
+    if op == "$subtract":
+        return values[0] - values[1]
+    if op == "$multiply":
+        out = 1
+        for v in values:
+            out *= v
+        return out
+    if op == "$divide":
+        return values[0] / values[1]
+    if op in ("$min", "$max"):
+        present = [v for v in _flat(values) if v is not None]
+        return (min if op == "$min" else max)(present, key=_key) if present else None
+    if op == "$concat":
+        return None if any(v is None for v in values) else "".join(values)
+    if op == "$toString":
+        return None if values[0] is None else str(values[0])
+    if op == "$arrayElemAt":
+        arr, i = values
+        return arr[i] if isinstance(arr, list) and -len(arr) <= i < len(arr) else _MISSING
+    if op == "$setUnion":
+        out_list: List[Any] = []
+        for v in values:
+            for e in v or []:
+                if not any(_eq(e, o) for o in out_list):
+                    out_list.append(e)
+        return out_list
+    raise OperationFailure(f"opérateur d'expression non supporté par le moteur mémoire: {op}", code=168)
+
+
+def _value(value: Any) -> Any:
+    return None if value is _MISSING else value
+
+
+def _copy(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Copie profonde par aller-retour BSON (en C, bien plus rapide que copy.deepcopy)
+    return bson.decode(bson.encode(doc))
+
+
+# ======================
+# Projection et mises à jour
+# ======================
+def _is_flag(value: Any) -> bool:
+    return isinstance(value, (bool, int)) and not isinstance(value, float) and value in (0, 1)
+
+
+def project(doc: Dict[str, Any], spec: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Projection find()/$project: inclusion (avec champs calculés) ou exclusion."""
+    if spec is None:
+        return doc
+    if isinstance(spec, (list, tuple)):
+        spec = {f: 1 for f in spec}
+    fields = {k: v for k, v in spec.items() if k != "_id"}
+    if fields:
+        inclusion = any(not _is_flag(v) or v for v in fields.values())
+    else:
+        inclusion = "_id" in spec and (not _is_flag(spec["_id"]) or bool(spec["_id"]))
+    if not inclusion:
+        # Les documents lus sont propres à la requête: copie seulement si un chemin imbriqué est retiré
+        out = _copy(doc) if any("." in p for p in fields) else dict(doc)
+        for path in fields:
+            _unset_path(out, path)
+        if "_id" in spec and not spec["_id"]:
+            out.pop("_id", None)
+        return out
+
+    out: Dict[str, Any] = {}
+    id_spec = spec.get("_id", 1)
+    if "_id" in doc and _is_flag(id_spec) and id_spec:
+        out["_id"] = doc["_id"]
+    included = {k for k, v in fields.items() if _is_flag(v) and v}
+    roots: Dict[str, List[str]] = {}
+    for path in included:
+        root, _, rest = path.partition(".")
+        roots.setdefault(root, []).append(rest)
+    for key, value in doc.items():
+        rests = roots.get(key)
+        if rests is None or key == "_id":
+            continue
+        if "" in rests:
+            out[key] = value
+        else:
+            sub = _project_sub(value, rests)
+            if sub is not _MISSING:
+                out[key] = sub
+    for path, expr in fields.items():
+        if not _is_flag(expr):
+            value = _eval(expr, doc)
+            if value is not _MISSING:
+                _set_path(out, path, value)
+    if not _is_flag(id_spec):
+        out["_id"] = _value(_eval(id_spec, doc))
+    return out
+
+
+def _project_sub(value: Any, paths: List[str]) -> Any:
+    if isinstance(value, dict):
+        return project(value, {**{p: 1 for p in paths}, "_id": 0}) if "_id" not in paths else project(value, {p: 1 for p in paths})
+    if isinstance(value, list):
+        return [_project_sub(v, paths) for v in value if isinstance(v, (dict, list))]
+    return _MISSING
+
+
+def _pull_matches(element: Any, cond: Any) -> bool:
+    if _is_ops(cond):
+        return _match_field([element], cond)
+    if isinstance(cond, dict):
+        return isinstance(element, dict) and match(element, cond)
+    return _eq(element, cond)
+
+
+def apply_update(doc: Dict[str, Any], update: Union[Dict[str, Any], List[Dict[str, Any]]], inserting: bool = False) -> Dict[str, Any]:
+    """Applique un document de mise à jour (opérateurs) ou un pipeline ($set/$unset/$project...)."""
+    if isinstance(update, list):
+        for stage in update:
+            doc = _run_stage_one(doc, stage)
+        return doc
+    if update and not all(k.startswith("$") for k in update):
+        # Remplacement
+        return {"_id": doc.get("_id"), **{k: v for k, v in update.items() if k != "_id"}}
+    for op, spec in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in spec.items():
+            if "$" in path.split("."):
+                raise OperationFailure("opérateur positionnel non supporté par le moteur mémoire", code=2)
+            _UPDATE_OPS.get(op, _unknown_update)(doc, path, arg, op)
+    return doc
+
+
+def _unknown_update(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    raise OperationFailure(f"Unknown modifier: {op}", code=9)
+
+
+def _array_at(doc: Dict[str, Any], path: str, op: str, create: bool) -> Optional[List[Any]]:
+    current = _read(doc, path)
+    if current is _MISSING or current is None:
+        if not create:
+            return None
+        current = []
+        _set_path(doc, path, current)
+    if not isinstance(current, list):
+        raise OperationFailure(f"Cannot apply {op} to a non-array value", code=2)
+    return current
+
+
+def _each(arg: Any) -> List[Any]:
+    return list(arg["$each"]) if isinstance(arg, dict) and "$each" in arg else [arg]
+
+
+def _clone(value: Any) -> Any:
+    return _copy({"v": value})["v"] if isinstance(value, (dict, list)) else value
+
+
+def _u_set(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    _set_path(doc, path, _clone(arg))
+
+
+def _u_unset(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    _unset_path(doc, path)
+
+
+def _u_inc(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    current = _read(doc, path)
+    if current is _MISSING:
+        current = 0
+    if not _num(current):
+        raise OperationFailure("Cannot apply $inc to a value of non-numeric type", code=14)
+    _set_path(doc, path, current * arg if op == "$mul" else current + arg)
+
+
+def _u_minmax(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    current = _read(doc, path)
+    if current is _MISSING or (_key(arg) < _key(current) if op == "$min" else _key(arg) > _key(current)):
+        _set_path(doc, path, arg)
+
+
+def _u_push(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    arr = _array_at(doc, path, op, create=True)
+    for item in _each(arg):
+        if op == "$push" or not any(_eq(e, item) for e in arr):
+            arr.append(_clone(item))
+    if op == "$push" and isinstance(arg, dict) and "$slice" in arg:
+        n = arg["$slice"]
+        arr[:] = arr[:n] if n >= 0 else arr[n:]
+
+
+def _u_pull(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    arr = _array_at(doc, path, op, create=False)
+    if arr is None:
+        return
+    if op == "$pullAll":
+        arr[:] = [e for e in arr if not any(_eq(e, x) for x in arg)]
+    else:
+        arr[:] = [e for e in arr if not _pull_matches(e, arg)]
+
+
+def _u_current_date(doc: Dict[str, Any], path: str, arg: Any, op: str) -> None:
+    _set_path(doc, path, _utcnow())
+
+
+_UPDATE_OPS: Dict[str, Callable[[Dict[str, Any], str, Any, str], None]] = {
+    "$set": _u_set, "$setOnInsert": _u_set, "$unset": _u_unset, "$inc": _u_inc, "$mul": _u_inc,
+    "$min": _u_minmax, "$max": _u_minmax, "$push": _u_push, "$addToSet": _u_push,
+    "$pull": _u_pull, "$pullAll": _u_pull, "$currentDate": _u_current_date,
+}
+
+
+def _utcnow() -> datetime:
+    # Précision milliseconde, comme les dates relues depuis MongoDB
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _upsert_seed(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Document de départ d'un upsert: égalités du filtre."""
+    doc: Dict[str, Any] = {}
+    for key, cond in query.items():
+        if key == "$and":
+            for sub in cond:
+                for k, v in _upsert_seed(sub).items():
+                    doc.setdefault(k, v)
+        elif key.startswith("$"):
+            continue
+        elif not _is_ops(cond):
+            _set_path(doc, key, _clone(cond))
+        elif "$eq" in cond:
+            _set_path(doc, key, _clone(cond["$eq"]))
+    return doc
+
+
+# ======================
+# Index
+# ======================
+class _Index:
+    """
+    Index d'une collection: table de hachage sur la première clé (égalité, $in, $lookup),
+    contrainte d'unicité sur la clé complète, et liste triée de la première clé
+    construite au premier besoin (intervalles, tri), tenue à jour ensuite.
+    """
+
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], options: Dict[str, Any]):
+        self.name = name
+        self.keys = keys
+        self.options = options
+        self.unique = bool(options.get("unique"))
+        self.sparse = bool(options.get("sparse"))
+        self.partial = options.get("partialFilterExpression")
+        self.ttl = options.get("expireAfterSeconds")
+        self.field = keys[0][0]
+        self.by_value: Dict[Hashable, Set[Hashable]] = {}
+        self.unique_keys: Dict[Hashable, Hashable] = {}
+        self.sorted: Optional[List[Tuple[Any, ...]]] = None
+        self.multikey = False
+        self.entries_by_doc: Dict[Hashable, Tuple[List[Any], List[Hashable]]] = {}
+
+    def spec(self) -> Dict[str, Any]:
+        return {"key": list(self.keys), "v": 2, **self.options}
+
+    def covers(self, doc: Dict[str, Any]) -> bool:
+        if self.partial is not None and not match(doc, self.partial):
+            return False
+        if self.sparse and not any(_values(doc, f) for f, _ in self.keys):
+            return False
+        return True
+
+    def _first_values(self, doc: Dict[str, Any]) -> List[Any]:
+        values = _flat(_values(doc, self.field))
+        return values or [None]
+
+    def _unique_keys(self, doc: Dict[str, Any]) -> List[Hashable]:
+        per_field = [_flat(_values(doc, f)) or [None] for f, _ in self.keys]
+        combos: List[Tuple[Any, ...]] = [()]
+        for values in per_field:
+            combos = [c + (v,) for c in combos for v in values]
+        return list({_hashable(list(c)): None for c in combos})
+
+    def check(self, key: Hashable, doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Clé en conflit (index unique) si doc était indexé sous key, sinon None."""
+        if not self.unique or not self.covers(doc):
+            return None
+        for uk in self._unique_keys(doc):
+            owner = self.unique_keys.get(uk)
+            if owner is not None and owner != key:
+                return {f: _value(next(iter(_values(doc, f)), None)) for f, _ in self.keys}
+        return None
+
+    def add(self, key: Hashable, doc: Dict[str, Any], order: int) -> None:
+        if not self.covers(doc):
+            return
+        values = self._first_values(doc)
+        self.multikey = self.multikey or any(isinstance(v, list) for v in _values(doc, self.field))
+        for v in values:
+            self.by_value.setdefault(_hashable(v), set()).add(key)
+        uniques = self._unique_keys(doc) if self.unique else []
+        for uk in uniques:
+            self.unique_keys[uk] = key
+        self.entries_by_doc[key] = (values, uniques)
+        if self.sorted is not None:
+            for v in values:
+                bisect.insort(self.sorted, (*_key(v), order, key))
+
+    def replace(self, key: Hashable, doc: Dict[str, Any], order: int) -> None:
+        """Mise à jour d'un document: rien à faire si ses clés d'index n'ont pas changé."""
+        entry = self.entries_by_doc.get(key)
+        if entry is not None and self.covers(doc):
+            values, uniques = entry
+            if _hashable(self._first_values(doc)) == _hashable(values) and (not self.unique or self._unique_keys(doc) == uniques):
+                return
+        self.remove(key, order)
+        self.add(key, doc, order)
+
+    def remove(self, key: Hashable, order: int) -> None:
+        entry = self.entries_by_doc.pop(key, None)
+        if entry is None:
+            return
+        values, uniques = entry
+        for v in values:
+            h = _hashable(v)
+            bucket = self.by_value.get(h)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.by_value[h]
+        for uk in uniques:
+            if self.unique_keys.get(uk) == key:
+                del self.unique_keys[uk]
+        if self.sorted is not None:
+            for v in values:
+                item = (*_key(v), order, key)
+                i = bisect.bisect_left(self.sorted, item)
+                if i < len(self.sorted) and self.sorted[i] == item:
+                    del self.sorted[i]
+
+    def lookup(self, value: Any) -> Set[Hashable]:
+        return self.by_value.get(_hashable(value), set())
+
+    def ensure_sorted(self, orders: Dict[Hashable, int]) -> List[Tuple[Any, ...]]:
+        if self.sorted is None:
+            self.sorted = sorted(
+                (*_key(v), orders[key], key) for key, (values, _) in self.entries_by_doc.items() for v in values
+            )
+        return self.sorted
+
+    def range(self, cond: Dict[str, Any], orders: Dict[Hashable, int]) -> Optional[List[Hashable]]:
+        """Documents dont la première clé est dans l'intervalle ($gt/$gte/$lt/$lte, même type BSON)."""
+        bounds = {op: cond[op] for op in ("$gt", "$gte", "$lt", "$lte") if op in cond}
+        if self.multikey and len(bounds) > 1:
+            # Tableaux: chaque borne peut être vérifiée par un élément différent, une seule borne sert
+            bounds = dict([next(iter(bounds.items()))])
+        ranks = {_key(v)[0] for v in bounds.values()}
+        if not bounds or len(ranks) != 1:
+            return None
+        rank = ranks.pop()
+        entries = self.ensure_sorted(orders)
+        lo, hi = 0, len(entries)
+        if "$gte" in bounds:
+            lo = bisect.bisect_left(entries, _key(bounds["$gte"]))
+        elif "$gt" in bounds:
+            lo = bisect.bisect_right(entries, (*_key(bounds["$gt"]), float("inf")))
+        else:
+            lo = bisect.bisect_left(entries, (rank,))
+        if "$lte" in bounds:
+            hi = bisect.bisect_right(entries, (*_key(bounds["$lte"]), float("inf")))
+        elif "$lt" in bounds:
+            hi = bisect.bisect_left(entries, _key(bounds["$lt"]))
+        else:
+            hi = bisect.bisect_left(entries, (rank + 1,))
+        return list(dict.fromkeys(e[-1] for e in entries[lo:hi]))
+
+    def size_bytes(self) -> int:
+        """Taille estimée (clés encodées en BSON + pointeur), pour collStats."""
+        return sum(len(bson.encode({"": v})) + 8 for values, _ in self.entries_by_doc.values() for v in values)
+
+
+def _index_keys(keys: Any, direction: Any = 1) -> List[Tuple[str, Any]]:
+    if isinstance(keys, str):
+        return [(keys, direction)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    return [(k, d) if not isinstance(k, str) or d is not None else (k, 1) for k, d in keys]
+
+
+# ======================
+# Stockage
+# ======================
+class _Store:
+    """Documents d'une collection (BSON encodé, ordre d'insertion) et ses index."""
+
+    def __init__(self) -> None:
+        self.docs: Dict[Hashable, bytes] = {}
+        self.orders: Dict[Hashable, int] = {}
+        self.indexes: Dict[str, _Index] = {}
+        self._next_order = 0
+        self._ttl_checked = 0.0
+
+    def decode(self, key: Hashable) -> Dict[str, Any]:
+        return bson.decode(self.docs[key])
+
+    def put(self, key: Hashable, doc: Dict[str, Any], raw: Optional[bytes] = None) -> None:
+        """Insère ou remplace (index mis à jour); DuplicateKeyError si un index unique refuse."""
+        for index in self.indexes.values():
+            conflict = index.check(key, doc)
+            if conflict is not None:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error index: {index.name} dup key: {conflict}",
+                    11000,
+                    {"code": 11000, "keyPattern": dict(index.keys), "keyValue": conflict},
+                )
+        self.docs[key] = raw if raw is not None else bson.encode(doc)
+        order = self.orders.get(key)
+        if order is None:
+            order = self.orders[key] = self._next_order
+            self._next_order += 1
+            for index in self.indexes.values():
+                index.add(key, doc, order)
+        else:
+            for index in self.indexes.values():
+                index.replace(key, doc, order)
+
+    def remove(self, key: Hashable) -> None:
+        order = self.orders.pop(key)
+        for index in self.indexes.values():
+            index.remove(key, order)
+        del self.docs[key]
+
+    def add_index(self, name: str, keys: List[Tuple[str, Any]], options: Dict[str, Any]) -> None:
+        index = _Index(name, keys, options)
+        for key in self.docs:
+            doc = self.decode(key)
+            conflict = index.check(key, doc)
+            if conflict is not None:
+                raise OperationFailure(f"E11000 duplicate key error index: {name} dup key: {conflict}", 11000)
+            index.add(key, doc, self.orders[key])
+        self.indexes[name] = index
+
+    def index_on(self, field: str) -> Optional[_Index]:
+        for index in self.indexes.values():
+            if index.field == field and index.partial is None and not index.sparse:
+                return index
+        return None
+
+    def candidates(self, query: Dict[str, Any]) -> Optional[List[Hashable]]:
+        """Documents à examiner d'après les index (égalité, $in, intervalle), None = parcours complet."""
+        best: Optional[List[Hashable]] = None
+        for field, cond in query.items():
+            if field == "$and":
+                for sub in cond:
+                    found = self.candidates(sub)
+                    if found is not None and (best is None or len(found) < len(best)):
+                        best = found
+                continue
+            if field.startswith("$"):
+                continue
+            if field == "_id" and not _is_ops(cond) and not isinstance(cond, (re.Pattern, Regex)):
+                h = _hashable(cond)
+                return [h] if h in self.docs else []
+            index = self.index_on(field)
+            if index is None:
+                continue
+            found = None
+            if not _is_ops(cond):
+                if not isinstance(cond, (list, dict, re.Pattern, Regex)):
+                    found = list(index.lookup(cond))
+            elif "$eq" in cond and not isinstance(cond["$eq"], (list, dict)):
+                found = list(index.lookup(cond["$eq"]))
+            elif "$in" in cond and not any(isinstance(v, (list, dict, re.Pattern, Regex)) for v in cond["$in"]):
+                keys: Dict[Hashable, None] = {}
+                for v in cond["$in"]:
+                    keys.update(dict.fromkeys(index.lookup(v)))
+                found = list(keys)
+            else:
+                found = index.range(cond, self.orders)
+            if found is not None and (best is None or len(found) < len(best)):
+                best = found
+        if best is not None:
+            best.sort(key=self.orders.__getitem__)
+        return best
+
+    def scan(self, query: Dict[str, Any]) -> Iterator[Tuple[Hashable, Dict[str, Any]]]:
+        keys = self.candidates(query or {})
+        query = compile_query(query)
+        for key in (list(self.docs) if keys is None else keys):
+            doc = self.decode(key)
+            if match(doc, query):
+                yield key, doc
+
+    def sorted_scan(self, query: Dict[str, Any], sort: List[Tuple[str, int]], need: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Tri + limit par l'index trié de la première clé: s'arrête dès que need documents
+        sont trouvés (les ex æquo de la dernière valeur sont complétés puis triés).
+        None si aucun index ne sert ce tri.
+        """
+        index = self.index_on(sort[0][0])
+        query = compile_query(query)
+        if index is None:
+            return None
+        entries = index.ensure_sorted(self.orders)
+        if len(index.entries_by_doc) != len(self.docs):
+            return None
+        seen: Set[Hashable] = set()
+        out: List[Dict[str, Any]] = []
+        last: Any = None
+        for entry in (entries if sort[0][1] > 0 else reversed(entries)):
+            key = entry[-1]
+            if key in seen:
+                continue
+            seen.add(key)
+            doc = self.decode(key)
+            if not match(doc, query):
+                continue
+            if len(out) >= need and entry[:2] != last:
+                break
+            out.append(doc)
+            last = entry[:2]
+        return _sort_docs(out, sort)
+
+    def expire(self) -> None:
+        """Index TTL: supprime les documents expirés (au plus une fois par seconde)."""
+        ttl = [i for i in self.indexes.values() if i.ttl is not None]
+        now = time.monotonic()
+        if not ttl or now - self._ttl_checked < _TTL_INTERVAL:
+            return
+        self._ttl_checked = now
+        utc = _utcnow()
+        for index in ttl:
+            expired = [
+                key for key, (values, _) in index.entries_by_doc.items()
+                if any(isinstance(v, datetime) and (utc - v.replace(tzinfo=None)).total_seconds() > index.ttl for v in values)
+            ]
+            for key in expired:
+                if key in self.docs:
+                    self.remove(key)
+
+
+class _Server:
+    """Ensemble des bases d'une URI memory:// (partagé par tous les clients du processus)."""
+
+    def __init__(self, path: Optional[str]):
+        self.lock = threading.RLock()
+        self.databases: Dict[str, Dict[str, _Store]] = {}
+        self.path = path
+        if path and os.path.exists(path):
+            self.load(path)
+        if path:
+            atexit.register(self.save)
+
+    def store(self, db: str, name: str, create: bool = False) -> Optional[_Store]:
+        stores = self.databases.get(db)
+        if stores is None:
+            if not create:
+                return None
+            stores = self.databases[db] = {}
+        store = stores.get(name)
+        if store is None and create:
+            store = stores[name] = _Store()
+        return store
+
+    # -------- Snapshot
+    def save(self, path: Optional[str] = None) -> str:
+        """Écrit toutes les bases dans un fichier (via mmap): en-tête, manifeste BSON puis documents."""
+        path = path or self.path
+        if not path:
+            raise ValueError("Aucun chemin de snapshot (memory:///chemin ou save(path)).")
+        with self.lock:
+            collections = []
+            chunks: List[bytes] = []
+            for db_name, stores in self.databases.items():
+                for name, store in stores.items():
+                    collections.append({
+                        "db": db_name,
+                        "name": name,
+                        "count": len(store.docs),
+                        "indexes": [{"name": i.name, "key": [list(k) for k in i.keys], "options": i.options} for i in store.indexes.values()],
+                    })
+                    chunks.extend(store.docs.values())
+            manifest = bson.encode({"v": 1, "collections": collections})
+        total = len(SNAPSHOT_MAGIC) + len(manifest) + sum(len(c) for c in chunks)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb+") as f:
+            f.truncate(total)
+            with mmap.mmap(f.fileno(), total) as mm:
+                pos = 0
+                for chunk in (SNAPSHOT_MAGIC, manifest, *chunks):
+                    mm[pos:pos + len(chunk)] = chunk
+                    pos += len(chunk)
+                mm.flush()
+        os.replace(tmp, path)
+        return path
+
+    def load(self, path: str) -> None:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f"Snapshot invalide: {path}")
+            pos = len(SNAPSHOT_MAGIC)
+            size = int.from_bytes(mm[pos:pos + 4], "little")
+            manifest = bson.decode(mm[pos:pos + size])
+            pos += size
+            with self.lock:
+                for coll in manifest["collections"]:
+                    store = self.store(coll["db"], coll["name"], create=True)
+                    for _ in range(coll["count"]):
+                        size = int.from_bytes(mm[pos:pos + 4], "little")
+                        raw = mm[pos:pos + size]
+                        pos += size
+                        key = _hashable(RawBSONDocument(raw)["_id"])
+                        store.orders[key] = store._next_order
+                        store._next_order += 1
+                        store.docs[key] = raw
+                    # Index reconstruits après le chargement des documents
+                    for spec in coll["indexes"]:
+                        store.add_index(spec["name"], [tuple(k) for k in spec["key"]], spec["options"])
+
+
+# ======================
+# API compatible pymongo
+# ======================
+class MemoryCursor:
+    """Curseur de find(): exécuté à la première itération; sort/skip/limit chaînables."""
+
+    def __init__(self, collection: "MemoryCollection", filter: Optional[Dict[str, Any]], projection: Any, sort: Any = None, skip: int = 0, limit: int = 0, **_: Any):
+        self._collection = collection
+        self._filter = filter or {}
+        self._projection = projection
+        self._sort = _normalize_sort(sort)
+        self._skip = skip or 0
+        self._limit = limit or 0
+        self._it: Optional[Iterator[Any]] = None
+
+    def sort(self, key: Any, direction: Optional[int] = None) -> "MemoryCursor":
+        self._sort = _normalize_sort(key, direction)
+        return self
+
+    def skip(self, n: int) -> "MemoryCursor":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int) -> "MemoryCursor":
+        return self
+
+    def hint(self, index: Any) -> "MemoryCursor":
+        return self
+
+    def max_time_ms(self, ms: Optional[int]) -> "MemoryCursor":
+        return self
+
+    def allow_disk_use(self, allow: bool) -> "MemoryCursor":
+        return self
+
+    def __iter__(self) -> "MemoryCursor":
+        return self
+
+    def __next__(self) -> Any:
+        if self._it is None:
+            self._it = iter(self._collection._find(self._filter, self._projection, self._sort, self._skip, self._limit))
+        return next(self._it)
+
+    next = __next__
+
+    def close(self) -> None:
+        self._it = iter(())
+
+    def __enter__(self) -> "MemoryCursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class MemoryCommandCursor:
+    """Résultat d'aggregate() (déjà calculé)."""
+
+    def __init__(self, docs: List[Any]):
+        self._it = iter(docs)
+
+    def __iter__(self) -> "MemoryCommandCursor":
+        return self
+
+    def __next__(self) -> Any:
+        return next(self._it)
+
+    next = __next__
+
+    def batch_size(self, n: int) -> "MemoryCommandCursor":
+        return self
+
+    def close(self) -> None:
+        self._it = iter(())
+
+    def __enter__(self) -> "MemoryCommandCursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str, codec_options: Optional[CodecOptions] = None):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self.codec_options = codec_options or database.codec_options
+        self._server = database.client._server
+
+    def __getitem__(self, name: str) -> "MemoryCollection":
+        return MemoryCollection(self.database, f"{self.name}.{name}", self.codec_options)
+
+    def with_options(self, codec_options: Optional[CodecOptions] = None, **_: Any) -> "MemoryCollection":
+        return MemoryCollection(self.database, self.name, codec_options or self.codec_options)
+
+    def _store(self, create: bool = False) -> Optional[_Store]:
+        store = self._server.store(self.database.name, self.name, create)
+        if store is not None:
+            store.expire()
+        return store
+
+    # -------- Sortie (codec de la collection: dict, RawBSONDocument, type_registry...)
+    def _out(self, doc: Dict[str, Any], raw: Optional[bytes] = None) -> Any:
+        if self.codec_options is DEFAULT_CODEC_OPTIONS or self.codec_options == DEFAULT_CODEC_OPTIONS:
+            return doc
+        return bson.decode(raw if raw is not None else bson.encode(doc), self.codec_options)
+
+    # -------- Lecture
+    def _find(self, filter: Dict[str, Any], projection: Any, sort: Optional[List[Tuple[str, int]]], skip: int, limit: int) -> List[Any]:
+        with self._server.lock:
+            store = self._store()
+            if store is None:
+                return []
+            docs: Optional[List[Dict[str, Any]]] = None
+            if sort and limit and store.candidates(filter) is None:
+                docs = store.sorted_scan(filter, sort, skip + limit)
+            if docs is None:
+                if not sort and limit:
+                    docs = []
+                    for _, doc in store.scan(filter):
+                        docs.append(doc)
+                        if len(docs) >= skip + limit:
+                            break
+                else:
+                    docs = [doc for _, doc in store.scan(filter)]
+                    if sort:
+                        _sort_docs(docs, sort)
+        docs = docs[skip:skip + limit] if limit else docs[skip:]
+        if projection is None:
+            return [self._out(d) for d in docs]
+        return [self._out(project(d, projection)) for d in docs]
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Any = None, *args: Any, **kwargs: Any) -> MemoryCursor:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        return MemoryCursor(self, filter, projection, **kwargs)
+
+    def find_one(self, filter: Any = None, projection: Any = None, *args: Any, **kwargs: Any) -> Any:
+        kwargs["limit"] = 1
+        return next(self.find(filter, projection, **kwargs), None)
+
+    def count_documents(self, filter: Dict[str, Any], skip: int = 0, limit: int = 0, **_: Any) -> int:
+        with self._server.lock:
+            store = self._store()
+            n = 0 if store is None else sum(1 for _ in store.scan(filter))
+        n = max(n - skip, 0)
+        return min(n, limit) if limit else n
+
+    def estimated_document_count(self, **_: Any) -> int:
+        with self._server.lock:
+            store = self._store()
+            return 0 if store is None else len(store.docs)
+
+    def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **_: Any) -> List[Any]:
+        seen: Dict[Hashable, Any] = {}
+        with self._server.lock:
+            store = self._store()
+            for _, doc in (store.scan(filter or {}) if store is not None else ()):
+                for v in _flat(_values(doc, key)):
+                    seen.setdefault(_hashable(v), v)
+        return [self._out({"v": v})["v"] for v in seen.values()]
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], *args: Any, **kwargs: Any) -> MemoryCommandCursor:
+        docs = self.database._aggregate(self.name, list(pipeline))
+        if self.codec_options == DEFAULT_CODEC_OPTIONS:
+            return MemoryCommandCursor([bson.decode(bson.encode(d)) for d in docs])
+        return MemoryCommandCursor([bson.decode(bson.encode(d), self.codec_options) for d in docs])
+
+    def watch(self, *args: Any, **kwargs: Any) -> Any:
+        raise OperationFailure("Les change streams ne sont pas disponibles avec le moteur mémoire.", code=40573)
+
+    # -------- Écritures
+    def _doc_in(self, document: Any) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        if isinstance(document, RawBSONDocument):
+            doc = bson.decode(document.raw)
+            if "_id" in doc:
+                return doc, document.raw
+            return {"_id": ObjectId(), **doc}, None
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        raw = bson.encode({"_id": document["_id"], **{k: v for k, v in document.items() if k != "_id"}})
+        return bson.decode(raw), raw
+
+    def _insert(self, store: _Store, document: Any) -> Any:
+        doc, raw = self._doc_in(document)
+        key = _hashable(doc["_id"])
+        if key in store.docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: _id_ dup key: {{ _id: {doc['_id']!r} }}", 11000, {"code": 11000})
+        store.put(key, doc, raw)
+        return doc["_id"]
+
+    def insert_one(self, document: Any, *args: Any, **kwargs: Any) -> InsertOneResult:
+        with self._server.lock:
+            return InsertOneResult(self._insert(self._store(create=True), document), True)
+
+    def insert_many(self, documents: Iterable[Any], ordered: bool = True, *args: Any, **kwargs: Any) -> InsertManyResult:
+        result = self.bulk_write([InsertOne(d) for d in documents], ordered=ordered)
+        return InsertManyResult(list(result.bulk_api_result.get("insertedIds", [])), True)
+
+    def _update(self, store: _Store, filter: Dict[str, Any], update: Any, many: bool, upsert: bool, sort: Any = None) -> Dict[str, Any]:
+        matched = modified = 0
+        hits = list(store.scan(filter))
+        if sort and not many:
+            order = {id(doc): key for key, doc in hits}
+            hits = [(order[id(d)], d) for d in _sort_docs([d for _, d in hits], _normalize_sort(sort) or [])]
+        for key, doc in hits if many else hits[:1]:
+            matched += 1
+            old = store.docs[key]
+            new_doc = apply_update(doc, update)
+            raw = bson.encode(new_doc)
+            if raw != old:
+                if _hashable(new_doc.get("_id")) != key:
+                    raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'", code=66)
+                store.put(key, new_doc, raw)
+                modified += 1
+        result: Dict[str, Any] = {"n": matched, "nModified": modified}
+        if not matched and upsert:
+            doc = apply_update(_upsert_seed(filter), update, inserting=True)
+            doc = {"_id": doc.pop("_id", None) or ObjectId(), **doc}
+            self._insert(store, doc)
+            result.update(n=1, upserted=doc["_id"])
+        return result
+
+    def update_one(self, filter: Dict[str, Any], update: Any, upsert: bool = False, sort: Any = None, **_: Any) -> UpdateResult:
+        with self._server.lock:
+            return UpdateResult(self._update(self._store(create=True), filter, update, False, upsert, sort), True)
+
+    def update_many(self, filter: Dict[str, Any], update: Any, upsert: bool = False, **_: Any) -> UpdateResult:
+        with self._server.lock:
+            return UpdateResult(self._update(self._store(create=True), filter, update, True, upsert), True)
+
+    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **_: Any) -> UpdateResult:
+        if any(k.startswith("$") for k in replacement):
+            raise ValueError("replacement can not include $ operators")
+        with self._server.lock:
+            return UpdateResult(self._update(self._store(create=True), filter, dict(replacement), False, upsert), True)
+
+    def find_one_and_update(
+        self,
+        filter: Dict[str, Any],
+        update: Any,
+        projection: Any = None,
+        sort: Any = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        **_: Any,
+    ) -> Any:
+        with self._server.lock:
+            store = self._store(create=True)
+            hits = [d for _, d in store.scan(filter)]
+            if sort:
+                _sort_docs(hits, _normalize_sort(sort) or [])
+            before = hits[0] if hits else None
+            if before is None and not upsert:
+                return None
+            r = self._update(store, filter if before is None else {"_id": before["_id"]}, update, False, upsert)
+            if return_document == ReturnDocument.BEFORE:
+                doc = before
+            else:
+                doc = next(store.scan({"_id": r.get("upserted", before["_id"] if before else None)}), (None, None))[1]
+        if doc is None:
+            return None
+        return self._out(doc if projection is None else project(doc, projection))
+
+    def find_one_and_delete(self, filter: Dict[str, Any], projection: Any = None, sort: Any = None, **_: Any) -> Any:
+        with self._server.lock:
+            store = self._store()
+            hits = [] if store is None else list(store.scan(filter))
+            if sort:
+                order = {id(doc): key for key, doc in hits}
+                hits = [(order[id(d)], d) for d in _sort_docs([d for _, d in hits], _normalize_sort(sort) or [])]
+            if not hits:
+                return None
+            key, doc = hits[0]
+            store.remove(key)
+        return self._out(doc if projection is None else project(doc, projection))
+
+    def _delete(self, store: Optional[_Store], filter: Dict[str, Any], many: bool) -> int:
+        if store is None:
+            return 0
+        keys = []
+        for key, _ in store.scan(filter):
+            keys.append(key)
+            if not many:
+                break
+        for key in keys:
+            store.remove(key)
+        return len(keys)
+
+    def delete_one(self, filter: Dict[str, Any], **_: Any) -> DeleteResult:
+        with self._server.lock:
+            return DeleteResult({"n": self._delete(self._store(), filter, False)}, True)
+
+    def delete_many(self, filter: Dict[str, Any], **_: Any) -> DeleteResult:
+        with self._server.lock:
+            return DeleteResult({"n": self._delete(self._store(), filter, True)}, True)
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True, **_: Any) -> BulkWriteResult:
+        res: Dict[str, Any] = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [], "insertedIds": [],
+        }
+        with self._server.lock:
+            store = self._store(create=True)
+            for i, op in enumerate(requests):
+                try:
+                    if isinstance(op, InsertOne):
+                        res["insertedIds"].append(self._insert(store, op._doc))
+                        res["nInserted"] += 1
+                    elif isinstance(op, (UpdateOne, UpdateMany, ReplaceOne)):
+                        r = self._update(store, op._filter, op._doc, isinstance(op, UpdateMany), bool(op._upsert), getattr(op, "_sort", None))
+                        if "upserted" in r:
+                            res["nUpserted"] += 1
+                            res["upserted"].append({"index": i, "_id": r["upserted"]})
+                        else:
+                            res["nMatched"] += r["n"]
+                            res["nModified"] += r["nModified"]
+                    elif isinstance(op, (DeleteOne, DeleteMany)):
+                        res["nRemoved"] += self._delete(store, op._filter, isinstance(op, DeleteMany))
+                    else:
+                        raise TypeError(f"{op!r} n'est pas une opération d'écriture valide")
+                except (DuplicateKeyError, OperationFailure) as e:
+                    res["writeErrors"].append({"index": i, "code": e.code, "errmsg": str(e), "op": getattr(op, "_doc", None)})
+                    if ordered:
+                        break
+        if res["writeErrors"]:
+            raise BulkWriteError(res)
+        return BulkWriteResult(res, True)
+
+    # -------- Index
+    def create_index(self, keys: Any, name: Optional[str] = None, **options: Any) -> str:
+        key_list = _index_keys(keys)
+        name = name or "_".join(f"{k}_{d}" for k, d in key_list)
+        options = {k: v for k, v in options.items() if k not in ("background", "session", "comment")}
+        with self._server.lock:
+            store = self._store(create=True)
+            existing = store.indexes.get(name)
+            if existing is not None:
+                if existing.keys != key_list or existing.options != options:
+                    raise OperationFailure(f"Index with name: {name} already exists with different options", code=85)
+                return name
+            store.add_index(name, key_list, options)
+        return name
+
+    def create_indexes(self, indexes: List[Any], **_: Any) -> List[str]:
+        return [self.create_index(i.document["key"], **{k: v for k, v in i.document.items() if k != "key"}) for i in indexes]
+
+    def drop_index(self, index_or_name: Any, **_: Any) -> None:
+        name = index_or_name if isinstance(index_or_name, str) else "_".join(f"{k}_{d}" for k, d in _index_keys(index_or_name))
+        with self._server.lock:
+            store = self._store()
+            if store is None or name not in store.indexes:
+                raise OperationFailure(f"index not found with name [{name}]", code=27)
+            del store.indexes[name]
+
+    def index_information(self, **_: Any) -> Dict[str, Dict[str, Any]]:
+        with self._server.lock:
+            store = self._store()
+            info = {"_id_": {"key": [("_id", 1)], "v": 2}}
+            for name, index in (store.indexes.items() if store is not None else ()):
+                info[name] = index.spec()
+            return info
+
+    def drop(self, **_: Any) -> None:
+        self.database.drop_collection(self.name)
+
+    def rename(self, new_name: str, dropTarget: bool = False, **_: Any) -> None:
+        with self._server.lock:
+            stores = self._server.databases.get(self.database.name, {})
+            if self.name not in stores:
+                raise OperationFailure("source namespace does not exist", code=26)
+            if new_name in stores and not dropTarget:
+                raise OperationFailure("target namespace exists", code=48)
+            stores[new_name] = stores.pop(self.name)
+
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str, codec_options: Optional[CodecOptions] = None):
+        self.client = client
+        self.name = name
+        self.codec_options = codec_options or DEFAULT_CODEC_OPTIONS
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return MemoryCollection(self, name)
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return MemoryCollection(self, name)
+
+    def get_collection(self, name: str, codec_options: Optional[CodecOptions] = None, **_: Any) -> MemoryCollection:
+        return MemoryCollection(self, name, codec_options)
+
+    def with_options(self, codec_options: Optional[CodecOptions] = None, **_: Any) -> "MemoryDatabase":
+        return MemoryDatabase(self.client, self.name, codec_options or self.codec_options)
+
+    def list_collection_names(self, **_: Any) -> List[str]:
+        with self.client._server.lock:
+            return list(self.client._server.databases.get(self.name, {}))
+
+    def drop_collection(self, name_or_collection: Any, **_: Any) -> Dict[str, Any]:
+        name = name_or_collection if isinstance(name_or_collection, str) else name_or_collection.name
+        with self.client._server.lock:
+            self.client._server.databases.get(self.name, {}).pop(name, None)
+        return {"ok": 1.0}
+
+    def watch(self, *args: Any, **kwargs: Any) -> Any:
+        raise OperationFailure("Les change streams ne sont pas disponibles avec le moteur mémoire.", code=40573)
+
+    def command(self, command: Any, value: Any = 1, **kwargs: Any) -> Dict[str, Any]:
+        if isinstance(command, str):
+            name, arg = command, value
+        else:
+            name, arg = next(iter(command.items()))
+        if name in ("ping", "hello", "isMaster", "ismaster"):
+            return {"ok": 1.0}
+        if name == "buildInfo":
+            return {"version": "memory", "ok": 1.0}
+        if name == "collStats":
+            return self._coll_stats(arg)
+        if name == "dbStats":
+            names = self.list_collection_names()
+            stats = [self._coll_stats(n) for n in names]
+            return {
+                "db": self.name, "collections": len(names), "objects": sum(s["count"] for s in stats),
+                "dataSize": sum(s["size"] for s in stats), "indexSize": sum(s["totalIndexSize"] for s in stats), "ok": 1.0,
+            }
+        if name == "explain":
+            return {"queryPlanner": {"winningPlan": {"stage": "MEMORY"}}, "executionStats": {}, "ok": 1.0}
+        raise OperationFailure(f"Commande non supportée par le moteur mémoire: {name}", code=59)
+
+    def _coll_stats(self, name: str) -> Dict[str, Any]:
+        with self.client._server.lock:
+            store = self.client._server.store(self.name, name)
+            if store is None:
+                return {"ns": f"{self.name}.{name}", "count": 0, "size": 0, "nindexes": 0, "indexSizes": {}, "totalIndexSize": 0, "ok": 1.0}
+            size = sum(len(b) for b in store.docs.values())
+            index_sizes = {"_id_": sum(len(bson.encode({"": k})) + 8 for k in store.docs if not isinstance(k, bytes))}
+            index_sizes.update({n: i.size_bytes() for n, i in store.indexes.items()})
+            return {
+                "ns": f"{self.name}.{name}", "count": len(store.docs), "size": size,
+                "avgObjSize": size // len(store.docs) if store.docs else 0, "storageSize": size,
+                "nindexes": len(index_sizes), "indexSizes": index_sizes, "totalIndexSize": sum(index_sizes.values()), "ok": 1.0,
+            }
+
+    # -------- Agrégation
+    def _aggregate(self, collection: str, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        server = self.client._server
+        with server.lock:
+            store = server.store(self.name, collection)
+            if store is not None:
+                store.expire()
+            # $match (+ $sort/$skip/$limit) en tête: servis par les index
+            flt: Dict[str, Any] = {}
+            if pipeline and "$match" in pipeline[0]:
+                flt = pipeline.pop(0)["$match"]
+            if store is None:
+                docs: List[Dict[str, Any]] = []
+            else:
+                window = _leading_window(pipeline)
+                if window is not None:
+                    sort, skip, limit, n = window
+                    docs = MemoryCollection(self, collection, DEFAULT_CODEC_OPTIONS)._find(flt, None, sort, skip, limit)
+                    del pipeline[:n]
+                else:
+                    docs = [doc for _, doc in store.scan(flt)]
+            return self._run(docs, pipeline)
+
+    def _run(self, docs: List[Dict[str, Any]], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for stage in pipeline:
+            name, spec = next(iter(stage.items()))
+            if name == "$match":
+                spec = compile_query(spec)
+                docs = [d for d in docs if match(d, spec)]
+            elif name == "$project":
+                docs = [project(d, spec) for d in docs]
+            elif name in ("$addFields", "$set"):
+                docs = [_add_fields(d, spec) for d in docs]
+            elif name == "$unset":
+                docs = [project(d, {f: 0 for f in ([spec] if isinstance(spec, str) else spec)}) for d in docs]
+            elif name == "$sort":
+                docs = _sort_docs(list(docs), _normalize_sort(spec) or [])
+            elif name == "$skip":
+                docs = docs[spec:]
+            elif name == "$limit":
+                docs = docs[:spec]
+            elif name == "$count":
+                docs = [{spec: len(docs)}] if docs else []
+            elif name == "$unwind":
+                docs = _unwind(docs, spec)
+            elif name == "$group":
+                docs = _group(docs, spec)
+            elif name == "$lookup":
+                docs = self._lookup(docs, spec)
+            elif name == "$facet":
+                docs = [{k: self._run(list(docs), list(sub)) for k, sub in spec.items()}]
+            elif name == "$unionWith":
+                coll, sub = (spec, []) if isinstance(spec, str) else (spec["coll"], spec.get("pipeline") or [])
+                docs = docs + self._aggregate(coll, list(sub))
+            elif name == "$sample":
+                docs = random.sample(docs, min(spec["size"], len(docs)))
+            elif name in ("$replaceRoot", "$replaceWith"):
+                docs = [_eval(spec["newRoot"] if name == "$replaceRoot" else spec, d) for d in docs]
+            elif name == "$sortByCount":
+                docs = _sort_docs(_group(docs, {"_id": spec, "count": {"$sum": 1}}), [("count", -1)])
+            elif name == "$out":
+                self._out(docs, spec if isinstance(spec, str) else spec["coll"])
+                docs = []
+            else:
+                raise OperationFailure(f"Étape non supportée par le moteur mémoire: {name}", code=40324)
+        return docs
+
+    def _lookup(self, docs: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if "let" in spec:
+            raise OperationFailure("$lookup avec let non supporté par le moteur mémoire", code=40324)
+        store = self.client._server.store(self.name, spec["from"])
+        sub = spec.get("pipeline")
+        if "localField" not in spec:
+            joined = self._run([store.decode(k) for k in store.docs] if store else [], list(sub or []))
+            return [{**d, spec["as"]: [_copy(j) for j in joined]} for d in docs]
+
+        foreign_field = spec["foreignField"]
+        index = store.index_on(foreign_field) if store is not None else None
+        table: Optional[Dict[Hashable, List[Hashable]]] = None
+        if store is not None and index is None:
+            # Sans index sur foreignField: table de hachage construite une fois pour l'étape
+            table = {}
+            for key in store.docs:
+                for v in _flat(_values(store.decode(key), foreign_field)) or [None]:
+                    table.setdefault(_hashable(v), []).append(key)
+        out = []
+        for d in docs:
+            locals_ = _flat(_values(d, spec["localField"])) or [None]
+            keys: Dict[Hashable, None] = {}
+            if store is not None:
+                for v in locals_:
+                    found = index.lookup(v) if index is not None else table.get(_hashable(v), [])  # type: ignore[union-attr]
+                    keys.update(dict.fromkeys(found))
+            matched = []
+            for key in sorted(keys, key=store.orders.__getitem__) if store is not None else ():
+                matched.append(store.decode(key))
+            if sub:
+                matched = self._run(matched, list(sub))
+            new = dict(d)
+            _set_path(new, spec["as"], matched)
+            out.append(new)
+        return out
+
+    def _out(self, docs: List[Dict[str, Any]], name: str) -> None:
+        server = self.client._server
+        old = server.store(self.name, name)
+        indexes = list(old.indexes.values()) if old is not None else []
+        target = _Store()
+        for doc in docs:
+            doc = {"_id": doc.pop("_id", None) or ObjectId(), **doc} if "_id" not in doc or doc["_id"] is None else doc
+            target.put(_hashable(doc["_id"]), doc)
+        for index in indexes:
+            target.add_index(index.name, index.keys, index.options)
+        server.databases.setdefault(self.name, {})[name] = target
+
+
+def _leading_window(pipeline: List[Dict[str, Any]]) -> Optional[Tuple[Optional[List[Tuple[str, int]]], int, int, int]]:
+    """$sort/$skip/$limit en tête du pipeline: (sort, skip, limit, nombre d'étapes), None s'il n'y en a pas."""
+    sort, skip, limit, n = None, 0, 0, 0
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$sort" and n == 0:
+            sort = _normalize_sort(spec)
+        elif name == "$skip" and not limit:
+            skip += spec
+        elif name == "$limit" and not limit:
+            limit = spec
+        else:
+            break
+        n += 1
+    return (sort, skip, limit, n) if n else None
+
+
+def _add_fields(doc: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    out = _copy(doc) if any("." in k for k in spec) else dict(doc)
+    for path, expr in spec.items():
+        value = _eval(expr, doc)
+        if value is not _MISSING:
+            _set_path(out, path, value)
+    return out
+
+
+def _unwind(docs: List[Dict[str, Any]], spec: Any) -> List[Dict[str, Any]]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"][1:]
+    preserve = spec.get("preserveNullAndEmptyArrays", False)
+    index_field = spec.get("includeArrayIndex")
+    out = []
+    for doc in docs:
+        value = _read(doc, path)
+        if isinstance(value, list) and value:
+            for i, item in enumerate(value):
+                new = _copy(doc) if "." in path else dict(doc)
+                _set_path(new, path, item)
+                if index_field:
+                    new[index_field] = i
+                out.append(new)
+        elif value is _MISSING or value is None or value == []:
+            if preserve:
+                new = dict(doc)
+                if value == []:
+                    _unset_path(new, path)
+                if index_field:
+                    new[index_field] = None
+                out.append(new)
+        else:
+            out.append(doc)
+    return out
+
+
+def _group(docs: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[Hashable, Dict[str, Any]] = {}
+    sets: Dict[Tuple[Hashable, str], Set[Hashable]] = {}
+    counts: Dict[Tuple[Hashable, str], int] = {}
+    for doc in docs:
+        key = _value(_eval(spec["_id"], doc))
+        h = _hashable(key)
+        acc = groups.get(h)
+        if acc is None:
+            acc = groups[h] = {"_id": key}
+        for name, accumulator in spec.items():
+            if name == "_id":
+                continue
+            op, expr = next(iter(accumulator.items()))
+            value = _eval(expr, doc) if op != "$count" else 1
+            slot = (h, name)
+            if op in ("$sum", "$count"):
+                acc[name] = acc.get(name, 0) + (value if _num(value) else 0)
+            elif op == "$avg":
+                if _num(value):
+                    acc[name] = acc.get(name) or 0
+                    acc[name] += value
+                    counts[slot] = counts.get(slot, 0) + 1
+                else:
+                    acc.setdefault(name, None)
+            elif op in ("$min", "$max"):
+                if value is not _MISSING and value is not None:
+                    current = acc.get(name)
+                    if current is None or (_key(value) < _key(current) if op == "$min" else _key(value) > _key(current)):
+                        acc[name] = value
+                else:
+                    acc.setdefault(name, None)
+            elif op == "$push":
+                acc.setdefault(name, [])
+                if value is not _MISSING:
+                    acc[name].append(value)
+            elif op == "$addToSet":
+                acc.setdefault(name, [])
+                seen = sets.setdefault(slot, set())
+                if value is not _MISSING and _hashable(value) not in seen:
+                    seen.add(_hashable(value))
+                    acc[name].append(value)
+            elif op == "$first":
+                if name not in acc:
+                    acc[name] = _value(value)
+            elif op == "$last":
+                acc[name] = _value(value)
+            else:
+                raise OperationFailure(f"Accumulateur non supporté par le moteur mémoire: {op}", code=15952)
+    for (h, name), n in counts.items():
+        groups[h][name] = groups[h][name] / n
+    return list(groups.values())
+
+
+def _run_stage_one(doc: Dict[str, Any], stage: Dict[str, Any]) -> Dict[str, Any]:
+    """Étape d'un pipeline de mise à jour ($set/$addFields/$unset/$project/$replaceRoot...)."""
+    name = next(iter(stage))
+    if name not in ("$set", "$addFields", "$unset", "$project", "$replaceRoot", "$replaceWith"):
+        raise OperationFailure(f"Étape interdite dans une mise à jour: {name}", code=72)
+    result = MemoryDatabase._run(None, [doc], [stage])  # type: ignore[arg-type]
+    return result[0]
+
+
+class MemoryClient:
+    """
+    Client memory:// (même interface que MongoClient pour Database). Tous les clients
+    d'une même URI partagent les mêmes données; les options de connexion sont ignorées.
+    """
+
+    # Données propres au processus: les outils multi-processus (seeder) chargent en ligne
+    in_process = True
+
+    def __init__(self, host: str = "memory://", **_: Any):
+        parsed = urlparse(host)
+        key = f"{parsed.netloc}{parsed.path}"
+        with _SERVERS_LOCK:
+            server = _SERVERS.get(key)
+            if server is None:
+                server = _SERVERS[key] = _Server(parsed.path or None)
+        self._server = server
+        self.address = None
+
+    def get_database(self, name: str, codec_options: Optional[CodecOptions] = None, **_: Any) -> MemoryDatabase:
+        return MemoryDatabase(self, name, codec_options)
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        return self.get_database(name)
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_database(name)
+
+    def server_info(self, **_: Any) -> Dict[str, Any]:
+        return {"version": "memory", "ok": 1.0}
+
+    def list_database_names(self, **_: Any) -> List[str]:
+        return list(self._server.databases)
+
+    def drop_database(self, name: str, **_: Any) -> None:
+        with self._server.lock:
+            self._server.databases.pop(name, None)
+
+    def save(self, path: Optional[str] = None) -> str:
+        """Snapshot sur disque (par défaut le chemin de l'URI)."""
+        return self._server.save(path)
+
+    def close(self) -> None:
+        pass
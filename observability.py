@@ -0,0 +1,253 @@
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextvars import ContextVar, copy_context
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from pymongo import monitoring
+
+# Bornes des histogrammes de latence (secondes)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Commandes que explain sait rejouer
+EXPLAINABLE = ("find", "aggregate", "count", "distinct", "update", "delete", "findAndModify")
+
+# Champs de session / cluster à retirer avant de rejouer une commande dans explain
+_COMMAND_META = ("lsid", "$clusterTime", "$db", "txnNumber", "autocommit", "startTransaction", "$readPreference", "readConcern", "writeConcern")
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Quantile approché (borne supérieure du bucket)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class CallContext:
+    """Appel en cours d'une méthode de Database (porté par un ContextVar)."""
+
+    __slots__ = ("metrics", "method", "table", "plan", "commands", "pending")
+
+    def __init__(self, metrics: "Metrics", method: str, table: Optional[str]):
+        self.metrics = metrics
+        self.method = method
+        self.table = table
+        self.plan: Any = None
+        # (nom, durée s, commande) des commandes terminées
+        self.commands: List[Tuple[str, float, Optional[Dict[str, Any]]]] = []
+        # request_id -> commande (explicable) en cours
+        self.pending: Dict[int, Optional[Dict[str, Any]]] = {}
+
+
+_current: ContextVar[Optional[CallContext]] = ContextVar("db_call", default=None)
+
+
+def submit(pool: Executor, fn: Callable[..., Any], *args: Any) -> Future:
+    """
+    pool.submit dans une copie du contexte courant: les commandes des threads de
+    travail (export, import, agrégation parallèle) restent rattachées à l'appel.
+    """
+    return pool.submit(copy_context().run, fn, *args)
+
+
+def map_in_context(pool: Executor, fn: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+    """Équivalent de list(pool.map(fn, items)) avec submit."""
+    return [f.result() for f in [submit(pool, fn, item) for item in items]]
+
+
+def _label(value: Any) -> str:
+    """Valeur d'étiquette Prometheus: \\, " et retours à la ligne échappés."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Métriques d'une instance de Database:
+      - histogramme de latence par méthode
+      - par (méthode, table, commande): nombre, durée, documents, octets (si track_bytes)
+      - journal des appels lents (plan compilé + explain("executionStats"))
+    """
+
+    def __init__(self, slow_query_ms: Optional[float] = None, slow_log_size: int = 100, explain_slow: bool = True, track_bytes: bool = False):
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow = explain_slow
+        self.track_bytes = track_bytes
+        self.methods: Dict[str, Histogram] = {}
+        self.commands: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+        self.slow_log: Deque[Dict[str, Any]] = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def observe_method(self, method: str, seconds: float) -> None:
+        with self._lock:
+            self.methods.setdefault(method, Histogram()).observe(seconds)
+
+    def observe_command(self, ctx: CallContext, name: str, seconds: float, docs: int, size: int) -> None:
+        key = (ctx.method, ctx.table or "", name)
+        with self._lock:
+            c = self.commands.setdefault(key, {"count": 0, "seconds": 0.0, "documents": 0, "bytes": 0, "failures": 0})
+            c["count"] += 1
+            c["seconds"] += seconds
+            c["documents"] += docs
+            c["bytes"] += size
+
+    def observe_failure(self, ctx: CallContext, name: str) -> None:
+        key = (ctx.method, ctx.table or "", name)
+        with self._lock:
+            c = self.commands.setdefault(key, {"count": 0, "seconds": 0.0, "documents": 0, "bytes": 0, "failures": 0})
+            c["failures"] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "methods": {
+                    m: {
+                        "count": h.count,
+                        "sumSeconds": h.sum,
+                        "p50": h.quantile(0.50),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                        "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], h.buckets)),
+                    }
+                    for m, h in self.methods.items()
+                },
+                "commands": [
+                    {"method": m, "table": t, "command": c, **v} for (m, t, c), v in self.commands.items()
+                ],
+                "slowQueries": len(self.slow_log),
+            }
+
+    def prometheus(self, prefix: str = "db") -> str:
+        """Export au format texte Prometheus."""
+        lines: List[str] = []
+        with self._lock:
+            lines.append(f"# TYPE {prefix}_method_duration_seconds histogram")
+            for m, h in sorted(self.methods.items()):
+                cumulative = 0
+                for bound, n in zip([*map(str, BUCKETS), "+Inf"], h.buckets):
+                    cumulative += n
+                    lines.append(f'{prefix}_method_duration_seconds_bucket{{method="{_label(m)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_method_duration_seconds_sum{{method="{_label(m)}"}} {h.sum}')
+                lines.append(f'{prefix}_method_duration_seconds_count{{method="{_label(m)}"}} {h.count}')
+            for field, metric in (("count", "commands_total"), ("seconds", "command_duration_seconds_total"),
+                                  ("documents", "command_documents_total"), ("bytes", "command_bytes_total"),
+                                  ("failures", "command_failures_total")):
+                lines.append(f"# TYPE {prefix}_{metric} counter")
+                for (m, t, c), v in sorted(self.commands.items()):
+                    lines.append(f'{prefix}_{metric}{{method="{_label(m)}",table="{_label(t)}",command="{_label(c)}"}} {v[field]}')
+        return "\n".join(lines) + "\n"
+
+
+def _reply_documents(reply: Dict[str, Any]) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    n = reply.get("n")
+    return int(n) if isinstance(n, int) else 0
+
+
+class CommandTagger(monitoring.CommandListener):
+    """Listener pymongo: rattache chaque commande à la méthode/table de Database en cours."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        ctx = _current.get()
+        if ctx is None:
+            return
+        cmd = None
+        if ctx.metrics.slow_query_ms is not None and event.command_name in EXPLAINABLE:
+            cmd = {k: v for k, v in event.command.items() if k not in _COMMAND_META}
+        ctx.pending[event.request_id] = cmd
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        ctx = _current.get()
+        if ctx is None:
+            return
+        cmd = ctx.pending.pop(event.request_id, None)
+        seconds = event.duration_micros / 1e6
+        size = len(bson.encode(event.reply)) if ctx.metrics.track_bytes else 0
+        ctx.commands.append((event.command_name, seconds, cmd))
+        ctx.metrics.observe_command(ctx, event.command_name, seconds, _reply_documents(event.reply), size)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        ctx = _current.get()
+        if ctx is None:
+            return
+        ctx.pending.pop(event.request_id, None)
+        ctx.metrics.observe_failure(ctx, event.command_name)
+
+
+COMMAND_LISTENER = CommandTagger()
+
+
+def note_plan(plan: Any) -> None:
+    """Mémorise le plan compilé de l'appel en cours (pour le journal des requêtes lentes)."""
+    ctx = _current.get()
+    if ctx is not None:
+        ctx.plan = plan
+
+
+def instrumented(fn: Callable) -> Callable:
+    """
+    Décorateur des méthodes publiques de Database: mesure la durée, rattache les
+    commandes émises à (méthode, table), alimente le journal des appels lents.
+    Les appels imbriqués (get_item_by_pid -> get_item_by_attr) comptent pour l'appel externe.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+        metrics: Optional[Metrics] = getattr(self, "_metrics", None)
+        if metrics is None or _current.get() is not None:
+            return fn(self, *args, **kwargs)
+        table = args[0] if args and isinstance(args[0], str) else kwargs.get("table")
+        ctx = CallContext(metrics, fn.__name__, table)
+        token = _current.set(ctx)
+        t0 = time.perf_counter()
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - t0
+            _current.reset(token)
+            metrics.observe_method(fn.__name__, seconds)
+            if metrics.slow_query_ms is not None and seconds * 1000 >= metrics.slow_query_ms:
+                self._record_slow_call(ctx, seconds)
+
+    return wrapper
+
+
+def slow_entry(ctx: CallContext, seconds: float) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Entrée du journal des appels lents + commande la plus lente à passer dans explain."""
+    explainable = [c for c in ctx.commands if c[2] is not None]
+    slowest = max(explainable, key=lambda c: c[1])[2] if explainable else None
+    entry = {
+        "at": datetime.now(timezone.utc),
+        "method": ctx.method,
+        "table": ctx.table,
+        "durationMs": seconds * 1000,
+        "plan": ctx.plan.to_dict() if hasattr(ctx.plan, "to_dict") else ctx.plan,
+        "commands": [{"command": name, "durationMs": s * 1000} for name, s, _ in ctx.commands],
+        "explain": None,
+    }
+    return entry, slowest
@@ -0,0 +1,135 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import bson
+
+from bson_order import bson_order
+
+# Étapes appliquées document par document: le résultat d'une partition ne dépend pas des autres
+PER_DOCUMENT_STAGES = (
+    "$match", "$project", "$addFields", "$set", "$unset", "$unwind", "$lookup", "$replaceRoot", "$replaceWith",
+)
+# Étapes finales rejouées en Python après la fusion
+TRAILING_STAGES = ("$sort", "$skip", "$limit")
+MERGEABLE = ("$sum", "$avg", "$min", "$max", "$push", "$addToSet", "$count")
+
+
+@dataclass
+class ParallelPlan:
+    """
+    Pipeline découpé pour une exécution par partitions:
+      prefix  -> étapes par document + $group partiel (exécuté sur chaque partition)
+      merge   -> (champ, accumulateur) à fusionner en Python
+      trailing-> $sort/$skip/$limit appliqués au résultat fusionné
+    """
+
+    prefix: List[Dict[str, Any]]
+    merge: List[Tuple[str, str]]
+    trailing: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def plan_parallel(pipeline: List[Dict[str, Any]]) -> Optional[ParallelPlan]:
+    """ParallelPlan si le pipeline est décomposable, sinon None (exécution en une passe)."""
+    stages = list(pipeline)
+    i = 0
+    while i < len(stages) and _stage_name(stages[i]) in PER_DOCUMENT_STAGES:
+        i += 1
+    if i >= len(stages) or _stage_name(stages[i]) != "$group":
+        return None
+    trailing = stages[i + 1:]
+    if any(_stage_name(s) not in TRAILING_STAGES for s in trailing):
+        return None
+
+    partial: Dict[str, Any] = {"_id": stages[i]["$group"]["_id"]}
+    merge: List[Tuple[str, str]] = []
+    for name, acc in stages[i]["$group"].items():
+        if name == "_id":
+            continue
+        if not isinstance(acc, dict) or len(acc) != 1:
+            return None
+        op, expr = next(iter(acc.items()))
+        if op not in MERGEABLE:
+            return None
+        if op == "$count":
+            partial[name] = {"$sum": 1}
+            op = "$sum"
+        elif op == "$avg":
+            # Moyenne = somme / nombre de valeurs numériques (comme $avg, qui ignore le reste)
+            partial[f"{name}__sum"] = {"$sum": expr}
+            partial[f"{name}__n"] = {"$sum": {"$cond": [{"$isNumber": expr}, 1, 0]}}
+        else:
+            partial[name] = {op: expr}
+        merge.append((name, op))
+    return ParallelPlan(prefix=stages[:i] + [{"$group": partial}], merge=merge, trailing=trailing)
+
+
+def merge_partials(plan: ParallelPlan, partials: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Fusionne les résultats partiels des partitions puis applique $sort/$skip/$limit."""
+    groups: Dict[Hashable, Dict[str, Any]] = {}
+    for rows in partials:
+        for row in rows:
+            key = _hashable(row["_id"])
+            acc = groups.get(key)
+            if acc is None:
+                groups[key] = dict(row)
+                continue
+            for name, op in plan.merge:
+                if op == "$avg":
+                    acc[f"{name}__sum"] += row[f"{name}__sum"]
+                    acc[f"{name}__n"] += row[f"{name}__n"]
+                elif op == "$sum":
+                    acc[name] += row[name]
+                elif op in ("$min", "$max"):
+                    values = [v for v in (acc.get(name), row.get(name)) if v is not None]
+                    acc[name] = (min if op == "$min" else max)(values, key=bson_order) if values else None
+                elif op == "$push":
+                    acc[name] = acc[name] + row[name]
+                else:  # $addToSet
+                    seen = {_hashable(v) for v in acc[name]}
+                    acc[name] = acc[name] + [v for v in row[name] if _hashable(v) not in seen]
+
+    results: List[Dict[str, Any]] = []
+    for acc in groups.values():
+        out: Dict[str, Any] = {"_id": acc["_id"]}
+        for name, op in plan.merge:
+            if op == "$avg":
+                n = acc[f"{name}__n"]
+                out[name] = acc[f"{name}__sum"] / n if n else None
+            else:
+                out[name] = acc.get(name)
+        results.append(out)
+    return apply_trailing(results, plan.trailing)
+
+
+def apply_trailing(rows: List[Dict[str, Any]], stages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for stage in stages:
+        name = _stage_name(stage)
+        if name == "$sort":
+            # Tris stables successifs, de la dernière clé à la première, dans l'ordre BSON
+            # (null/absent < nombres < chaînes < documents...: _id composés et types mêlés)
+            for key, direction in reversed(list(stage["$sort"].items())):
+                rows.sort(key=lambda r, k=key: bson_order(_get(r, k)), reverse=direction < 0)
+        elif name == "$skip":
+            rows = rows[stage["$skip"]:]
+        else:
+            rows = rows[: stage["$limit"]]
+    return rows
+
+
+def _stage_name(stage: Dict[str, Any]) -> str:
+    return next(iter(stage))
+
+
+def _get(doc: Dict[str, Any], path: str) -> Any:
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _hashable(value: Any) -> Hashable:
+    """Clé de regroupement: les documents et tableaux (non hashables) sont comparés par leur encodage BSON."""
+    if isinstance(value, (dict, list)):
+        return bson.encode({"v": value})
+    return value
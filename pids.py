@@ -0,0 +1,220 @@
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set
+
+from bson.binary import Binary, UUID_SUBTYPE
+from bson.codec_options import CodecOptions
+from bson.raw_bson import DEFAULT_RAW_BSON_OPTIONS, RawBSONDocument
+
+from serializer import JSON_CODEC_OPTIONS
+
+# Stratégies de pid (toutes sur 128 bits, converties l'une dans l'autre sans perte):
+#   - "uuid4": 32 caractères hexadécimaux aléatoires (historique)
+#   - "ulid":  26 caractères Crockford base32, horodatage ms en tête (ordonné dans le temps)
+#   - "uuid7": UUID v7 (horodatage ms en tête) stocké en BSON binaire (16 octets);
+#              l'API l'expose en 32 caractères hexadécimaux, comme uuid4
+PID_STRATEGIES = ("uuid4", "ulid", "uuid7")
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_CROCKFORD_INDEX = {c: i for i, c in enumerate(_CROCKFORD)}
+_MASK_128 = (1 << 128) - 1
+
+# Opérateurs de filtre dont la valeur est un pid ou une liste de pids. Les comparaisons
+# gardent leur sens: le serveur ordonne les UUID binaires comme leur forme hexadécimale.
+_VALUE_OPERATORS = ("$eq", "$ne", "$in", "$nin", "$all", "$gt", "$gte", "$lt", "$lte")
+
+
+def check_strategy(strategy: str) -> str:
+    if strategy not in PID_STRATEGIES:
+        raise ValueError(f"pid_strategy doit être l'une de {PID_STRATEGIES}")
+    return strategy
+
+
+def _time_ordered_int() -> int:
+    """48 bits d'horodatage (ms) puis 80 bits aléatoires."""
+    return (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+
+
+def _uuid7_int() -> int:
+    n = _time_ordered_int()
+    # Version 7 et variante RFC 4122
+    n = (n & ~(0xF << 76)) | (0x7 << 76)
+    return (n & ~(0x3 << 62)) | (0x2 << 62)
+
+
+def new_pid(strategy: str) -> Any:
+    """Nouveau pid, dans sa représentation stockée."""
+    if strategy == "uuid4":
+        return uuid.uuid4().hex
+    if strategy == "ulid":
+        return _to_crockford(_time_ordered_int())
+    return Binary(_uuid7_int().to_bytes(16, "big"), UUID_SUBTYPE)
+
+
+def pid_int(value: Any) -> Optional[int]:
+    """Valeur 128 bits d'un pid dans n'importe quelle représentation (None si ce n'en est pas un)."""
+    if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE and len(value) == 16:
+        return int.from_bytes(value, "big")
+    if isinstance(value, uuid.UUID):
+        return value.int
+    if isinstance(value, str):
+        if len(value) == 32 or (len(value) == 36 and value.count("-") == 4):
+            try:
+                return int(value.replace("-", ""), 16)
+            except ValueError:
+                return None
+        if len(value) == 26:
+            return _from_crockford(value)
+    return None
+
+
+def pid_from_int(strategy: str, n: int) -> Any:
+    if strategy == "uuid4":
+        return f"{n:032x}"
+    if strategy == "ulid":
+        return _to_crockford(n)
+    return Binary(n.to_bytes(16, "big"), UUID_SUBTYPE)
+
+
+def api_pid(strategy: str, n: int) -> str:
+    """Pid tel que l'expose l'API (uuid7: 32 caractères hexadécimaux, comme uuid4)."""
+    return f"{n:032x}" if strategy == "uuid7" else pid_from_int(strategy, n)
+
+
+def convert_pid(strategy: str, value: Any) -> Any:
+    """Réécrit un pid dans la représentation de strategy (les valeurs qui ne sont pas des pids restent telles quelles)."""
+    n = pid_int(value)
+    return value if n is None else pid_from_int(strategy, n)
+
+
+def _to_crockford(n: int) -> str:
+    chars = []
+    for _ in range(26):
+        chars.append(_CROCKFORD[n & 31])
+        n >>= 5
+    return "".join(reversed(chars))
+
+
+def _from_crockford(value: str) -> Optional[int]:
+    n = 0
+    for c in value.upper():
+        i = _CROCKFORD_INDEX.get(c)
+        if i is None:
+            return None
+        n = n << 5 | i
+    return n if n <= _MASK_128 else None
+
+
+# ======================
+# Conversion transparente (stratégie binaire)
+# ======================
+def _api_value(value: Any) -> Any:
+    """Pid binaire (Binary ou uuid.UUID selon les options de décodage) -> 32 caractères hexadécimaux."""
+    if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE:
+        return value.hex()
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    if isinstance(value, list):
+        return [_api_value(v) for v in value]
+    return value
+
+
+def pid_document_class(fields: Set[str]) -> type:
+    """
+    Classe de document (document_class des CodecOptions) qui relit en hexadécimal les
+    UUID binaires des seuls champs nommés dans fields (pid, références), à toute
+    profondeur ($lookup compris). Les autres champs binaires restent des Binary.
+    fields est lu à chaque décodage: une référence déclarée plus tard est prise en compte.
+    """
+
+    class PidDocument(dict):
+        __slots__ = ()
+
+        def __setitem__(self, key: str, value: Any) -> None:
+            dict.__setitem__(self, key, _api_value(value) if key in fields else value)
+
+    return PidDocument
+
+
+def pid_raw_document_class(fields: Set[str], json_codec_options: CodecOptions) -> type:
+    """
+    RawBSONDocument dont les champs pid/références sont relus en hexadécimal à l'accès.
+    json_codec_options: options utilisées par serializer pour décoder le document entier.
+    """
+
+    class PidRawBSONDocument(RawBSONDocument):
+        __slots__ = ()
+
+        @staticmethod
+        def _inflate_bson(bson_bytes: Any, codec_options: CodecOptions) -> Mapping[str, Any]:
+            doc = RawBSONDocument._inflate_bson(bson_bytes, codec_options)
+            for key in fields.intersection(doc):
+                doc[key] = _api_value(doc[key])
+            return doc
+
+    PidRawBSONDocument.json_codec_options = json_codec_options
+    return PidRawBSONDocument
+
+
+class PidCodec:
+    """
+    Conversion entre pids de l'API (str) et pids stockés, pour pid et les champs
+    de référence. Sans effet (et sans coût) pour les stratégies stockées en texte.
+    """
+
+    def __init__(self, strategy: str):
+        self.strategy = check_strategy(strategy)
+        self.binary = strategy == "uuid7"
+        # Champs relus en hexadécimal: pid et toutes les références déclarées (toutes tables)
+        self.fields: Set[str] = {"pid"}
+        if self.binary:
+            document_class = pid_document_class(self.fields)
+            self.codec_options: Optional[CodecOptions] = CodecOptions(document_class=document_class)
+            self.raw_codec_options = DEFAULT_RAW_BSON_OPTIONS.with_options(
+                document_class=pid_raw_document_class(
+                    self.fields, JSON_CODEC_OPTIONS.with_options(document_class=document_class)
+                )
+            )
+        else:
+            self.codec_options = None
+            self.raw_codec_options = DEFAULT_RAW_BSON_OPTIONS
+
+    def new(self) -> Any:
+        return new_pid(self.strategy)
+
+    def to_api(self, value: Any) -> Any:
+        return value.hex() if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE else value
+
+    def encode(self, value: Any) -> Any:
+        """Un pid, une liste de pids, ou {"$each"/"$in"...: [...]} (valeurs non-pid inchangées)."""
+        if not self.binary:
+            return value
+        if isinstance(value, list):
+            return [self.encode(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.encode(v) if k in _VALUE_OPERATORS or k == "$each" else v for k, v in value.items()}
+        return convert_pid(self.strategy, value)
+
+    def encode_pids(self, pids: Iterable[Any]) -> List[Any]:
+        return [self.encode(p) for p in pids] if self.binary else list(pids)
+
+    def encode_filter(self, flt: Dict[str, Any], fields: Set[str]) -> Dict[str, Any]:
+        """Filtre dont les conditions sur les champs pid/références utilisent la représentation stockée."""
+        if not self.binary or not flt:
+            return flt
+        out: Dict[str, Any] = {}
+        for key, value in flt.items():
+            if key in ("$and", "$or", "$nor"):
+                out[key] = [self.encode_filter(f, fields) for f in value]
+            elif key in fields:
+                out[key] = self.encode(value)
+            else:
+                out[key] = value
+        return out
+
+    def encode_data(self, data: Dict[str, Any], fields: Set[str]) -> Dict[str, Any]:
+        """Document (création / $set) dont les champs de référence sont convertis."""
+        if not self.binary:
+            return data
+        return {k: self.encode(v) if k in fields else v for k, v in data.items()}
@@ -0,0 +1,166 @@
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from bson.son import SON
+
+if TYPE_CHECKING:
+    from query_compiler import QueryPlan
+
+# Étapes dont l'ordre des clés a un sens (tri): conservé par la forme canonique
+_ORDERED = ("$sort",)
+
+
+def canonical(value: Any, ordered: bool = False) -> Any:
+    """
+    Forme canonique d'un filtre / d'étapes: clés des documents triées (sauf sous $sort),
+    pour que {"a": 1, "b": 2} et {"b": 2, "a": 1} donnent la même clé de cache.
+    """
+    if isinstance(value, dict):
+        items = [(k, canonical(v, k in _ORDERED)) for k, v in value.items()]
+        return SON(items if ordered else sorted(items, key=lambda kv: kv[0]))
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    return value
+
+
+def plan_stages(plan: "QueryPlan") -> List[Dict[str, Any]]:
+    """Étapes équivalentes au plan (find: $match/$sort/$skip/$limit/$project)."""
+    if plan.kind != "find":
+        return plan.stages
+    stages: List[Dict[str, Any]] = [{"$match": plan.filter}]
+    if plan.sort:
+        stages.append({"$sort": SON(plan.sort)})
+    if plan.skip:
+        stages.append({"$skip": plan.skip})
+    if plan.limit:
+        stages.append({"$limit": plan.limit})
+    if plan.projection is not None:
+        stages.append({"$project": plan.projection})
+    return stages
+
+
+def referenced_tables(stages: Iterable[Dict[str, Any]], found: Optional[List[str]] = None) -> List[str]:
+    """Collections lues par des étapes: $lookup/$graphLookup from, $unionWith, y compris imbriquées."""
+    found = [] if found is None else found
+    for stage in stages:
+        for name, spec in stage.items():
+            target = None
+            if name in ("$lookup", "$graphLookup"):
+                target = spec.get("from")
+            elif name == "$unionWith":
+                target = spec if isinstance(spec, str) else spec.get("coll")
+            if target and target not in found:
+                found.append(target)
+            if name in ("$lookup", "$unionWith") and isinstance(spec, dict):
+                referenced_tables(spec.get("pipeline") or [], found)
+            elif name == "$facet":
+                for sub in spec.values():
+                    referenced_tables(sub, found)
+    return found
+
+
+class QueryCache:
+    """
+    Cache des résultats de get_items, clé = forme canonique du plan (table, étapes,
+    options). Chaque entrée retient la version de chaque collection lue (table,
+    cibles des $lookup); une écriture incrémente la version de sa collection
+    (Database._bump): une entrée dont une version a changé n'est plus servie.
+    Les résultats sont stockés encodés en BSON (copie à l'entrée et à la sortie,
+    taille mesurée); éviction LRU au-delà de max_bytes.
+    Thread-safe. Ne voit que les écritures de ce processus.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[bytes, Tuple[Tuple[str, ...], Tuple[int, ...], bytes]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    # -------- Clés et versions
+    @staticmethod
+    def key(table: str, plan: "QueryPlan", **options: Any) -> bytes:
+        return bson.encode(SON([
+            ("table", table),
+            ("stages", canonical(plan_stages(plan))),
+            ("count", canonical(plan.count_stages)),
+            ("options", canonical(options)),
+        ]))
+
+    @staticmethod
+    def tables(table: str, plan: "QueryPlan") -> Tuple[str, ...]:
+        return tuple(referenced_tables(plan_stages(plan) + (plan.count_stages or []), [table]))
+
+    def versions(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(t, 0) for t in tables)
+
+    def bump(self, table: str) -> None:
+        """Après une écriture sur table: les entrées qui l'ont lue deviennent périmées."""
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    # -------- Lecture / écriture
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.versions(entry[0]) != entry[1]:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            blob = entry[2]
+        return bson.decode(blob)
+
+    def put(self, key: bytes, tables: Tuple[str, ...], versions: Tuple[int, ...], value: Dict[str, Any]) -> None:
+        """versions: lues avant la requête (un résultat déjà périmé n'est pas mis en cache)."""
+        blob = bson.encode(value)
+        size = len(blob) + len(key)
+        with self._lock:
+            if self.versions(tables) != versions:
+                return
+            if size > self.max_bytes:
+                self.rejected += 1
+                return
+            self._drop(key)
+            self._entries[key] = (tables, versions, blob)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": (self.hits / lookups) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "rejected": self.rejected,
+            }
+
+    def _drop(self, key: bytes) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[2]) + len(key)
@@ -0,0 +1,272 @@
+import base64
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bson import json_util
+
+# Étapes qui ne changent pas le nombre de documents (1 doc en entrée -> 1 doc en sortie)
+ONE_TO_ONE_STAGES = ("$lookup", "$addFields", "$set")
+
+
+@dataclass
+class QueryPlan:
+    """
+    Plan compilé d'un appel get_items / get_item_by_attr.
+      - kind == "find":      filter / projection / sort / skip / limit pour find() ou find_one()
+      - kind == "aggregate": stages (page) et count_stages (total) pour aggregate()
+    count_stages vaut None quand le total se calcule avec count_documents(filter).
+    """
+
+    kind: str
+    filter: Dict[str, Any]
+    projection: Optional[Dict[str, int]] = None
+    sort: Optional[List[Tuple[str, int]]] = None
+    skip: int = 0
+    limit: Optional[int] = None
+    stages: List[Dict[str, Any]] = field(default_factory=list)
+    count_stages: Optional[List[Dict[str, Any]]] = None
+    notes: List[str] = field(default_factory=list)
+    # Découpage pour $facet: préfixe commun (ce qui détermine le total) + étapes de la page
+    count_prefix: List[Dict[str, Any]] = field(default_factory=list)
+    page_stages: List[Dict[str, Any]] = field(default_factory=list)
+
+    def facet_stages(self) -> List[Dict[str, Any]]:
+        """
+        Page + total en une seule agrégation: prefix + $facet {items, total}.
+        La page tient dans un seul document (16 Mo): à réserver aux plans avec limit.
+        """
+        return self.count_prefix + [{
+            "$facet": {
+                "items": self.page_stages or [{"$skip": 0}],
+                "total": [{"$count": "count"}],
+            }
+        }]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "filter": self.filter,
+            "projection": self.projection,
+            "sort": self.sort,
+            "skip": self.skip,
+            "limit": self.limit,
+            "stages": self.stages,
+            "count_stages": self.count_stages,
+            "facet_stages": self.facet_stages(),
+            "notes": self.notes,
+        }
+
+
+def _root(path: str) -> str:
+    return path.split(".", 1)[0]
+
+
+def match_roots(query: Dict[str, Any]) -> Optional[Set[str]]:
+    """
+    Champs (racines) référencés par un filtre $match.
+    Retourne None si le filtre utilise un opérateur de niveau racine ($expr, $where,
+    $text...) qui peut référencer n'importe quel champ.
+    """
+    roots: Set[str] = set()
+    for k, v in query.items():
+        if k in ("$and", "$or", "$nor"):
+            for sub in v:
+                sub_roots = match_roots(sub)
+                if sub_roots is None:
+                    return None
+                roots |= sub_roots
+        elif k.startswith("$"):
+            return None
+        else:
+            roots.add(_root(k))
+    return roots
+
+
+def produced_roots(stage: Dict[str, Any]) -> Set[str]:
+    """Champs (racines) ajoutés par une étape 1:1 ($lookup.as, clés de $addFields/$set)."""
+    name, spec = next(iter(stage.items()))
+    if name == "$lookup":
+        return {_root(spec["as"])}
+    if name in ("$addFields", "$set"):
+        return {_root(k) for k in spec}
+    return set()
+
+
+def merge_matches(matches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fusionne plusieurs filtres $match en un seul (dict si pas de conflit, sinon $and)."""
+    matches = [m for m in matches if m]
+    if not matches:
+        return {}
+    if len(matches) == 1:
+        return dict(matches[0])
+    merged: Dict[str, Any] = {}
+    for m in matches:
+        if any(k in merged for k in m):
+            return {"$and": matches}
+        merged.update(m)
+    return merged
+
+
+def hoist_matches(pipeline: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Remonte les $match du pipeline qui ne dépendent d'aucun champ produit par
+    une étape précédente. Un $match traverse $lookup / $addFields / $set / $sort;
+    toute autre étape ($unwind, $group, $project, $limit...) bloque la remontée.
+    Retourne (filtres remontés, pipeline restant).
+    """
+    hoisted: List[Dict[str, Any]] = []
+    rest: List[Dict[str, Any]] = []
+    produced: Set[str] = set()
+    barrier = False
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$match" and not barrier:
+            roots = match_roots(spec)
+            if roots is not None and not (roots & produced):
+                hoisted.append(spec)
+                continue
+            rest.append(stage)
+            continue
+        rest.append(stage)
+        if name in ONE_TO_ONE_STAGES:
+            produced |= produced_roots(stage)
+        elif name != "$sort":
+            barrier = True
+    return hoisted, rest
+
+
+def compile_query(
+    attributes: Dict[str, Any],
+    projection: Optional[Dict[str, int]] = None,
+    sort: Optional[Dict[str, int]] = None,
+    skip: int = 0,
+    limit: Optional[int] = None,
+    pipeline: Optional[List[Dict[str, Any]]] = None,
+) -> QueryPlan:
+    """
+    Compile les paramètres de get_items en un QueryPlan:
+      1. les $match du pipeline remontables sont fusionnés avec attributes
+         (ils filtrent donc les documents stockés, avant la projection);
+      2. sans étape restante -> find() avec sort/skip/limit/projection;
+      3. sinon, si le reste du pipeline est 1:1 ($lookup/$addFields/$set) et que
+         le tri ne dépend pas des champs produits, $sort/$skip/$limit passent
+         avant les $lookup (la jointure ne porte plus que sur la page).
+    La projection vient en dernier (après le pipeline et la fenêtre): les étapes et
+    le tri voient les documents complets, comme find() qui trie avant de projeter.
+    """
+    skip = int(skip or 0)
+    limit = int(limit) if limit is not None else None
+    hoisted, rest = hoist_matches(list(pipeline or []))
+    flt = merge_matches([attributes, *hoisted])
+    sort_list = list(sort.items()) if sort else None
+    notes: List[str] = []
+    if hoisted:
+        notes.append(f"{len(hoisted)} $match remonté(s) avant la jointure/projection")
+
+    head: List[Dict[str, Any]] = [{"$match": flt}]
+    project: List[Dict[str, Any]] = [{"$project": projection}] if projection is not None else []
+    window: List[Dict[str, Any]] = []
+    if sort:
+        window.append({"$sort": sort})
+    if skip:
+        window.append({"$skip": skip})
+    if limit is not None:
+        window.append({"$limit": limit})
+
+    if not rest:
+        return QueryPlan(
+            "find", flt, projection, sort_list, skip, limit, notes=notes,
+            count_prefix=head, page_stages=window + project,
+        )
+
+    one_to_one = all(next(iter(s)) in ONE_TO_ONE_STAGES for s in rest)
+    produced: Set[str] = set()
+    for s in rest:
+        produced |= produced_roots(s)
+    sort_roots = {_root(k) for k in (sort or {})}
+
+    if window and one_to_one and not (sort_roots & produced):
+        stages = head + window + rest + project
+        notes.append("$sort/$skip/$limit placés avant les étapes 1:1")
+    else:
+        stages = head + rest + window + project
+
+    # Un pipeline 1:1 ne change pas le total: count_documents(filter) suffit
+    if one_to_one:
+        return QueryPlan(
+            "aggregate", flt, projection, sort_list, skip, limit, stages, None, notes,
+            count_prefix=head, page_stages=stages[1:],
+        )
+    return QueryPlan(
+        "aggregate", flt, projection, sort_list, skip, limit, stages, head + rest + [{"$count": "count"}], notes,
+        count_prefix=head + rest, page_stages=window + project,
+    )
+
+
+# ======================
+# Pagination par curseur (keyset)
+# ======================
+def keyset_sort(sort: Optional[Dict[str, int]]) -> List[Tuple[str, int]]:
+    """Tri total: le tri demandé + pid en départage (même sens que la dernière clé)."""
+    keys = [(k, int(d)) for k, d in (sort or {}).items() if k != "pid"]
+    last = keys[-1][1] if keys else 1
+    return keys + [("pid", (sort or {}).get("pid", last))]
+
+
+def get_path(doc: Dict[str, Any], path: str) -> Any:
+    cur: Any = doc
+    for part in path.split("."):
+        if not isinstance(cur, dict):
+            return None
+        cur = cur.get(part)
+    return cur
+
+
+def _after(key: str, direction: int, value: Any) -> Optional[Dict[str, Any]]:
+    """Filtre "strictement après value" pour une clé, null compris (null est en tête en ASC)."""
+    if value is None:
+        return {key: {"$ne": None}} if direction == 1 else None
+    if direction == 1:
+        return {key: {"$gt": value}}
+    return {"$or": [{key: {"$lt": value}}, {key: None}]}
+
+
+def keyset_filter(sort_keys: List[Tuple[str, int]], values: List[Any]) -> Dict[str, Any]:
+    """
+    Prédicat de reprise après la ligne (values) pour le tri sort_keys:
+      (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... (égalités + pid > dernier pid)
+    Chaque branche est un intervalle sur l'index composé (k1, k2, ..., pid).
+    """
+    branches: List[Dict[str, Any]] = []
+    for i, (key, direction) in enumerate(sort_keys):
+        after = _after(key, direction, values[i])
+        if after is None:
+            continue
+        eq = {k: v for (k, _), v in zip(sort_keys[:i], values[:i])}
+        branches.append(merge_matches([eq, after]) if eq else after)
+    if not branches:
+        return {"pid": {"$exists": False}}
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def _sort_fingerprint(sort_keys: List[Tuple[str, int]]) -> str:
+    return hashlib.sha1(repr(sort_keys).encode()).hexdigest()[:8]
+
+
+def encode_page_token(sort_keys: List[Tuple[str, int]], doc: Dict[str, Any]) -> str:
+    """Jeton opaque: clés de tri + pid de la dernière ligne (json étendu en base64url)."""
+    payload = {"s": _sort_fingerprint(sort_keys), "v": [get_path(doc, k) for k, _ in sort_keys]}
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_page_token(sort_keys: List[Tuple[str, int]], token: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json_util.loads(raw)
+        values = payload["v"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Jeton de pagination invalide.") from e
+    if payload.get("s") != _sort_fingerprint(sort_keys) or len(values) != len(sort_keys):
+        raise ValueError("Jeton de pagination émis pour un autre tri.")
+    return values
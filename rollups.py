@@ -0,0 +1,197 @@
+"""
+Rollups: compteurs agrégés d'une table (count/sum par valeur d'un champ), tenus à
+jour par $inc à chaque écriture de Database.
+
+Concurrence: les écarts viennent d'une image avant et d'une image après l'écriture.
+  - écritures unitaires (*_item_by_*): image avant lue par l'écriture elle-même
+    (find_one_and_update / find_one_and_delete), image après déduite de l'update;
+    exactes même avec des écritures concurrentes sur le même document.
+  - écritures multi-documents (update/delete_items_*, array_*_by_attr): images lues
+    avant et après l'écriture, hors transaction. Une écriture concurrente sur les mêmes
+    documents entre ces lectures peut être comptée deux fois ou pas du tout; la dérive
+    reste jusqu'au prochain rebuild(), qui la mesure et la corrige.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Optional, Set, Tuple
+
+import bson
+from pymongo import ASCENDING, DeleteOne, UpdateOne
+from pymongo.collection import Collection
+
+if TYPE_CHECKING:
+    from db import Database
+
+ROLLUP_TABLE = "rollups"
+OPS = ("count", "sum")
+
+_ALL = object()
+
+
+@dataclass
+class Rollup:
+    """
+    Compteur agrégé d'une table, par valeur de `by`:
+      - op="count": nombre de documents
+      - op="sum":   somme de `field` (valeurs non numériques ignorées, comme $sum)
+    Un `by` tableau compte chaque élément (comme $unwind); absent, null ou [] -> clé None.
+    """
+
+    name: str
+    table: str
+    by: str
+    op: str = "count"
+    field: Optional[str] = None
+
+    def roots(self) -> Set[str]:
+        return {p.split(".", 1)[0] for p in (self.by, self.field) if p}
+
+    def keys(self, doc: Dict[str, Any]) -> List[Any]:
+        value = _get(doc, self.by)
+        if isinstance(value, list):
+            return value or [None]
+        return [value]
+
+    def amount(self, doc: Dict[str, Any]) -> float:
+        if self.op == "count":
+            return 1
+        value = _get(doc, self.field)
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+    def pipeline(self) -> List[Dict[str, Any]]:
+        """Recalcul complet côté serveur."""
+        amount: Any = 1 if self.op == "count" else f"${self.field}"
+        return [
+            {"$unwind": {"path": f"${self.by}", "preserveNullAndEmptyArrays": True}},
+            {"$group": {"_id": {"$ifNull": [f"${self.by}", None]}, "value": {"$sum": amount}}},
+        ]
+
+
+class RollupStore:
+    """
+    Rollups déclarés et leur collection: une ligne {rollup, key, value} par valeur
+    de regroupement, index unique (rollup, key). Chaque écriture source applique
+    ses écarts par $inc (upsert), une opération atomique par clé.
+    """
+
+    def __init__(self, db: "Database", table: str = ROLLUP_TABLE):
+        self._db = db
+        self.table = table
+        self.rollups: Dict[str, Rollup] = {}
+        self._indexed = False
+
+    @property
+    def col(self) -> Collection:
+        col = self._db._db[self.table]
+        if not self._indexed:
+            col.create_index([("rollup", ASCENDING), ("key", ASCENDING)], unique=True)
+            self._indexed = True
+        return col
+
+    def declare(self, rollup: Rollup) -> None:
+        if rollup.op not in OPS:
+            raise ValueError(f"op doit être l'un de {OPS}")
+        if rollup.op == "sum" and not rollup.field:
+            raise ValueError("Un rollup sum nécessite field.")
+        self.rollups[rollup.name] = rollup
+
+    def for_table(self, table: str, fields: Optional[List[str]] = None) -> List[Rollup]:
+        """Rollups de la table touchés par ces champs (fields=None: tous, pour créations et suppressions)."""
+        if not self.rollups:
+            return []
+        roots = None if fields is None else {f.split(".", 1)[0] for f in fields}
+        return [r for r in self.rollups.values() if r.table == table and (roots is None or r.roots() & roots)]
+
+    @staticmethod
+    def projection(rollups: List[Rollup]) -> Dict[str, int]:
+        proj = {"pid": 1, "_id": 0}
+        for r in rollups:
+            proj.update({p: 1 for p in (r.by, r.field) if p})
+        return proj
+
+    # -------- Écritures
+    def apply(self, rollups: List[Rollup], before: List[Dict[str, Any]], after: List[Dict[str, Any]]) -> None:
+        """Applique les écarts entre images avant et après écriture (créations: before=[], suppressions: after=[])."""
+        ops: List[UpdateOne] = []
+        for r in rollups:
+            deltas: Dict[Hashable, Tuple[Any, float]] = {}
+            for docs, sign in ((before, -1), (after, 1)):
+                for doc in docs:
+                    amount = r.amount(doc)
+                    for key in r.keys(doc):
+                        # Clés comme à la lecture (pids binaires des créations -> hexadécimal)
+                        key = self._db._pids.to_api(key)
+                        k = _hashable(key)
+                        deltas[k] = (key, deltas.get(k, (key, 0))[1] + sign * amount)
+            ops.extend(
+                UpdateOne({"rollup": r.name, "key": key}, {"$inc": {"value": delta}}, upsert=True)
+                for key, delta in deltas.values()
+                if delta
+            )
+        if ops:
+            self.col.bulk_write(ops, ordered=False)
+            self._db._bump(self.table)
+
+    def reset_table(self, table: str) -> None:
+        """Table source supprimée: ses rollups repartent de zéro."""
+        names = [r.name for r in self.rollups.values() if r.table == table]
+        if names:
+            self.col.delete_many({"rollup": {"$in": names}})
+            self._db._bump(self.table)
+
+    # -------- Lecture
+    def get(self, name: str, key: Any = _ALL) -> Any:
+        if name not in self.rollups:
+            raise ValueError(f"Rollup inconnu: {name}")
+        if key is not _ALL:
+            row = self.col.find_one({"rollup": name, "key": key}, {"value": 1, "_id": 0})
+            return row["value"] if row else 0
+        return {row["key"]: row["value"] for row in self.col.find({"rollup": name}, {"key": 1, "value": 1, "_id": 0})}
+
+    # -------- Reconstruction
+    def rebuild(self, name: str, sample_size: int = 20) -> Dict[str, Any]:
+        """
+        Recalcule le rollup depuis la table source, remplace les valeurs stockées
+        et retourne la dérive constatée (clés dont la valeur stockée différait).
+        Seul moyen de corriger la dérive des écritures multi-documents concurrentes
+        (voir en tête du module); à lancer hors écritures, dont les $inc pendant
+        le recalcul seraient écrasés.
+        """
+        r = self.rollups[name]
+        expected = {
+            _hashable(row["_id"]): (row["_id"], row["value"])
+            for row in self._db._db[r.table].aggregate(r.pipeline(), allowDiskUse=True)
+        }
+        stored = {_hashable(row["key"]): (row["_id"], row["key"], row["value"]) for row in self.col.find({"rollup": name})}
+
+        drift: List[Dict[str, Any]] = []
+        ops: List[Any] = []
+        for k, (key, value) in expected.items():
+            current = stored.get(k, (None, key, 0))[2]
+            if current != value:
+                drift.append({"key": key, "stored": current, "expected": value})
+                ops.append(UpdateOne({"rollup": name, "key": key}, {"$set": {"value": value}}, upsert=True))
+        for k, (_id, key, value) in stored.items():
+            if k not in expected:
+                if value:
+                    drift.append({"key": key, "stored": value, "expected": 0})
+                ops.append(DeleteOne({"_id": _id}))
+        if ops:
+            self.col.bulk_write(ops, ordered=False)
+            self._db._bump(self.table)
+        return {"rollup": name, "keys": len(expected), "drifted": len(drift), "samples": drift[:sample_size], "ok": not drift}
+
+
+def _get(doc: Dict[str, Any], path: Optional[str]) -> Any:
+    value: Any = doc
+    for part in (path or "").split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _hashable(value: Any) -> Hashable:
+    if isinstance(value, (dict, list)):
+        return bson.encode({"v": value})
+    return value
@@ -1,14 +1,33 @@
+import argparse
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
 from db import Database
+from pids import PID_STRATEGIES, api_pid, check_strategy, pid_int
+
+TABLES = ["users", "teams", "projects"]
+
+ROLES = ["dev", "designer", "qa", "manager", "ops"]
+ROLE_WEIGHTS = [60, 10, 10, 10, 10]
+
+# Vocabulaire de tags avec une distribution de Zipf (quelques tags très fréquents)
+TAGS = ["urgent", "ui", "mobile", "data", "backend", "infra", "ml", "security", "api", "docs"] + [f"tag{i}" for i in range(40)]
+TAG_WEIGHTS = [1 / (rank ** 1.1) for rank in range(1, len(TAGS) + 1)]
+
+PID_BYTES = 16
+
 
 def run_seeder():
+    """Jeu de données fixe utilisé par tests.py."""
     db = Database()
 
-    for t in ["users", "teams", "projects"]:
-        try:
-            db.col(t).delete_many({})
-        except Exception:
-            pass
+    for t in TABLES:
+        db.drop_table(t)
 
     # USERS
     users = [
@@ -40,5 +59,159 @@ def run_seeder():
 
     print("✅ Seeder terminé.")
 
+
+# ======================
+# Générateur synthétique
+# ======================
+# Chaque chunk est généré par un Random(seed, table, début du chunk): le contenu
+# ne dépend ni du nombre de workers ni de l'ordre d'exécution. Les références
+# (members, teams) sont tirées par index puis résolues en pid via _REFS, partagé
+# avec les workers par fork (pids concaténés en binaire: 16 octets par pid, quelle
+# que soit la stratégie de pid, voir pids.py).
+_DB: Optional[Database] = None
+_REFS: Dict[str, bytes] = {}
+_STRATEGY = "uuid4"
+
+
+def _ref_pid(table: str, index: int) -> str:
+    return api_pid(_STRATEGY, int.from_bytes(_REFS[table][index * PID_BYTES:(index + 1) * PID_BYTES], "big"))
+
+
+def _skewed_index(rng: random.Random, n: int) -> int:
+    """Index biaisé vers le début: quelques éléments très référencés, une longue traîne."""
+    return min(n - 1, int(n * rng.random() ** 2))
+
+
+def gen_user(rng: random.Random, i: int) -> Dict[str, Any]:
+    return {
+        "name": f"User {i}",
+        "email": f"user{i}@example.com",
+        "role": rng.choices(ROLES, ROLE_WEIGHTS)[0],
+    }
+
+
+def gen_team(rng: random.Random, i: int) -> Dict[str, Any]:
+    n_users = len(_REFS["users"]) // PID_BYTES
+    size = max(1, min(500, int(rng.lognormvariate(math.log(8), 0.8))))
+    members = {_skewed_index(rng, n_users) for _ in range(size)}
+    return {"name": f"Team {i}", "members": [_ref_pid("users", m) for m in sorted(members)]}
+
+
+def gen_project(rng: random.Random, i: int, now: datetime) -> Dict[str, Any]:
+    n_teams = len(_REFS["teams"]) // PID_BYTES
+    n_project_teams = min(n_teams, 1 + int(rng.expovariate(1.5)))
+    teams = {_skewed_index(rng, n_teams) for _ in range(n_project_teams)}
+    tags = set(rng.choices(TAGS, TAG_WEIGHTS, k=rng.randint(1, 4)))
+    # Échéances: majorité à court terme, longue traîne, ~20% déjà dépassées
+    days = int(rng.expovariate(1 / 45)) - 10
+    return {
+        "name": f"Project {i}",
+        "teams": [_ref_pid("teams", t) for t in sorted(teams)],
+        "tags": sorted(tags),
+        "budget": int(rng.lognormvariate(math.log(30_000), 0.9)),
+        "deadline": now + timedelta(days=days, hours=rng.randint(0, 23)),
+    }
+
+
+def _init_worker(refs: Dict[str, bytes], strategy: str) -> None:
+    global _DB, _REFS, _STRATEGY
+    _REFS = refs
+    _STRATEGY = strategy
+    _DB = Database(auto_indexes=False, pid_strategy=strategy)
+
+
+def _load_chunk(table: str, start: int, count: int, seed: int, now: datetime) -> bytes:
+    rng = random.Random(f"{seed}:{table}:{start}")
+    if table == "users":
+        docs = [gen_user(rng, i) for i in range(start, start + count)]
+    elif table == "teams":
+        docs = [gen_team(rng, i) for i in range(start, start + count)]
+    else:
+        docs = [gen_project(rng, i, now) for i in range(start, start + count)]
+    res = _DB.create_items(table, docs, created_by="generator")
+    return b"".join(pid_int(r["pid"]).to_bytes(PID_BYTES, "big") for r in res)
+
+
+def _load_table(table: str, total: int, seed: int, workers: int, chunk_size: int, now: datetime, in_process: bool = False) -> bytes:
+    """Charge une table en parallèle et retourne les pids (binaires, dans l'ordre des index)."""
+    t0 = time.perf_counter()
+    starts = range(0, total, chunk_size)
+    if in_process:
+        # Moteur en mémoire: ce que chargerait un worker resterait dans son processus
+        _init_worker(_REFS, _STRATEGY)
+        pids = b"".join(_load_chunk(table, start, min(chunk_size, total - start), seed, now) for start in starts)
+    else:
+        ctx = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(_REFS, _STRATEGY)) as pool:
+            futures = [pool.submit(_load_chunk, table, start, min(chunk_size, total - start), seed, now) for start in starts]
+            pids = b"".join(f.result() for f in futures)
+    elapsed = time.perf_counter() - t0
+    print(f"  {table:<9} {total:>12,} docs  {elapsed:8.1f}s  {total / elapsed if elapsed else 0:>12,.0f} docs/s")
+    return pids
+
+
+def run_generator(
+    users: int,
+    teams: int,
+    projects: int,
+    seed: int = 42,
+    workers: Optional[int] = None,
+    chunk_size: int = 10_000,
+    pid_strategy: str = "uuid4",
+) -> Dict[str, Any]:
+    """
+    Génère et charge un jeu de données synthétique (collections supprimées puis
+    recréées, index construits après le chargement). Retourne les débits mesurés.
+    """
+    global _STRATEGY
+    _STRATEGY = check_strategy(pid_strategy)
+    workers = workers or multiprocessing.cpu_count()
+    if (teams and not users) or (projects and not teams):
+        raise ValueError("Les teams référencent des users et les projects des teams.")
+    db = Database(auto_indexes=False, pid_strategy=pid_strategy)
+    for t in TABLES:
+        db.drop_table(t)
+    in_process = getattr(db._client, "in_process", False)
+
+    now = datetime.now(timezone.utc)
+    report: Dict[str, Any] = {"seed": seed, "workers": workers, "chunkSize": chunk_size, "pidStrategy": pid_strategy}
+    print(f"Chargement (seed={seed}, workers={workers}, chunk={chunk_size:,})")
+    t0 = time.perf_counter()
+    for table, total in (("users", users), ("teams", teams), ("projects", projects)):
+        if not total:
+            continue
+        t = time.perf_counter()
+        _REFS[table] = _load_table(table, total, seed, workers, chunk_size, now, in_process)
+        report[table] = {"docs": total, "seconds": time.perf_counter() - t}
+        report[table]["docsPerSecond"] = total / report[table]["seconds"]
+
+    t = time.perf_counter()
+    drift = db.ensure_indexes()
+    report["indexSeconds"] = time.perf_counter() - t
+    report["totalSeconds"] = time.perf_counter() - t0
+    errors = {table: d["errors"] for table, d in drift.items() if d["errors"]}
+    if errors:
+        report["indexErrors"] = errors
+    print(f"  index     {report['indexSeconds']:8.1f}s   total {report['totalSeconds']:.1f}s")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Seeder: jeu fixe (sans option) ou données synthétiques à l'échelle.")
+    parser.add_argument("--users", type=int, default=0)
+    parser.add_argument("--teams", type=int, default=0)
+    parser.add_argument("--projects", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--pid-strategy", choices=PID_STRATEGIES, default="uuid4")
+    args = parser.parse_args(argv)
+
+    if not (args.users or args.teams or args.projects):
+        run_seeder()
+        return
+    run_generator(args.users, args.teams, args.projects, seed=args.seed, workers=args.workers, chunk_size=args.chunk_size, pid_strategy=args.pid_strategy)
+
+
 if __name__ == "__main__":
-    run_seeder()
+    main()
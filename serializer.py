@@ -0,0 +1,87 @@
+import base64
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Mapping, TextIO
+
+import bson
+from bson import ObjectId
+from bson.binary import Binary, UuidRepresentation
+from bson.codec_options import CodecOptions
+from bson.decimal128 import Decimal128
+from bson.raw_bson import RawBSONDocument
+from bson.regex import Regex
+from bson.timestamp import Timestamp
+
+# Décodage des RawBSONDocument juste avant l'encodage JSON (UUID standard -> uuid.UUID)
+JSON_CODEC_OPTIONS = CodecOptions(tz_aware=True, uuid_representation=UuidRepresentation.STANDARD)
+
+
+def json_default(value: Any) -> Any:
+    """Types BSON -> JSON: ObjectId/UUID/Decimal128 en texte, dates ISO 8601 (UTC), binaire en base64."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        # MongoDB stocke les dates en UTC: une date naïve est une date UTC
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Binary) and value.subtype == 4:
+        return str(value.as_uuid())
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, Decimal128):
+        return str(value)
+    if isinstance(value, RawBSONDocument):
+        return bson.decode(value.raw, _json_options(value))
+    if isinstance(value, Timestamp):
+        return {"t": value.time, "i": value.inc}
+    if isinstance(value, Regex):
+        return value.pattern
+    raise TypeError(f"Type non sérialisable en JSON: {type(value).__name__}")
+
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=json_default)
+
+
+def _json_options(doc: RawBSONDocument) -> CodecOptions:
+    # Les documents bruts d'une base à pids binaires portent leurs options (pids relus en hexadécimal, voir pids.py)
+    return getattr(doc, "json_codec_options", JSON_CODEC_OPTIONS)
+
+
+def _plain(doc: Mapping[str, Any]) -> Any:
+    # Décodage en C au dernier moment: aucun parcours récursif en Python (contrairement à clean_doc)
+    return bson.decode(doc.raw, _json_options(doc)) if isinstance(doc, RawBSONDocument) else doc
+
+
+def dumps(doc: Mapping[str, Any]) -> str:
+    """Un document (dict ou RawBSONDocument) en JSON compact."""
+    return _ENCODER.encode(_plain(doc))
+
+
+def iter_ndjson(docs: Iterable[Mapping[str, Any]]) -> Iterator[str]:
+    """Une ligne NDJSON par document, au fil de l'itérable (réponse HTTP en flux)."""
+    for doc in docs:
+        yield _ENCODER.encode(_plain(doc)) + "\n"
+
+
+def write_ndjson(docs: Iterable[Mapping[str, Any]], fp: TextIO) -> int:
+    """Écrit les documents en NDJSON dans fp. Retourne le nombre de documents."""
+    n = 0
+    for line in iter_ndjson(docs):
+        fp.write(line)
+        n += 1
+    return n
+
+
+def write_json(docs: Iterable[Mapping[str, Any]], fp: TextIO) -> int:
+    """Écrit les documents comme un tableau JSON, sans construire la liste en mémoire."""
+    n = 0
+    fp.write("[")
+    for doc in docs:
+        if n:
+            fp.write(",")
+        fp.write(_ENCODER.encode(_plain(doc)))
+        n += 1
+    fp.write("]")
+    return n
@@ -1,7 +1,25 @@
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
 from pprint import pprint
-from db import Database
+from db import ASYNC_BACKENDS, Database
+from db_async import AsyncDatabase
+import bench
+import seeder
+import serializer
 from bson import ObjectId
-from datetime import datetime
+from bson.binary import Binary
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta, timezone
 
 
 def clean_doc(doc):
@@ -126,6 +144,498 @@ def main():
     _, urgent_stats = db.get_items("projects", {}, fields=["pid"], return_stats=True, pipeline=[{"$match": {"tags": "urgent"}}])
     log("Nombre de projets urgent", urgent_stats["itemsCount"])
 
+    # --- Index d'appartenance (user -> projects)
+    mdb = Database(membership_index=True)
+    mdb.rebuild_membership()
+    team = mdb.get_item_by_attr("teams", {}, fields=["members"])
+    hugo = mdb.create_item("users", {"name": "Hugo", "email": "hugo@example.com", "role": "dev"}, created_by="tester")["pid"]
+    mdb.array_push_item_by_pid("teams", team["pid"], "members", hugo, updated_by="tester")
+    via_index = sorted(p["pid"] for p in mdb.get_projects_for_user(hugo))
+    via_teams = sorted(p["pid"] for p in db.get_projects_for_user(hugo))
+    assert via_index and via_index == via_teams, (via_index, via_teams)
+    report = mdb.verify_membership()
+    assert report["ok"], report
+    mdb.array_pull_item_by_pid("teams", team["pid"], "members", hugo, updated_by="tester")
+    mdb.delete_item_by_pid("users", hugo)
+    assert mdb.get_projects_for_user(hugo) == []
+    report = mdb.verify_membership()
+    assert report["ok"], report
+    log("Index d'appartenance vérifié", {k: report[k] for k in ("missing", "extra", "mismatched", "ok")})
+
+    # --- Rollups (tenus par les écritures, comparés à un recalcul)
+    rdb = Database()
+    rdb.declare_rollup("tests_projects_by_tag", "projects", by="tags")
+    rdb.declare_rollup("tests_budget_by_tag", "projects", by="tags", op="sum", field="budget")
+    rdb.rebuild_rollups()
+    p = rdb.create_item("projects", {"name": "Rollup", "tags": ["ui", "tests"], "budget": 1000}, created_by="tester")["pid"]
+    rdb.array_pull_item_by_pid("projects", p, "tags", "ui", updated_by="tester")
+    rdb.update_items_by_attr("projects", {"tags": "tests"}, {"budget": 2500}, updated_by="tester")
+    assert rdb.get_rollup("tests_projects_by_tag", "tests") == 1
+    assert rdb.get_rollup("tests_budget_by_tag", "tests") == 2500
+    drift = rdb.rebuild_rollups()
+    assert all(r["ok"] for r in drift.values()), drift
+    rdb.delete_item_by_pid("projects", p)
+    drift = rdb.rebuild_rollups()
+    assert all(r["ok"] for r in drift.values()), drift
+    log("Rollups sans dérive", {name: r["drifted"] for name, r in drift.items()})
+
+    # --- Tableaux en buckets
+    bdb = Database()
+    bdb.drop_table("tests_teams")
+    bdb.declare_bucketed_array("tests_teams", "members", bucket_size=1)
+    users = [u["pid"] for u in bdb.get_items("users", {}, sort={"name": 1})]
+    bt = bdb.create_item("tests_teams", {"name": "Buckets", "members": users[:2]}, created_by="tester")["pid"]
+    bdb.array_push_item_by_pid("tests_teams", bt, "members", {"$each": users + users[:1]}, updated_by="tester")
+    assert bdb.get_item_by_pid("tests_teams", bt, fields=["members"])["members"] == users
+    bdb.array_pull_item_by_pid("tests_teams", bt, "members", users[0], updated_by="tester")
+    bdb.array_push_item_by_pid("tests_teams", bt, "members", users[1], updated_by="tester")
+    members = bdb.get_item_by_pid("tests_teams", bt, fields=["members"])["members"]
+    assert members == users[1:], members
+    assert bdb.get_pids_by_array_item("tests_teams", "members", users[-1]) == [bt]
+    try:
+        bdb.update_item_by_pid("tests_teams", bt, {"members": []})
+        raise AssertionError("$set sur un tableau en buckets accepté")
+    except ValueError:
+        pass
+    bdb.drop_table("tests_teams")
+    log("Buckets push/pull", {"members": len(members)})
+
+    # --- Cache des requêtes (invalidé aussi par les écritures sur les tables d'un $lookup)
+    qdb = Database(query_cache_bytes=1 << 20)
+    lookup = [{"$lookup": {"from": "users", "localField": "members", "foreignField": "pid", "as": "members_info"}}]
+
+    def member_names():
+        teams = qdb.get_items("teams", {}, fields=["members_info.name"], sort={"name": 1}, pipeline=lookup)
+        return sorted(m["name"] for t in teams for m in t["members_info"])
+
+    names = member_names()
+    assert member_names() == names and qdb.query_cache_stats()["hits"] == 1
+    member = qdb.get_item_by_attr("teams", {}, fields=["members"])["members"][0]
+    old_name = qdb.get_item_by_pid("users", member, fields=["name"])["name"]
+    qdb.update_item_by_pid("users", member, {"name": "Renamed"}, updated_by="tester")
+    assert "Renamed" in member_names(), "résultat périmé après une écriture sur la table du $lookup"
+    qdb.update_item_by_pid("users", member, {"name": old_name}, updated_by="tester")
+    assert member_names() == names
+    stats = qdb.query_cache_stats()
+    log("Cache des requêtes", {k: stats[k] for k in ("hits", "misses")})
+
+    # --- Archivage (tier chaud -> <table>_archive, aller-retour des lectures et écritures)
+    adb = Database()
+    for name in ("tests_projects", "tests_projects_archive"):
+        adb.drop_table(name)
+    adb.declare_tiering("tests_projects", "deadline", timedelta(days=365))
+    old = adb.create_item("tests_projects", {"name": "Old", "deadline": datetime.now(timezone.utc) - timedelta(days=400)}, created_by="tester")["pid"]
+    adb.create_item("tests_projects", {"name": "New", "deadline": datetime.now(timezone.utc)}, created_by="tester")
+    assert adb.archive_stale("tests_projects") == {"tests_projects": 1}
+    assert [p["name"] for p in adb.get_items("tests_projects", {}, fields=["name"])] == ["New"]
+    both = adb.get_items("tests_projects", {}, fields=["name"], sort={"deadline": 1}, include_archived=True)
+    assert [p["name"] for p in both] == ["Old", "New"], both
+    assert adb.get_item_by_pid("tests_projects", old) is None
+    assert adb.update_item_by_pid("tests_projects", old, {"name": "Old v2"}, updated_by="tester")
+    assert adb.get_item_by_pid("tests_projects", old, fields=["name"], include_archived=True)["name"] == "Old v2"
+    assert adb.delete_item_by_pid("tests_projects", old)
+    assert adb.get_item_by_pid("tests_projects", old, include_archived=True) is None
+    stats = adb.tiering_stats("tests_projects")["tests_projects"]
+    for name in ("tests_projects", "tests_projects_archive"):
+        adb.drop_table(name)
+    log("Archivage", {"moved": stats["moved"], "archive": stats["tiers"]["archive"]["count"]})
+
+    # --- Database et AsyncDatabase: mêmes pages et mêmes stratégies de comptage
+    cases = [(0, None, "exact"), (1, None, "exact"), (1000, None, "exact"), (1, 1, "exact"), (0, None, "estimated")]
+    sync_pages = [
+        db.get_items("users", {}, fields=["name"], sort={"name": 1}, skip=skip, limit=limit, return_stats=True, count_mode=mode)
+        for skip, limit, mode in cases
+    ]
+    assert [s["countStrategy"] for _, s in sync_pages] == ["len", "len", "count", "facet", "estimated"], sync_pages
+    if os.getenv("MONGODB_URI", "").split("://", 1)[0] in ASYNC_BACKENDS:
+
+        async def async_pages():
+            async with AsyncDatabase() as adb:
+                return [
+                    await adb.get_items("users", {}, fields=["name"], sort={"name": 1}, skip=skip, limit=limit, return_stats=True, count_mode=mode)
+                    for skip, limit, mode in cases
+                ]
+
+        assert asyncio.run(async_pages()) == sync_pages
+        log("AsyncDatabase: mêmes pages que Database", len(cases))
+    else:
+        log("AsyncDatabase: ignoré (moteur sans version async)")
+
+    # --- Lecture sur une table inconnue: ni collection ni index créés
+    assert db.get_items("tests_typo", {}) == []
+    assert db.get_item_by_attr("tests_typo", {"name": "x"}) is None
+    assert "tests_typo" not in db._db.list_collection_names()
+    assert db.declared_indexes("tests_typo") == []
+    log("Table inconnue en lecture: non créée", "tests_typo")
+
+
+    # --- Compilation des requêtes: find() si possible, $project en dernier sinon
+    plan = db.compile_query({"role": "dev"}, fields=["name"], sort={"email": 1}, limit=2)
+    assert plan.kind == "find" and plan.projection == {"pid": 1, "name": 1}, plan
+    lookup = [{"$lookup": {"from": "teams", "localField": "teams", "foreignField": "pid", "as": "teams_info"}}]
+    plan = db.compile_query({}, fields=["name"], sort={"deadline": 1}, pipeline=lookup)
+    assert plan.kind == "aggregate" and list(plan.stages[-1]) == ["$project"], plan.stages
+    # Tri sur un champ non projeté: le tri passe avant la projection
+    by_email = db.get_items("users", {}, fields=["name"], sort={"email": -1})
+    emails = [u["email"] for u in db.get_items("users", {}, fields=["email"])]
+    expected = [db.get_item_by_attr("users", {"email": e}, fields=["name"])["name"] for e in sorted(emails, reverse=True)]
+    assert [u["name"] for u in by_email] == expected and "email" not in by_email[0], by_email
+    log("Compilation des requêtes", {"find": True, "aggregate": [list(s)[0] for s in plan.stages]})
+
+    # --- return_stats: page + total en une agrégation ($facet), total en cache ou estimé
+    total = len(db.get_items("projects", {}, fields=["pid"]))
+    page, stats = db.get_items("projects", {}, fields=["name"], sort={"name": 1}, skip=1, limit=2, return_stats=True)
+    assert stats["countStrategy"] == "facet" and stats["itemsCount"] == total and stats["countExact"], stats
+    assert page == db.get_items("projects", {}, fields=["name"], sort={"name": 1})[1:3]
+    urgent = len(db.get_items("projects", {"tags": "urgent"}, fields=["pid"]))
+    strategies = []
+    for mode in ("cached", "cached", "estimated"):
+        _, stats = db.get_items("projects", {"tags": "urgent"}, fields=["pid"], limit=1, return_stats=True, count_mode=mode)
+        assert stats["itemsCount"] == urgent, stats
+        strategies.append((stats["countStrategy"], stats["countExact"]))
+    # 1er appel compté (exact), puis lu en cache; "estimated" avec filtre retombe sur le cache
+    assert strategies == [("cached", True), ("cached", False), ("cached", False)], strategies
+    _, stats = db.get_items("projects", {}, fields=["pid"], limit=1, return_stats=True, count_mode="estimated")
+    assert stats["countStrategy"] == "estimated" and stats["itemsCount"] == total, stats
+    try:
+        db.get_items("projects", {}, return_stats=True, count_mode="approx")
+        raise AssertionError("count_mode inconnu accepté")
+    except ValueError:
+        pass
+    log("Stratégies de comptage", strategies)
+
+    # --- Pagination keyset: jetons de reprise, tri asc/desc avec valeurs nulles ou absentes
+    db.drop_table("tests_pages")
+    ranks = [3, None, 1, 3, None, 2, 1]
+    db.create_items("tests_pages", [{"name": f"p{i}", **({} if i == 1 else {"rank": r})} for i, r in enumerate(ranks)], created_by="tester")
+    for direction in (1, -1):
+        pages, token = [], None
+        while True:
+            page, token = db.get_items_page("tests_pages", {}, sort={"rank": direction}, page_size=2, after=token, fields=["name"])
+            pages.append([p["name"] for p in page])
+            if token is None:
+                break
+        expected = [p["name"] for p in db.get_items("tests_pages", {}, fields=["name"], sort={"rank": direction, "pid": direction})]
+        assert sum(pages, []) == expected and len(pages) == 4, (direction, pages, expected)
+    try:
+        db.get_items_page("tests_pages", {}, sort={"rank": 1}, after="jeton-invalide")
+        raise AssertionError("jeton invalide accepté")
+    except ValueError:
+        pass
+    db.drop_table("tests_pages")
+    log("Pagination keyset (asc/desc, valeurs nulles)", pages)
+
+    # --- Lecture en flux: mêmes documents que get_items, par lots de chunk_size
+    listed = db.get_items("projects", {}, fields=["name"], sort={"name": 1})
+    streamed = db.iter_items("projects", {}, fields=["name"], sort={"name": 1}, batch_size=2)
+    assert next(streamed) == listed[0]
+    streamed.close()  # consommateur arrêté avant la fin: curseur fermé
+    assert list(db.iter_items("projects", {}, fields=["name"], sort={"name": 1}, batch_size=2)) == listed
+    chunks = list(db.iter_items("projects", {}, fields=["name"], sort={"name": 1}, chunk_size=2))
+    assert [len(c) for c in chunks[:-1]] == [2] * (len(chunks) - 1) and sum(chunks, []) == listed, chunks
+    assert list(db.iter_items_by_attr("users", {"role": "qa"}, fields=["name"])) == db.get_items("users", {"role": "qa"}, fields=["name"])
+    log("Lecture en flux", {"documents": len(listed), "lots": [len(c) for c in chunks]})
+
+
+    # --- Cache des entités par pid (invalidé par chaque écriture)
+    edb = Database(entity_cache_size=100)
+    edb.drop_table("tests_cache")
+    cp = edb.create_item("tests_cache", {"name": "Cache", "tags": ["a"]}, created_by="tester")["pid"]
+    first = edb.get_item_by_pid("tests_cache", cp, fields=["name", "tags"])
+    first["tags"].append("muté")  # copie: le cache n'est pas modifié
+    assert edb.get_item_by_pid("tests_cache", cp, fields=["name", "tags"])["tags"] == ["a"]
+    assert edb.cache_stats()["hits"] == 1
+    edb.update_item_by_pid("tests_cache", cp, {"name": "Cache v2"}, updated_by="tester")
+    assert edb.get_item_by_pid("tests_cache", cp, fields=["name"])["name"] == "Cache v2"
+    edb.array_push_item_by_attr("tests_cache", {"name": "Cache v2"}, "tags", "b", updated_by="tester")
+    assert edb.get_item_by_pid("tests_cache", cp, fields=["tags"])["tags"] == ["a", "b"]
+    edb.delete_items_by_attr("tests_cache", {"name": "Cache v2"})
+    assert edb.get_item_by_pid("tests_cache", cp) is None
+    stats = edb.cache_stats()
+    edb.drop_table("tests_cache")
+    log("Cache des entités", {k: stats[k] for k in ("hits", "misses", "invalidations")})
+
+
+    # --- BulkWriter: un résultat par opération (pid, matched, erreur)
+    db.drop_table("tests_bulk")
+    with db.bulk(max_interval=None) as bw:
+        created = bw.create_item("tests_bulk", {"name": "A", "tags": []}, created_by="tester")
+        dup_ok = bw.create_item("tests_bulk", {"_id": 1, "name": "B"}, created_by="tester")
+        dup_ko = bw.create_item("tests_bulk", {"_id": 1, "name": "C"}, created_by="tester")
+        updated = bw.update_item_by_pid("tests_bulk", bw.pid(created), {"name": "A2"}, updated_by="tester")
+        missing = bw.update_item_by_pid("tests_bulk", "0" * 32, {"name": "X"}, updated_by="tester")
+        pushed = bw.array_push_item_by_pid("tests_bulk", bw.pid(created), "tags", "t", updated_by="tester")
+    res = bw.results
+    assert res[created]["ok"] and res[created]["pid"] == bw.pid(created) and res[dup_ok]["ok"]
+    assert not res[dup_ko]["ok"] and res[dup_ko]["error"]["code"] == 11000, res[dup_ko]
+    assert res[updated]["ok"] and res[updated]["matched"] and res[pushed]["matched"]
+    assert not res[missing]["ok"] and res[missing]["matched"] is False, res[missing]
+    doc = db.get_item_by_pid("tests_bulk", bw.pid(created), fields=["name", "tags"])
+    assert doc["name"] == "A2" and doc["tags"] == ["t"], doc
+    assert sorted(d["name"] for d in db.get_items("tests_bulk", {}, fields=["name"])) == ["A2", "B"]
+    db.drop_table("tests_bulk")
+    log("BulkWriter", {i: (r["op"], r["ok"]) for i, r in res.items()})
+
+
+    # --- Générateur synthétique (seeder.py --users/--teams/--projects), dans une base à part
+    gen_db = f"{db._db_name}_generator"
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seeder.py")
+    out = subprocess.run(
+        [sys.executable, script, "--users", "200", "--teams", "20", "--projects", "100", "--seed", "7", "--chunk-size", "50"],
+        env={**os.environ, "MONGODB_DB_NAME": gen_db}, capture_output=True, text=True, timeout=300,
+    )
+    assert out.returncode == 0, out.stderr
+    assert all(f"{t} " in out.stdout for t in ("users", "teams", "projects")) and "docs/s" in out.stdout, out.stdout
+    if not os.getenv("MONGODB_URI", "").startswith("memory://"):
+        # Moteur en mémoire: les données du sous-processus ne sont pas visibles d'ici
+        gdb = Database(db_name=gen_db)
+        counts = {t: len(gdb.get_items(t, {}, fields=["pid"])) for t in ("users", "teams", "projects")}
+        assert counts == {"users": 200, "teams": 20, "projects": 100}, counts
+        for t in ("users", "teams", "projects"):
+            gdb.drop_table(t)
+    rng_a, rng_b = random.Random(7), random.Random(7)
+    generated = [seeder.gen_user(rng_a, i) for i in range(1000)]
+    assert generated == [seeder.gen_user(rng_b, i) for i in range(1000)]
+    roles = Counter(u["role"] for u in generated)
+    assert set(roles) <= set(seeder.ROLES) and roles.most_common(1)[0][0] == "dev", roles
+    try:
+        seeder.run_generator(users=0, teams=10, projects=0)
+        raise AssertionError("teams sans users accepté")
+    except ValueError:
+        pass
+    log("Générateur synthétique", {"rôles": dict(sorted(roles.items()))})
+
+
+    # --- Benchmark: percentiles, JSON par méthode, détection des régressions
+    assert bench.percentile([1.0, 2.0, 3.0, 4.0, 5.0], 0.5) == 3.0 and bench.percentile([], 0.99) == 0.0
+    timing = bench.measure(lambda i: None, iterations=20, warmup=2)
+    assert timing["n"] == 20 and timing["p50_ms"] <= timing["p95_ms"] <= timing["p99_ms"], timing
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "bench.json")
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench.py")
+        out = subprocess.run(
+            [sys.executable, script, "--scales", "200", "--iterations", "5", "--warmup", "1", "--output", output],
+            env={**os.environ, "MONGODB_DB_NAME": f"{db._db_name}_bench"}, capture_output=True, text=True, timeout=600,
+        )
+        assert out.returncode == 0, out.stderr
+        with open(output, encoding="utf-8") as f:
+            run = json.load(f)
+    methods = run["results"]["200"]["methods"]
+    assert set(methods) == {name for name, _ in bench.CASES}, sorted(methods)
+    slower = json.loads(json.dumps(run))
+    slower["results"]["200"]["methods"]["get_item_by_pid"]["p50_ms"] *= 2
+    assert bench.compare(run, run, 0.2) == []
+    assert [r["method"] for r in bench.compare(slower, run, 0.2)] == ["get_item_by_pid"]
+    log("Benchmark", {"méthodes": len(methods)})
+
+
+    # --- Observabilité: latences par méthode, export Prometheus, journal des appels lents
+    odb = Database(metrics=True, slow_query_ms=0)
+    odb.get_items("users", {"role": "qa"}, fields=["name"], sort={"name": 1})
+    odb.get_item_by_attr("users", {"role": "qa"}, fields=["name"])
+    metrics = odb.metrics()
+    assert {"get_items", "get_item_by_attr"} <= set(metrics["methods"]), metrics["methods"]
+    assert metrics["methods"]["get_items"]["count"] == 1 and metrics["slowQueries"] == 2, metrics
+    # Commandes étiquetées (méthode, table) par le listener pymongo (pas de commandes avec le moteur mémoire)
+    assert all(c["table"] == "users" for c in metrics["commands"] if c["method"] == "get_items"), metrics["commands"]
+    assert 'db_method_duration_seconds_count{method="get_items"} 1' in odb.metrics_prometheus()
+    slow = odb.slow_queries()[0]
+    assert slow["method"] == "get_items" and slow["table"] == "users" and slow["plan"]["filter"] == {"role": "qa"}, slow
+    assert db.metrics() is None and db.slow_queries() == []
+    log("Observabilité", {"méthodes": sorted(metrics["methods"]), "lents": len(odb.slow_queries())})
+
+
+    # --- Client partagé, connexion différée, import sans effet de bord
+    assert Database()._client is db._client
+    assert Database(max_pool_size=7)._client is not db._client
+    lazy = Database()
+    assert not lazy._started  # rien n'est vérifié ni ouvert avant la première opération
+    lazy.get_item_by_attr("users", {}, fields=["pid"])
+    assert lazy._started
+    assert Database(warm=2)._started
+    env = {k: v for k, v in os.environ.items() if not k.startswith("MONGODB_")}
+    out = subprocess.run(
+        [sys.executable, "-c", "import db"], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert out.returncode == 0 and out.stdout == "", (out.stdout, out.stderr)
+    log("Client partagé et connexion différée", {"clients": len({id(d._client) for d in (db, lazy, Database(max_pool_size=7))})})
+
+
+    # --- expand=: références résolues niveau par niveau, comme une lecture pid par pid
+    expanded = db.get_items(
+        "projects", {}, fields=["name", "teams"], sort={"name": 1}, expand=["teams", "teams.members"], expand_fields={"teams.members": ["name"]},
+    )
+    for p in expanded:
+        raw_teams = db.get_item_by_pid("projects", p["pid"], fields=["teams"]).get("teams", [])
+        assert [t["pid"] for t in p["teams"]] == raw_teams, (p, raw_teams)
+        for t in p["teams"]:
+            members = db.get_item_by_pid("teams", t["pid"], fields=["members"]).get("members", [])
+            expected = [db.get_item_by_pid("users", m, fields=["name"]) for m in members]
+            assert t["members"] == [m for m in expected if m is not None], (t, expected)
+    one = db.get_item_by_pid("projects", expanded[0]["pid"], fields=["name"], expand=["teams"])
+    assert [t["pid"] for t in one["teams"]] == [t["pid"] for t in expanded[0]["teams"]]
+    try:
+        db.get_items("projects", {}, expand=["teams"], raw=True)
+        raise AssertionError("expand avec raw=True accepté")
+    except ValueError:
+        pass
+    log("Expansion des références", {p["name"]: [t["name"] for t in p["teams"]] for p in expanded})
+
+
+    # --- Résultats bruts (RawBSONDocument) et sérialiseur JSON: même JSON que les dicts
+    fields = ["name", "deadline", "teams", "budget"]
+    decoded = db.get_items("projects", {}, fields=fields, sort={"name": 1})
+    raw_items = db.get_items("projects", {}, fields=fields, sort={"name": 1}, raw=True)
+    assert all(isinstance(r, RawBSONDocument) for r in raw_items)
+    assert [r["name"] for r in raw_items] == [d["name"] for d in decoded]
+    assert [serializer.dumps(r) for r in raw_items] == [serializer.dumps(d) for d in decoded]
+    buf = io.StringIO()
+    assert serializer.write_ndjson(db.iter_items("projects", {}, fields=fields, sort={"name": 1}, raw=True), buf) == len(decoded)
+    lines = [json.loads(line) for line in buf.getvalue().splitlines()]
+    assert [p["pid"] for p in lines] == [d["pid"] for d in decoded]
+    assert all(isinstance(p["deadline"], str) and p["deadline"].endswith("+00:00") for p in lines if "deadline" in p), lines
+    buf = io.StringIO()
+    serializer.write_json(raw_items, buf)
+    assert json.loads(buf.getvalue()) == lines
+    log("Résultats bruts et JSON", {"documents": len(lines)})
+
+
+    # --- Export / import: aller-retour NDJSON et BSON, avec buckets et archive
+    xdb = Database()
+    xtables = ("tests_export", "tests_export_archive", "tests_export_members_buckets", "tests_export_clone")
+    for name in xtables:
+        xdb.drop_table(name)
+    xdb.declare_bucketed_array("tests_export", "members", bucket_size=2)
+    xdb.declare_tiering("tests_export", "deadline", timedelta(days=365))
+    users = [u["pid"] for u in xdb.get_items("users", {}, sort={"name": 1})]
+    now = datetime.now(timezone.utc)
+    xdb.create_items("tests_export", [
+        {"name": f"x{i}", "budget": i * 100, "members": users[: i + 1], "deadline": now - timedelta(days=400 * (i % 2))} for i in range(5)
+    ], created_by="tester")
+    assert xdb.archive_stale("tests_export") == {"tests_export": 2}
+
+    def snapshot():
+        docs = xdb.get_items("tests_export", {}, fields=[], sort={"name": 1}, include_archived=True)
+        return [{**d, "members": xdb.get_item_by_pid("tests_export", d["pid"], fields=["members"], include_archived=True)["members"]} for d in docs]
+
+    before = snapshot()
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("tests_export.ndjson.gz", "tests_export.bson"):
+            path = os.path.join(tmp, name)
+            exported = xdb.export("tests_export", path, partitions=2)
+            assert exported["documents"] == 3 and set(exported["related"]) == {"tests_export_archive", "tests_export_members_buckets"}, exported
+            for table in xtables[:3]:
+                xdb.drop_table(table)
+            try:
+                xdb.import_("tests_export", path, keep_pids=False)
+                raise AssertionError("keep_pids=False accepté malgré les collections rattachées")
+            except ValueError:
+                pass
+            imported = xdb.import_("tests_export", path, chunk_size=2)
+            assert imported["inserted"] == 3 and imported["errors"] == 0, imported
+            assert {k: r["inserted"] for k, r in imported["related"].items()} == {k: r["documents"] for k, r in exported["related"].items()}
+            assert snapshot() == before
+        # Clone sous de nouveaux pids dans une table sans collections rattachées
+        clone = xdb.import_("tests_export_clone", os.path.join(tmp, "tests_export.bson"), keep_pids=False, keep_audit=False, created_by="clone")
+        cloned = xdb.get_items("tests_export_clone", {}, fields=["name", "created_by"], sort={"name": 1})
+    assert clone["inserted"] == 3 and [c["name"] for c in cloned] == ["x0", "x2", "x4"]
+    assert all(c["created_by"] == "clone" for c in cloned) and not {c["pid"] for c in cloned} & {d["pid"] for d in before}
+    for name in xtables:
+        xdb.drop_table(name)
+    log("Export / import", {"documents": len(before), "related": sorted(exported["related"])})
+
+
+    # --- Agrégation parallèle: même résultat qu'une agrégation classique
+    db.drop_table("tests_agg")
+    rng = random.Random(17)
+    db.create_items("tests_agg", [
+        {"name": f"a{i}", "tags": rng.sample(["ui", "api", "data", "ml"], rng.randint(0, 3)), "budget": rng.choice([None, rng.randint(1, 9) * 1000])}
+        for i in range(200)
+    ], created_by="tester")
+    by_tag = [
+        {"$unwind": "$tags"},
+        {"$group": {"_id": "$tags", "n": {"$sum": 1}, "avg": {"$avg": "$budget"}, "min": {"$min": "$budget"},
+                    "max": {"$max": "$budget"}, "names": {"$push": "$name"}}},
+        {"$sort": {"n": -1, "_id": 1}},
+        {"$limit": 3},
+    ]
+    not_mergeable = [{"$group": {"_id": None, "budgets": {"$sum": "$budget"}}}, {"$match": {"budgets": {"$gt": 0}}}]
+
+    def normalized(rows):
+        # $push: ordre des éléments propre à chaque partition; $avg: arrondi des sommes partielles
+        return [{**r, **({"names": sorted(r["names"]), "avg": round(r["avg"], 6)} if "names" in r else {})} for r in rows]
+
+    results = {}
+    for name, pipeline in (("by_tag", by_tag), ("not_mergeable", not_mergeable)):
+        single = db.parallel_aggregate("tests_agg", pipeline, partitions=1)
+        parallel = db.parallel_aggregate("tests_agg", pipeline, partitions=4)
+        assert normalized(parallel) == normalized(single), (name, parallel, single)
+        results[name] = single
+    db.drop_table("tests_agg")
+    log("Agrégation parallèle", {row["_id"]: row["n"] for row in results["by_tag"]})
+
+
+    # --- pid uuid7: binaire en base, hexadécimal dans l'API, horodatage en tête
+    vdb = Database(pid_strategy="uuid7")
+    vdb.drop_table("tests_pids")
+    t0 = datetime.now(timezone.utc)
+    vpids = []
+    for i in range(3):
+        vpids.append(vdb.create_item("tests_pids", {"name": f"v{i}"}, created_by="tester")["pid"])
+        time.sleep(0.002)
+    decoded_pids = [uuid.UUID(hex=p) for p in vpids]
+    assert all(len(p) == 32 and u.version == 7 for p, u in zip(vpids, decoded_pids)), vpids
+    stamps = [datetime.fromtimestamp((u.int >> 80) / 1000, timezone.utc) for u in decoded_pids]
+    assert stamps == sorted(stamps) and abs((stamps[0] - t0).total_seconds()) < 5, (stamps, t0)
+    stored = vdb._store_db["tests_pids"].find_one({"name": "v0"})["pid"]
+    assert isinstance(stored, Binary) and stored.subtype == 4 and stored.as_uuid() == decoded_pids[0], stored
+    assert vdb.get_item_by_pid("tests_pids", vpids[1], fields=["name"])["name"] == "v1"
+    assert vdb.update_items_by_pids("tests_pids", vpids[:2], {"seen": True}, updated_by="tester") == 2
+    seen = vdb.get_items("tests_pids", {"pid": {"$in": vpids}, "seen": True}, fields=["name"], sort={"pid": 1})
+    assert [d["pid"] for d in seen] == vpids[:2], seen
+    vdb.drop_table("tests_pids")
+    log("Pids uuid7", {"horodatages croissants": stamps == sorted(stamps), "stockage": "binaire (sous-type 4)"})
+
+
+    # --- Moteur en mémoire (memory://): mêmes résultats que le moteur courant
+    mem = Database(uri="memory://tests_engine", db_name="tests")
+    rng = random.Random(21)
+    docs = [
+        {"name": f"m{i:03d}", "email": f"m{i}@example.com", "rank": rng.choice([None, *range(5)]), "tags": rng.sample(["a", "b", "c"], rng.randint(0, 2))}
+        for i in range(120)
+    ]
+    for engine in (db, mem):
+        engine.drop_table("tests_engine")
+        engine.declare_index("tests_engine", "email", unique=True)
+        engine.declare_index("tests_engine", [("rank", 1), ("name", 1)])
+        engine.ensure_indexes(["tests_engine"])
+        engine.create_items("tests_engine", [dict(d) for d in docs], created_by="tester")
+    queries = [
+        ({"rank": {"$gte": 2}}, {"rank": -1, "name": 1}, 0, 10),
+        ({"tags": {"$in": ["a", "c"]}, "rank": None}, {"name": 1}, 5, None),
+        ({"$or": [{"tags": {"$size": 0}}, {"email": "m7@example.com"}]}, {"name": -1}, 0, 3),
+        ({"name": {"$regex": "^m0[0-4]"}}, {"rank": 1, "name": 1}, 0, None),
+    ]
+
+    def page(engine, flt, sort, skip, limit):
+        items, stats = engine.get_items("tests_engine", flt, fields=["name", "rank"], sort=sort, skip=skip, limit=limit, return_stats=True)
+        return [{k: v for k, v in d.items() if k not in ("_id", "pid")} for d in items], stats["itemsCount"]
+
+    for flt, sort, skip, limit in queries:
+        assert page(mem, flt, sort, skip, limit) == page(db, flt, sort, skip, limit), flt
+    top = sorted((d for d in docs if d["rank"] is not None and d["rank"] >= 2), key=lambda d: (-d["rank"], d["name"]))
+    assert page(mem, *queries[0]) == ([{"name": d["name"], "rank": d["rank"]} for d in top[:10]], len(top))
+    try:
+        mem.create_item("tests_engine", {"name": "dup", "email": "m0@example.com"})
+        raise AssertionError("doublon accepté par l'index unique")
+    except DuplicateKeyError:
+        pass
+    with tempfile.TemporaryDirectory() as tmp:
+        assert os.path.getsize(mem.snapshot(os.path.join(tmp, "tests.memdb"))) > 0
+    for engine in (db, mem):
+        engine.drop_table("tests_engine")
+    log("Moteur en mémoire", {"requêtes comparées": len(queries)})
+
 
 if __name__ == "__main__":
     main()
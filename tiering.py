@@ -0,0 +1,150 @@
+import dataclasses
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from pymongo import ASCENDING, DeleteOne, ReplaceOne
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+if TYPE_CHECKING:
+    from db import Database
+
+ARCHIVE_SUFFIX = "_archive"
+ARCHIVED_AT = "archived_at"
+
+
+def archive_name(table: str) -> str:
+    return f"{table}{ARCHIVE_SUFFIX}"
+
+
+@dataclass
+class TieringPolicy:
+    """
+    Archivage d'une table: les documents dont `field` (created_at, updated_at,
+    deadline...) est plus ancien que older_than, et qui vérifient `filter`, passent
+    dans <table>_archive. expire_after: suppression des archives (index TTL sur archived_at).
+    """
+
+    table: str
+    field: str = "updated_at"
+    older_than: timedelta = timedelta(days=365)
+    filter: Dict[str, Any] = dataclasses.field(default_factory=dict)
+    expire_after: Optional[timedelta] = None
+    batch_size: int = 1000
+
+    def query(self, now: datetime) -> Dict[str, Any]:
+        # Dates stockées sans fuseau (UTC), comme celles de _with_audit_on_create
+        cutoff = (now - self.older_than).replace(tzinfo=None)
+        return {**self.filter, self.field: {"$lt": cutoff}}
+
+
+class TierStore:
+    """
+    Politiques d'archivage et déplacement par lots vers <table>_archive:
+    copie (upsert par _id, rejouable) puis suppression dans la table chaude de la
+    version copiée (même updated_at, toujours éligible). Un document modifié entre les
+    deux reste chaud et sa copie est retirée.
+    Pour les index dérivés (appartenance, rollups), un document archivé est supprimé;
+    ses tableaux en buckets restent lisibles par get_item_by_pid(include_archived=True).
+    """
+
+    def __init__(self, db: "Database"):
+        self._db = db
+        self.policies: Dict[str, TieringPolicy] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def declare(self, policy: TieringPolicy) -> None:
+        if policy.older_than <= timedelta(0):
+            raise ValueError("older_than doit être positif.")
+        if policy.batch_size < 1:
+            raise ValueError("batch_size doit être >= 1")
+        name = archive_name(policy.table)
+        # Mêmes index que la table chaude (lectures include_archived), plus le TTL éventuel
+        for spec in self._db.declared_indexes(policy.table):
+            self._db.declare_index(name, spec["key"], **{k: v for k, v in spec.items() if k not in ("key", "name")})
+        if policy.expire_after is not None:
+            self._db.declare_index(name, ARCHIVED_AT, expireAfterSeconds=int(policy.expire_after.total_seconds()))
+        self.policies[policy.table] = policy
+        self.stats.setdefault(policy.table, {"runs": 0, "batches": 0, "moved": 0, "seconds": 0.0, "lastRun": None, "lastMoved": 0, "lastError": None})
+
+    def col(self, table: str) -> Collection:
+        """Collection d'archive (valeurs telles que stockées)."""
+        self._db.col(archive_name(table))
+        return self._db._store_db[archive_name(table)]
+
+    # -------- Déplacement
+    def run(self, table: str, max_batches: Optional[int] = None, stop: Optional[threading.Event] = None) -> int:
+        """Archive les documents éligibles de table, lot par lot. Retourne le nombre déplacé."""
+        policy = self.policies[table]
+        query = policy.query(datetime.now(timezone.utc))
+        moved = batches = 0
+        t0 = time.perf_counter()
+        # Un seul déplacement à la fois (thread de fond et appels directs)
+        with self._lock:
+            while max_batches is None or batches < max_batches:
+                if stop is not None and stop.is_set():
+                    break
+                n = self._move_batch(policy, query)
+                if not n:
+                    break
+                moved += n
+                batches += 1
+            stats = self.stats[table]
+            stats["runs"] += 1
+            stats["batches"] += batches
+            stats["moved"] += moved
+            stats["seconds"] += time.perf_counter() - t0
+            stats["lastRun"] = datetime.now(timezone.utc)
+            stats["lastMoved"] = moved
+        return moved
+
+    def _move_batch(self, policy: TieringPolicy, query: Dict[str, Any]) -> int:
+        db, table = self._db, policy.table
+        source = db._store_db[table]
+        docs = list(source.find(query, sort=[("_id", ASCENDING)], limit=policy.batch_size))
+        if not docs:
+            return 0
+        ids = [d["_id"] for d in docs]
+        now = datetime.now(timezone.utc)
+        archive = self.col(table)
+        archive.bulk_write([ReplaceOne({"_id": d["_id"]}, {**d, ARCHIVED_AT: now}, upsert=True) for d in docs], ordered=False)
+
+        synced = db._membership is not None and db._membership.tracks(table)
+        before = db._rollup_before(table, {"_id": {"$in": ids}})
+        # Chaque suppression porte sur la version lue (updated_at): un document modifié
+        # depuis, même hors du critère d'archivage, reste chaud
+        deletes = [DeleteOne({"$and": [{"_id": d["_id"], "updated_at": d.get("updated_at")}, query]}) for d in docs]
+        deleted = source.bulk_write(deletes, ordered=False).deleted_count
+        kept = set()
+        if deleted < len(ids):
+            # Modifiés depuis la lecture: restent chauds, leur copie est retirée
+            kept = {d["_id"] for d in source.find({"_id": {"$in": ids}}, {"_id": 1})}
+            archive.delete_many({"_id": {"$in": list(kept)}})
+        pids = [db._pids.to_api(d["pid"]) for d in docs if d["_id"] not in kept and "pid" in d]
+
+        db._on_write(table, pids)
+        db._bump(archive_name(table))
+        db._rollup_after(table, before)
+        if synced and pids:
+            db._membership.deleted(table, pids)
+        return deleted
+
+    # -------- Rapport
+    def report(self, table: str) -> Dict[str, Any]:
+        """Compteurs du déplacement et taille des deux tiers (documents, données, index)."""
+        stats = dict(self.stats.get(table, {}))
+        if stats.get("seconds"):
+            stats["docsPerSecond"] = stats["moved"] / stats["seconds"]
+        stats["tiers"] = {"hot": self._tier_size(table), "archive": self._tier_size(archive_name(table))}
+        return stats
+
+    def _tier_size(self, name: str) -> Dict[str, Any]:
+        try:
+            s = self._db._db.command("collStats", name)
+        except PyMongoError:
+            return {"count": self._db._db[name].estimated_document_count()}
+        return {"count": s.get("count", 0), "bytes": s.get("size", 0), "indexBytes": s.get("totalIndexSize", 0)}
@@ -0,0 +1,114 @@
+import bz2
+import gzip
+import lzma
+import os
+import struct
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import bson
+from bson import json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from bson.raw_bson import RawBSONDocument
+
+FORMATS = ("ndjson", "bson")
+
+# Compression par suffixe. Les flux compressés concaténés restent lisibles:
+# chaque partition est compressée séparément puis les fichiers sont mis bout à bout.
+COMPRESSIONS: Dict[str, Callable[..., IO[bytes]]] = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+
+_LENGTH = struct.Struct("<i")
+
+Bound = Any
+IdRange = Tuple[Optional[Bound], Optional[Bound]]
+
+
+def infer_format(path: str, format: Optional[str] = None, compression: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """(format, compression) explicites ou déduits du nom: data.ndjson.gz, data.bson..."""
+    name = path
+    for suffix, comp in _SUFFIXES.items():
+        if name.endswith(suffix):
+            compression = compression or comp
+            name = name[: -len(suffix)]
+    format = format or ("bson" if name.endswith(".bson") else "ndjson")
+    if format not in FORMATS:
+        raise ValueError(f"format doit être l'un de {FORMATS}")
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"compression doit être l'une de {tuple(COMPRESSIONS)}")
+    return format, compression
+
+
+def related_path(path: str, name: str) -> str:
+    """Fichier d'une collection rattachée, à côté de path et avec ses suffixes: projects.ndjson.gz -> projects_archive.ndjson.gz."""
+    head, base = os.path.split(path)
+    dot = base.find(".")
+    return os.path.join(head, name + (base[dot:] if dot > 0 else ""))
+
+
+def open_file(path: str, mode: str, compression: Optional[str]) -> IO[bytes]:
+    """Fichier binaire, compressé ou non (mode "rb" / "wb")."""
+    return COMPRESSIONS[compression](path, mode) if compression else open(path, mode)
+
+
+def id_ranges(sample_ids: List[Bound], partitions: int) -> List[IdRange]:
+    """
+    Découpe l'espace des _id en `partitions` intervalles [lo, hi) à partir
+    d'un échantillon trié (quantiles). None = borne ouverte.
+    """
+    ids = sorted(sample_ids)
+    if partitions <= 1 or len(ids) < partitions:
+        return [(None, None)]
+    bounds: List[Bound] = []
+    for i in range(1, partitions):
+        b = ids[i * len(ids) // partitions]
+        if not bounds or b != bounds[-1]:
+            bounds.append(b)
+    edges: List[Optional[Bound]] = [None, *bounds, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def range_filter(lo: Optional[Bound], hi: Optional[Bound]) -> Dict[str, Any]:
+    cond: Dict[str, Any] = {}
+    if lo is not None:
+        cond["$gte"] = lo
+    if hi is not None:
+        cond["$lt"] = hi
+    return {"_id": cond} if cond else {}
+
+
+def encode_doc(doc: RawBSONDocument, format: str) -> bytes:
+    """BSON: octets tels que reçus (aucun décodage). NDJSON: Extended JSON relaxed (types conservés)."""
+    if format == "bson":
+        return doc.raw
+    return (json_util.dumps(bson.decode(doc.raw), json_options=RELAXED_JSON_OPTIONS) + "\n").encode("utf-8")
+
+
+def iter_file(fp: IO[bytes], format: str) -> Iterator[Union[RawBSONDocument, Dict[str, Any]]]:
+    """Documents d'un export, en flux: RawBSONDocument (bson) ou dict (ndjson)."""
+    if format == "ndjson":
+        for line in fp:
+            if line.strip():
+                yield json_util.loads(line)
+        return
+    while True:
+        head = fp.read(4)
+        if not head:
+            return
+        if len(head) < 4:
+            raise ValueError("Fichier BSON tronqué.")
+        (size,) = _LENGTH.unpack(head)
+        body = fp.read(size - 4)
+        if len(body) < size - 4:
+            raise ValueError("Fichier BSON tronqué.")
+        yield RawBSONDocument(head + body)
+
+
+def chunks(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk